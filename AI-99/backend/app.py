@@ -1,4 +1,7 @@
+import os
+import logging
 from flask import Flask, jsonify
+from sqlalchemy import text
 from flask_cors import CORS
 from config import Config
 from models import db
@@ -9,9 +12,15 @@ from routes.counseling import counseling_bp
 from routes.admin import admin_bp
 from routes.predict import predict_bp
 from routes.upload_csv import upload_bp
+from routes.ml_routes import ml_bp
+from routes.jobs import jobs_bp
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_migrate import Migrate 
+from ml.registry import registry
+from audit import audit_writer
+from followups import reminder_scheduler
+import jobs
 
 mail = Mail()
 jwt = JWTManager()
@@ -28,6 +37,9 @@ def create_app():
     jwt.init_app(app)
     mail.init_app(app)
     migrate.init_app(app, db)  #
+    audit_writer.init_app(app)
+    reminder_scheduler.init_app(app)
+    jobs.init_app(app)
 
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(students_bp, url_prefix="/api/students")
@@ -36,11 +48,35 @@ def create_app():
     app.register_blueprint(predict_bp, url_prefix="/api")
     app.register_blueprint(counseling_bp, url_prefix="/api/counseling")
     app.register_blueprint(upload_bp, url_prefix="/api")
+    app.register_blueprint(ml_bp, url_prefix="/api/ml")
+    app.register_blueprint(jobs_bp, url_prefix="/api/jobs")
+
+    if app.config["PRELOAD_MODEL"]:
+        registry.preload()
 
     @app.route("/api/health", methods=["GET"])
     def health():
         return jsonify({"status": "ok"}), 200
 
+    @app.route("/api/ready", methods=["GET"])
+    def ready():
+        """Readiness probe: 503 until the database answers and a model is loaded."""
+        checks = {}
+        try:
+            db.session.execute(text("SELECT 1"))
+            checks["database"] = "ok"
+        except Exception as e:
+            logging.error(f"Readiness check: database unavailable: {str(e)}")
+            db.session.rollback()
+            checks["database"] = "unavailable"
+
+        # Loads the model on first call in a worker that was not preloaded
+        loaded = registry.get()
+        checks["model"] = loaded.version if loaded is not None else "unavailable"
+
+        ok = checks["database"] == "ok" and loaded is not None
+        return jsonify({"status": "ready" if ok else "starting", "checks": checks}), 200 if ok else 503
+
     @app.route("/", methods=["GET"])
     def home():
         return jsonify({"message": "Welcome to the AI Backend API!"}), 200
@@ -51,4 +87,5 @@ def create_app():
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
+    # Development server only; production runs gunicorn (gunicorn.conf.py)
+    app.run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG", "0") == "1", threaded=True)
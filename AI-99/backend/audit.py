@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import atexit
+import base64
+import binascii
+import logging
+import weakref
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, and_, or_
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session
+from models import db, AuditLog, AUDIT_EVENTS_KEY
+from student_queries import ListingError
+
+# "0" writes audit rows inside the caller's transaction, as before
+AUDIT_BUFFERED = os.getenv("AUDIT_BUFFERED", "1").lower() in ("true", "1", "t")
+
+# Buffered events that trigger a flush before the interval is up
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+
+# Seconds between flushes of whatever is buffered
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 2.0))
+
+# Events kept while the database is unreachable; the oldest are dropped beyond this
+AUDIT_MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", 50000))
+
+# Rows older than this many days are purged (0 keeps everything)
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", 365))
+
+# Rows deleted per purge transaction, and seconds between purges
+AUDIT_PURGE_BATCH = int(os.getenv("AUDIT_PURGE_BATCH", 5000))
+AUDIT_PURGE_INTERVAL = float(os.getenv("AUDIT_PURGE_INTERVAL", 3600))
+
+# Session.info key mapping open savepoints to the number of events staged before them
+_SAVEPOINT_MARKS_KEY = "audit_savepoint_marks"
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class AuditWriter:
+    """Buffers committed audit events and inserts them in batches.
+
+    Events staged with models.record_audit reach submit() once their
+    transaction commits. A background thread writes the buffer as one
+    executemany INSERT every `flush_interval` seconds, or sooner once
+    `batch_size` events are waiting, so auth requests never wait on
+    audit_logs. A flush that cannot reach the database keeps the events
+    for the next attempt. A batch the database rejects is split until the
+    offending events are alone, and those are logged and dropped. The same
+    thread purges rows past the retention period.
+
+    Events still buffered when a process is killed are lost; set
+    AUDIT_BUFFERED=0 to write them in the caller's transaction instead.
+    """
+
+    def __init__(self, buffered=AUDIT_BUFFERED, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, max_buffer=AUDIT_MAX_BUFFER,
+                 retention_days=AUDIT_RETENTION_DAYS, purge_batch=AUDIT_PURGE_BATCH,
+                 purge_interval=AUDIT_PURGE_INTERVAL):
+        self.buffered = buffered
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retention_days = retention_days
+        self.purge_batch = purge_batch
+        self.purge_interval = purge_interval
+
+        self.app = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._last_purge = time.monotonic()
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    @property
+    def active(self):
+        """Whether committed events go through the buffer (needs init_app)."""
+        return self.buffered and self.app is not None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker inherits the buffer but not the thread
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="audit-writer", daemon=True).start()
+
+    def submit(self, events):
+        self._ensure_started()
+        with self._lock:
+            self._buffer.extend(events)
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                logging.error(f"Audit buffer full; dropped {overflow} oldest events")
+            pending = len(self._buffer)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """Insert everything buffered; returns the number of rows written."""
+        if self.app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if not events:
+                return 0
+            written, unwritten = self._insert(events)
+            if unwritten:
+                with self._lock:
+                    # Back in front of anything submitted meanwhile, oldest first
+                    self._buffer[:0] = unwritten[-self.max_buffer:]
+            return written
+
+    def _insert(self, events):
+        """Insert events in order; returns (rows written, events to retry).
+
+        A batch the database rejects is halved until each offending event
+        is alone, then that event is dropped, so one bad row cannot block
+        every later flush. Connection errors stop the flush and return
+        the events not yet written.
+        """
+        written = 0
+        # Stack of batches still to insert; the next one is on top
+        pending = [events]
+        while pending:
+            batch = pending.pop()
+            try:
+                with self.app.app_context(), db.engine.begin() as conn:
+                    conn.execute(AuditLog.__table__.insert(), batch)
+                written += len(batch)
+            except Exception as e:
+                if isinstance(e, OperationalError) or (isinstance(e, DBAPIError) and e.connection_invalidated):
+                    logging.error(f"Audit flush of {len(events)} events failed: {str(e)}")
+                    return written, batch + [event for rest in reversed(pending) for event in rest]
+                if len(batch) == 1:
+                    logging.error(f"Dropped audit event rejected by the database: {batch[0]!r}: {getattr(e, 'orig', e)}")
+                    continue
+                mid = len(batch) // 2
+                pending += [batch[mid:], batch[:mid]]
+        return written, []
+
+    def purge(self, now=None):
+        """Delete rows older than the retention period; returns the number deleted."""
+        if self.app is None or not self.retention_days:
+            return 0
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        table = AuditLog.__table__
+        deleted = 0
+        with self.app.app_context():
+            while True:
+                # Short transactions walking the timestamp index, so inserts
+                # are never blocked behind one large DELETE
+                with db.engine.begin() as conn:
+                    ids = conn.execute(
+                        select(table.c.id)
+                        .where(table.c.timestamp < cutoff)
+                        .order_by(table.c.timestamp)
+                        .limit(self.purge_batch)
+                    ).scalars().all()
+                    if ids:
+                        conn.execute(table.delete().where(table.c.id.in_(ids)))
+                deleted += len(ids)
+                if len(ids) < self.purge_batch:
+                    break
+        if deleted:
+            logging.info(f"Purged {deleted} audit rows older than {cutoff:%Y-%m-%d}")
+        return deleted
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - self._last_purge >= self.purge_interval:
+                self._last_purge = time.monotonic()
+                try:
+                    self.purge()
+                except Exception as e:
+                    logging.error(f"Audit purge failed: {str(e)}")
+
+
+audit_writer = AuditWriter()
+
+
+@event.listens_for(Session, "before_commit")
+def _write_audit_inline(session):
+    if audit_writer.active:
+        return
+    events = session.info.pop(AUDIT_EVENTS_KEY, None)
+    if events:
+        session.execute(AuditLog.__table__.insert(), events)
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_audit(session):
+    events = session.info.pop(AUDIT_EVENTS_KEY, None)
+    if events:
+        audit_writer.submit(events)
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _mark_savepoint(session, transaction):
+    if transaction.nested:
+        # Weak keys: a mark goes away with its savepoint
+        marks = session.info.setdefault(_SAVEPOINT_MARKS_KEY, weakref.WeakKeyDictionary())
+        marks[transaction] = len(session.info.get(AUDIT_EVENTS_KEY, ()))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_audit(session, previous_transaction):
+    if previous_transaction.nested:
+        # Drop only what was staged since the savepoint
+        mark = session.info.get(_SAVEPOINT_MARKS_KEY, {}).get(previous_transaction)
+        if mark is not None and AUDIT_EVENTS_KEY in session.info:
+            del session.info[AUDIT_EVENTS_KEY][mark:]
+    elif previous_transaction.parent is None:
+        session.info.pop(AUDIT_EVENTS_KEY, None)
+
+
+def _parse_time(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ListingError(f"{name} must be an ISO 8601 datetime")
+
+
+def _encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise ListingError("Invalid cursor")
+
+
+def query_audit_log(args):
+    """One page of audit rows, newest first.
+
+    Supported arguments: user_id, action (comma-separated), since and until
+    (ISO 8601, UTC; since inclusive, until exclusive), limit and cursor.
+    Pages are keyed on (timestamp, id), so each one is a range scan of
+    ix_audit_logs_user_id_timestamp or ix_audit_logs_timestamp however deep
+    it is.
+
+    Returns (rows, next_cursor). Raises ListingError on bad arguments.
+    """
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ListingError("limit must be a positive integer")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    stmt = select(AuditLog.id, AuditLog.user_id, AuditLog.action, AuditLog.target_id, AuditLog.timestamp)
+    stmt = stmt.where(AuditLog.timestamp.isnot(None))
+
+    if args.get("user_id") not in (None, ""):
+        user_id = args.get("user_id", type=int)
+        if user_id is None:
+            raise ListingError("user_id must be an integer")
+        stmt = stmt.where(AuditLog.user_id == user_id)
+
+    actions = [a.strip() for a in (args.get("action") or "").split(",") if a.strip()]
+    if actions:
+        stmt = stmt.where(AuditLog.action.in_(actions))
+
+    since = _parse_time(args, "since")
+    until = _parse_time(args, "until")
+    if since is not None:
+        stmt = stmt.where(AuditLog.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(AuditLog.timestamp < until)
+
+    cursor = args.get("cursor")
+    if cursor:
+        timestamp, row_id = _decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            AuditLog.timestamp < timestamp,
+            and_(AuditLog.timestamp == timestamp, AuditLog.id < row_id),
+        ))
+
+    # One extra row tells us whether another page exists
+    result = db.session.execute(
+        stmt.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1)
+    ).all()
+    has_more = len(result) > limit
+    result = result[:limit]
+
+    rows = [
+        {
+            "id": r.id,
+            "user_id": r.user_id,
+            "action": r.action,
+            "target_id": r.target_id,
+            "timestamp": r.timestamp.isoformat(),
+        }
+        for r in result
+    ]
+    next_cursor = _encode_cursor(result[-1].timestamp, result[-1].id) if has_more else None
+    return rows, next_cursor
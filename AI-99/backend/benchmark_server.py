@@ -0,0 +1,133 @@
+"""Compare request throughput of the development server and gunicorn.
+
+Starts each server on a free local port against the configured
+DATABASE_URI and waits for /api/ready. Then it POSTs --requests
+predictions to /api/predict from --concurrency keep-alive clients and
+prints requests/s and latency:
+
+    python benchmark_server.py [--requests 600] [--concurrency 8] [--modes flask-debug,flask,gunicorn]
+
+Modes:
+    flask-debug  flask run with FLASK_DEBUG=1, as entrypoint.sh used to
+    flask        flask run, threaded, debugger and reloader off
+    gunicorn     gunicorn -c gunicorn.conf.py (SERVER_MODE=production)
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE = {
+    "attendance": 82, "avg_score": 71, "assignments_completed": 20, "behavior_score": 8,
+    "grade": "B", "marital_status": "Single", "application_mode": "Regular",
+    "course": "Computer Science", "cu1_enrolled": 6, "cu1_approved": 5,
+    "scholarship_holder": 0, "debtor": 0, "tuition_fees_up_to_date": 1, "academic_score": 75,
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _command(mode, port):
+    if mode == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{port}", "app:app"]
+    return [sys.executable, "-m", "flask", "run", "--host", "127.0.0.1", "--port", str(port)]
+
+
+def _environment(mode):
+    env = dict(os.environ, FLASK_APP="app.py", GUNICORN_ACCESS_LOG="")
+    env["FLASK_DEBUG"] = "1" if mode == "flask-debug" else "0"
+    return env
+
+
+def _wait_ready(port, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/ready")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server on port {port} not ready after {timeout}s")
+
+
+def _client(port, count, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    rng = random.Random()
+    for _ in range(count):
+        # Vary the row so cached explanations do not hide the model cost
+        body = json.dumps(dict(SAMPLE, attendance=rng.randint(40, 100), avg_score=rng.randint(40, 100)))
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/api/predict", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(mode, requests, concurrency):
+    port = _free_port()
+    server = subprocess.Popen(_command(mode, port), cwd=BASE_DIR, env=_environment(mode),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port)
+        # Warm each worker's explainer before timing
+        _client(port, concurrency * 2, [], [])
+
+        latencies, errors = [], []
+        per_client = max(1, requests // concurrency)
+        clients = [threading.Thread(target=_client, args=(port, per_client, latencies, errors))
+                   for _ in range(concurrency)]
+        start = time.perf_counter()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99), len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--modes", default="flask-debug,flask,gunicorn")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, {args.concurrency} clients, {os.cpu_count()} CPUs")
+    print(f"{'mode':>12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for mode in args.modes.split(","):
+        rps, p50, p99, errors = run(mode, args.requests, args.concurrency)
+        print(f"{mode:>12} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {errors:>7}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Check that the routes' queries are served by indexes, not full table scans.
+
+Creates the schema in an empty scratch database and seeds it. Then it
+calls every route in ROUTES through the test client and records each
+SELECT, UPDATE and DELETE the route sends. Every recorded statement is
+EXPLAINed with its own parameters. A full scan of a table holding at
+least --min-rows rows makes the check fail, unless ALLOWED_SCANS lists
+that route and table with the reason.
+
+It then seeds as many students again and calls every route a second
+time. A route fails if it sends a different number of statements per
+request at the two sizes, or more than the "queries" its ROUTES entry
+allows:
+
+    python check_query_plans.py [--database-uri mysql+pymysql://user:pw@host/scratch] [--students 2000]
+
+Without --database-uri it runs on a temporary SQLite file. The database
+must be empty; the tables are created and filled here. Run it after
+adding a route or query, or after changing indexes in models.py and
+migrations/versions.
+"""
+import os
+import re
+import sys
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (name, method, url, role, options). url may use {student_id}, {user_id}
+# and {since}. options: json body, status (expected, default 200),
+# paginate (follow next_cursor once), dialects (only run there), queries
+# (most statements one request may send)
+ROUTES = [
+    ("student profile", "GET", "/api/students/me", "student", {"queries": 3}),
+    ("student listing", "GET", "/api/students/?limit=50", "teacher", {"paginate": True, "queries": 1}),
+    ("student listing by risk", "GET", "/api/students/?limit=50&sort=risk_score&order=desc", "teacher",
+     {"paginate": True, "queries": 1}),
+    ("student listing by tier", "GET", "/api/students/?limit=50&risk_tier=High,Very%20High", "teacher",
+     {"paginate": True, "queries": 1}),
+    # One for the page and one per nested field
+    ("teacher student listing", "GET", "/api/teachers/students?limit=50&fields=id,full_name,predictions,counseling_sessions",
+     "teacher", {"queries": 3}),
+    ("student counseling sessions", "GET", "/api/teachers/{student_id}/counsel", "teacher", {}),
+    ("admin predictions", "GET", "/api/admin/predictions?per_page=50", "admin", {"queries": 2}),
+    ("admin analytics", "GET", "/api/admin/analytics", "admin", {"dialects": ("mysql",)}),
+    ("audit log by user", "GET", "/api/admin/audit-logs?user_id={user_id}&limit=20", "admin", {"paginate": True}),
+    ("audit log by time", "GET", "/api/admin/audit-logs?since={since}&limit=50", "admin", {"paginate": True}),
+    ("admin export", "GET", "/api/admin/export?format=csv", "admin", {"queries": 1}),
+    ("jobs", "GET", "/api/jobs/", "teacher", {}),
+    ("password login", "POST", "/api/auth/login", None, {"json": {"email": "student1@gmail.com", "password": "password"}}),
+    ("reset password", "POST", "/api/auth/reset-password", None,
+     {"json": {"token": "not-a-token", "password": "password"}, "status": 400}),
+]
+
+# (route, table): why a full scan is expected there
+ALLOWED_SCANS = {
+    ("admin analytics", "students"): "aggregates over every student by design",
+    ("admin export", "students"): "streams every student by design",
+    ("admin predictions", "predictions"): "paginate() counts all predictions for the page total",
+    ("admin predictions", "students"): "joined per prediction row by primary key",
+}
+
+WRITE_PREFIXES = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+def _seed(db, models, students, now, first=1):
+    """Bulk insert a realistic spread of rows; returns row counts per table.
+
+    Students get ids from `first` on, so a second call with first=students+1
+    doubles the data. The admin, the teacher and the jobs are only added by
+    the first call.
+    """
+    from werkzeug.security import generate_password_hash
+
+    password_hash = generate_password_hash("password")
+    ids = range(first, first + students)
+    users = []
+    if first == 1:
+        users = [{"id": 1, "username": "admin", "email": "admin@gmail.com", "role": "admin"},
+                 {"id": 2, "username": "teacher", "email": "teacher@gmail.com", "role": "teacher"}]
+    users += [{"id": 2 + i, "username": f"student{i}", "email": f"student{i}@gmail.com", "role": "student"}
+              for i in ids]
+    for u in users:
+        u.update(password_hash=password_hash, verified=True, created_at=now)
+
+    tiers = ["Minimal", "Low", "Moderate", "High", "Very High"]
+    rows = {
+        "users": users,
+        "teacher_details": [{"user_id": 2, "full_name": "Teacher", "employee_id": "T1",
+                             "subject": "Math", "department": "Science"}] if first == 1 else [],
+        "students": [
+            {"id": i, "user_id": 2 + i, "full_name": f"Student {i}", "course": f"Course {i % 12}",
+             "attendance": 50 + i % 50, "avg_score": 40 + i % 60, "academic_score": 50 + i % 50,
+             "latest_risk_score": (i % 100) / 100, "latest_risk_tier": tiers[i % 5],
+             "latest_prediction_at": now, "latest_model_version": "v1", "student_id": f"S{i:06d}"}
+            for i in ids
+        ],
+        "predictions": [
+            {"student_id": i, "risk_score": ((i + k) % 100) / 100, "model_version": "v1",
+             "created_at": now - timedelta(days=30 * k)}
+            for i in ids for k in range(5)
+        ],
+        "counseling_sessions": [
+            {"student_id": i, "teacher_id": 2, "notes": "Check-in",
+             "created_at": now - timedelta(days=k * 7),
+             "follow_up_at": now + timedelta(days=(i + k) % 30) if (i + k) % 3 == 0 else None}
+            for i in ids for k in range(2)
+        ],
+        "audit_logs": [
+            {"user_id": 1 + first + i % (students + 1), "action": "set_password", "target_id": i,
+             "timestamp": now - timedelta(minutes=i)}
+            for i in range((first - 1) * 5, (first - 1 + students) * 5)
+        ],
+        "raw_students": [{"student_id": f"S{i:06d}", "data": "{}", "created_at": now}
+                         for i in ids],
+        "jobs": [{"id": f"job-{i}", "kind": "import_csv", "status": "succeeded", "created_by": 1 + i % 2,
+                  "cancel_requested": False, "created_at": now - timedelta(hours=i)}
+                 for i in range(20)] if first == 1 else [],
+    }
+    for table in ("users", "teacher_details", "students", "predictions", "counseling_sessions",
+                  "audit_logs", "raw_students", "jobs"):
+        if rows[table]:
+            db.session.execute(db.metadata.tables[table].insert(), rows[table])
+    db.session.commit()
+    return {table: len(values) for table, values in rows.items()}
+
+
+def _analyze(db, tables):
+    # Fresh statistics, so the planner sees the seeded sizes
+    if db.engine.dialect.name == "mysql":
+        db.session.execute(db.text(f"ANALYZE TABLE {', '.join(tables)}"))
+    elif db.engine.dialect.name == "sqlite":
+        db.session.execute(db.text("ANALYZE"))
+    db.session.commit()
+
+
+def _sqlite_scans(conn, statement, parameters):
+    plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    # An index-ordered scan under LIMIT stops after one page
+    early_exit = " LIMIT " in statement.upper() and not any("TEMP B-TREE FOR ORDER BY" in p for p in plan)
+    scans = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)(?: AS (\w+))?", detail)
+        if not match or match.group(1) in ("CONSTANT", "SUBQUERY"):
+            continue
+        if early_exit:
+            continue
+        scans.append((match.group(1), detail))
+    return plan, scans
+
+
+def _mysql_scans(conn, statement, parameters):
+    result = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+    plan = [f"{r['table']}: type={r['type']} key={r['key']} rows={r['rows']} {r['Extra'] or ''}" for r in result]
+    limited = " LIMIT " in statement.upper()
+    scans = []
+    for r in result:
+        sorts = "filesort" in (r["Extra"] or "")
+        # ALL reads every row; "index" reads every index entry unless LIMIT cuts it short
+        if r["type"] == "ALL" or (r["type"] == "index" and (sorts or not limited)):
+            scans.append((re.sub(r"_\d+$", "", r["table"] or ""), plan[len(scans)]))
+    return plan, scans
+
+
+def _call(client, method, url, headers, options, captured):
+    """Call a route, following one next_cursor if asked; returns (response, statements per request)."""
+    captured.clear()
+    response = client.open(url, method=method, headers=headers, json=options.get("json"))
+    # Streamed bodies only query as they are read
+    response.get_data()
+    counts = [len(captured)]
+    if options.get("paginate") and response.is_json and response.get_json().get("next_cursor"):
+        sep = "&" if "?" in url else "?"
+        response = client.open(f"{url}{sep}cursor={response.get_json()['next_cursor']}",
+                               method=method, headers=headers)
+        response.get_data()
+        counts.append(len(captured) - counts[0])
+    return response, counts
+
+
+def _per_request(counts):
+    return " + ".join(str(c) for c in counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-uri")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--min-rows", type=int, default=500)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    scratch = None
+    if not args.database_uri:
+        scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        args.database_uri = f"sqlite:///{scratch.name}"
+    os.environ["DATABASE_URI"] = args.database_uri
+    os.environ["PRELOAD_MODEL"] = "0"
+    # Audit rows written by the routes themselves are not needed here
+    os.environ["AUDIT_BUFFERED"] = "0"
+    os.environ["FOLLOWUP_REMINDERS"] = "0"
+    # Every call must reach the database to be counted
+    os.environ["ANALYTICS_CACHE_TTL"] = "0"
+
+    sys.path.insert(0, BASE_DIR)
+    os.chdir(BASE_DIR)
+    from sqlalchemy import event, inspect
+    from flask_jwt_extended import create_access_token
+    import models
+    from app import app
+    db = models.db
+    logging.disable(logging.INFO)
+    # Newer PyJWT rejects the dict identities the routes use as "sub"
+    app.config["JWT_VERIFY_SUB"] = False
+
+    with app.app_context():
+        if inspect(db.engine).get_table_names():
+            raise SystemExit(f"{args.database_uri} is not empty; point --database-uri at a scratch database")
+        db.create_all()
+        now = datetime.utcnow().replace(microsecond=0)
+        counts = _seed(db, models, args.students, now)
+        _analyze(db, counts)
+        dialect = db.engine.dialect.name
+
+        tokens = {
+            role: create_access_token(identity={"id": uid, "role": role, "username": role})
+            for role, uid in (("admin", 1), ("teacher", 2), ("student", 3))
+        }
+        client = app.test_client()
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(WRITE_PREFIXES):
+                captured.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", capture)
+        explain = _sqlite_scans if dialect == "sqlite" else _mysql_scans
+        print(f"{dialect}, {args.students} students; flagging full scans of tables with >= {args.min_rows} rows")
+        routes = []
+        for name, method, url, role, options in ROUTES:
+            if dialect not in options.get("dialects", (dialect,)):
+                print(f"SKIP {name} (needs {', '.join(options['dialects'])})")
+                continue
+            url = url.format(student_id=1, user_id=3, since=(now - timedelta(days=1)).isoformat())
+            headers = {"Authorization": f"Bearer {tokens[role]}"} if role else {}
+            routes.append((name, method, url, headers, options))
+
+        failures = 0
+        query_counts = {}
+        for name, method, url, headers, options in routes:
+            response, query_counts[name] = _call(client, method, url, headers, options, captured)
+            if response.status_code != options.get("status", 200):
+                print(f"FAIL {name}: {response.status_code} {response.get_data()[:200]!r}")
+                failures += 1
+                continue
+
+            statements = list(captured)
+            event.remove(db.engine, "before_cursor_execute", capture)
+            problems = []
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    plan, scans = explain(conn, statement, parameters)
+                    if args.verbose:
+                        print(f"  {' '.join(statement.split())[:160]}")
+                        for line in plan:
+                            print(f"      {line}")
+                    for table, detail in scans:
+                        if counts.get(table, 0) < args.min_rows or (name, table) in ALLOWED_SCANS:
+                            continue
+                        problems.append(f"{detail}  <- {' '.join(statement.split())[:120]}")
+            event.listen(db.engine, "before_cursor_execute", capture)
+
+            if problems:
+                failures += 1
+                print(f"FAIL {name}: {len(statements)} queries")
+                for p in problems:
+                    print(f"    full scan: {p}")
+            else:
+                print(f"ok   {name}: {len(statements)} queries")
+
+        # Twice the students: a route whose statement count grows with the data loads rows one by one
+        event.remove(db.engine, "before_cursor_execute", capture)
+        _seed(db, models, args.students, now, first=args.students + 1)
+        _analyze(db, counts)
+        event.listen(db.engine, "before_cursor_execute", capture)
+
+        print(f"{args.students * 2} students; comparing statements per request")
+        for name, method, url, headers, options in routes:
+            response, grown = _call(client, method, url, headers, options, captured)
+            limit = options.get("queries")
+            if response.status_code != options.get("status", 200):
+                print(f"FAIL {name}: {response.status_code} {response.get_data()[:200]!r}")
+                failures += 1
+            elif grown != query_counts[name]:
+                print(f"FAIL {name}: {_per_request(query_counts[name])} queries with {args.students} students, "
+                      f"{_per_request(grown)} with {args.students * 2}")
+                failures += 1
+            elif limit is not None and max(grown) > limit:
+                print(f"FAIL {name}: {_per_request(grown)} queries, at most {limit} per request allowed")
+                failures += 1
+            else:
+                print(f"ok   {name}: {_per_request(grown)} queries")
+
+        event.remove(db.engine, "before_cursor_execute", capture)
+        db.session.remove()
+
+    if scratch is not None:
+        os.unlink(scratch.name)
+    if failures:
+        print(f"{failures} route(s) with unexpected full scans, statement counts or errors")
+        sys.exit(1)
+    print("All routes index-backed, with statement counts independent of the data size")
+
+
+if __name__ == "__main__":
+    main()
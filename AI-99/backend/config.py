@@ -24,3 +24,7 @@ class Config:
     MAIL_USERNAME = os.getenv("MAIL_USERNAME")  # your Gmail
     MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")  # app password from Gmail
     MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", MAIL_USERNAME)
+
+    # Load the model while the app is imported, so a server that forks
+    # workers after import (gunicorn --preload) shares one copy
+    PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "False").lower() in ("true", "1", "t")
@@ -1,16 +1,18 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 import logging
 import secrets
+from html import escape
 from datetime import datetime, timedelta
 
+from mail_queue import dispatcher
+
 logging.basicConfig(level=logging.INFO)
 
 def send_otp_email(receiver_email: str, otp: str, expiry_minutes: int = 5) -> bool:
     """
-    Send an OTP email using Gmail SMTP.
+    Queue an OTP email for delivery through the mail dispatcher (Gmail SMTP by default).
 
     Args:
         receiver_email (str): Recipient email address.
@@ -18,13 +20,14 @@ def send_otp_email(receiver_email: str, otp: str, expiry_minutes: int = 5) -> bo
         expiry_minutes (int, optional): Expiration time of OTP in minutes. Defaults to 5.
 
     Returns:
-        bool: True if email sent successfully, False otherwise.
+        bool: True if the email was queued, False if the sender is not
+        configured or the mail queue is full.
     """
     sender_email = os.environ.get("GMAIL_SENDER")
-    app_password = os.environ.get("GMAIL_APP_PASSWORD")
 
-    if not sender_email or not app_password:
-        logging.error("GMAIL_SENDER or GMAIL_APP_PASSWORD not set in environment variables.")
+    # GMAIL_APP_PASSWORD may be left unset for a local relay without auth
+    if not sender_email:
+        logging.error("GMAIL_SENDER not set in environment variables.")
         return False
 
     # Create email
@@ -51,41 +54,27 @@ def send_otp_email(receiver_email: str, otp: str, expiry_minutes: int = 5) -> bo
     msg.attach(MIMEText(text, "plain"))
     msg.attach(MIMEText(html, "html"))
 
-    # Send email with retry
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, app_password)
-            server.sendmail(sender_email, receiver_email, msg.as_string())
-        logging.info(f"OTP sent successfully to {receiver_email}")
-        return True
-    except smtplib.SMTPAuthenticationError:
-        logging.error("SMTP Authentication Error: Check your Gmail credentials or App Password.")
-        return False
-    except smtplib.SMTPRecipientsRefused:
-        logging.error(f"Recipient refused: {receiver_email}")
-        return False
-    except Exception as e:
-        logging.error(f"Error sending OTP email: {e}")
-        return False
+    # Delivered by a background worker; the request does not wait for SMTP
+    return dispatcher.enqueue(sender_email, receiver_email, msg, description="OTP email")
 
 
 def send_password_reset_email(receiver_email: str, reset_token: str) -> bool:
     """
-    Send a password reset email with a reset link.
+    Queue a password reset email with a reset link for delivery.
 
     Args:
         receiver_email (str): Recipient email address.
         reset_token (str): Password reset token.
 
     Returns:
-        bool: True if email sent successfully, False otherwise.
+        bool: True if the email was queued, False if the sender is not
+        configured or the mail queue is full.
     """
     sender_email = os.environ.get("GMAIL_SENDER")
-    app_password = os.environ.get("GMAIL_APP_PASSWORD")
 
-    if not sender_email or not app_password:
-        logging.error("GMAIL_SENDER or GMAIL_APP_PASSWORD not set in environment variables.")
+    # GMAIL_APP_PASSWORD may be left unset for a local relay without auth
+    if not sender_email:
+        logging.error("GMAIL_SENDER not set in environment variables.")
         return False
 
     # Get the frontend URL from environment or use default
@@ -124,20 +113,64 @@ def send_password_reset_email(receiver_email: str, reset_token: str) -> bool:
     msg.attach(MIMEText(text, "plain"))
     msg.attach(MIMEText(html, "html"))
 
-    # Send email with retry
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, app_password)
-            server.sendmail(sender_email, receiver_email, msg.as_string())
-        logging.info(f"Password reset email sent successfully to {receiver_email}")
-        return True
-    except smtplib.SMTPAuthenticationError:
-        logging.error("SMTP Authentication Error: Check your Gmail credentials or App Password.")
-        return False
-    except smtplib.SMTPRecipientsRefused:
-        logging.error(f"Recipient refused: {receiver_email}")
-        return False
-    except Exception as e:
-        logging.error(f"Error sending password reset email: {e}")
+    return dispatcher.enqueue(sender_email, receiver_email, msg, description="Password reset email")
+
+
+def send_follow_up_reminder_email(receiver_email: str, reminders: list) -> bool:
+    """
+    Queue one email listing a teacher's counseling follow-ups that are due.
+
+    Args:
+        receiver_email (str): The teacher's email address.
+        reminders (list): Dicts with student_name, follow_up_at (datetime, UTC)
+            and notes for each due follow-up.
+
+    Returns:
+        bool: True if the email was queued, False if the sender is not
+        configured or the mail queue is full.
+    """
+    sender_email = os.environ.get("GMAIL_SENDER")
+
+    # GMAIL_APP_PASSWORD may be left unset for a local relay without auth
+    if not sender_email:
+        logging.error("GMAIL_SENDER not set in environment variables.")
         return False
+
+    frontend_url = os.environ.get("FRONTEND_URL", "http://localhost:3000")
+    count = len(reminders)
+
+    # Create email
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = f"AI Dropout System - {count} counseling follow-up{'s' if count != 1 else ''} due"
+    msg["From"] = sender_email
+    msg["To"] = receiver_email
+
+    # Plain text and HTML versions
+    lines = [
+        f"- {r['student_name']} at {r['follow_up_at']:%Y-%m-%d %H:%M} UTC" + (f": {r['notes']}" if r["notes"] else "")
+        for r in reminders
+    ]
+    text = "These counseling follow-ups are due:\n\n" + "\n".join(lines) + f"\n\nOpen your dashboard: {frontend_url}"
+    items = "".join(
+        f"<li><b>{escape(r['student_name'])}</b> at {r['follow_up_at']:%Y-%m-%d %H:%M} UTC"
+        + (f"<br><span style=\"color: #666;\">{escape(r['notes'])}</span>" if r["notes"] else "")
+        + "</li>"
+        for r in reminders
+    )
+    html = f"""
+    <html>
+        <body>
+            <p>Hello,<br><br>
+               These counseling follow-ups are due:
+            </p>
+            <ul>{items}</ul>
+            <p><a href="{frontend_url}">Open your dashboard</a></p>
+        </body>
+    </html>
+    """
+
+    # Attach parts
+    msg.attach(MIMEText(text, "plain"))
+    msg.attach(MIMEText(html, "html"))
+
+    return dispatcher.enqueue(sender_email, receiver_email, msg, description="Follow-up reminder email")
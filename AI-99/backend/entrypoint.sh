@@ -4,7 +4,9 @@ set -e
 cd /app
 
 export FLASK_APP=app.py
-export FLASK_DEBUG=1
+
+# "production" (gunicorn, see gunicorn.conf.py) or "development" (flask run with the debugger)
+SERVER_MODE=${SERVER_MODE:-production}
 
 DB_HOST=${DB_HOST:-db}       # default Docker service name
 DB_PORT=${DB_PORT:-3306}
@@ -33,5 +35,11 @@ print('Tables ready!')
 echo "Running database migrations..."
 flask db upgrade || echo "Migrations skipped (already up to date)"
 
-echo "Starting Flask..."
-flask run --host=0.0.0.0 --port=5000
+if [ "$SERVER_MODE" = "development" ]; then
+  echo "Starting Flask development server..."
+  export FLASK_DEBUG=1
+  exec flask run --host=0.0.0.0 --port=5000
+fi
+
+echo "Starting gunicorn..."
+exec gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,172 @@
+import io
+import os
+import csv
+import json
+from sqlalchemy import select
+from models import db, Student
+from student_queries import apply_filters, ListingError
+
+# Rows fetched from the server-side cursor and written per step
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# key -> (CSV header, column, type); dict order is the default column order
+EXPORT_COLUMNS = {
+    "id": ("ID", Student.id, "int"),
+    "student_id": ("Student ID", Student.student_id, "str"),
+    "full_name": ("Full Name", Student.full_name, "str"),
+    "course": ("Course", Student.course, "str"),
+    "gender": ("Gender", Student.gender, "str"),
+    "attendance": ("Attendance", Student.attendance, "float"),
+    "academic_score": ("Academic Score", Student.academic_score, "int"),
+    "grade": ("Grade", Student.grade, "str"),
+    "risk_score": ("Risk Score", Student.latest_risk_score, "float"),
+    "predicted_at": ("Latest Prediction Date", Student.latest_prediction_at, "datetime"),
+    "risk_tier": ("Risk Tier", Student.latest_risk_tier, "str"),
+    "model_version": ("Model Version", Student.latest_model_version, "str"),
+    "avg_score": ("Average Score", Student.avg_score, "float"),
+    "age_at_enrollment": ("Age At Enrollment", Student.age_at_enrollment, "int"),
+    "scholarship_holder": ("Scholarship Holder", Student.scholarship_holder, "str"),
+    "debtor": ("Debtor", Student.debtor, "str"),
+    "tuition_fees_up_to_date": ("Tuition Fees Up To Date", Student.tuition_fees_up_to_date, "str"),
+}
+
+DEFAULT_COLUMNS = [
+    "id", "student_id", "full_name", "course", "gender",
+    "attendance", "academic_score", "grade", "risk_score", "predicted_at",
+]
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def parse_columns(value):
+    keys = [c.strip() for c in (value or "").split(",") if c.strip()] or list(DEFAULT_COLUMNS)
+    unknown = [k for k in keys if k not in EXPORT_COLUMNS]
+    if unknown:
+        raise ListingError(f"Unknown column(s): {', '.join(unknown)}")
+    return keys
+
+
+def _iter_chunks(stmt, chunk_size):
+    """Yield lists of row tuples read through a server-side cursor."""
+    result = db.session.execute(
+        stmt.execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    try:
+        for chunk in result.partitions(chunk_size):
+            yield chunk
+    finally:
+        result.close()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _stream_csv(keys, chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([EXPORT_COLUMNS[k][0] for k in keys])
+    for chunk in chunks:
+        writer.writerows([_csv_value(v) for v in row] for row in chunk)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def _stream_ndjson(keys, chunks):
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(keys, row)), default=_csv_value) + "\n" for row in chunk
+        )
+
+
+class _ChunkSink:
+    """Write-only file object handing Parquet bytes out as they are produced.
+
+    Tracks the absolute position itself so the footer offsets stay correct
+    after each drained chunk.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _stream_parquet(keys, chunks, pa, pq):
+    arrow_types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "datetime": pa.timestamp("us"),
+    }
+    schema = pa.schema([(k, arrow_types[EXPORT_COLUMNS[k][2]]) for k in keys])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        # One row group per chunk
+        for chunk in chunks:
+            columns = list(zip(*chunk)) if chunk else [[] for _ in keys]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=schema.field(k).type) for k, col in zip(keys, columns)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(fmt, keys, args, chunk_size=EXPORT_CHUNK_SIZE):
+    """Return a generator of response body pieces for the students export.
+
+    Memory use is bounded by one chunk of rows whatever the table size.
+    Bad arguments raise ListingError here, before anything is streamed;
+    Parquet raises ImportError if pyarrow is not installed.
+    """
+    if fmt not in FORMATS:
+        raise ListingError(f"Unsupported format: {fmt}")
+
+    stmt = select(*[EXPORT_COLUMNS[k][1] for k in keys])
+    stmt = apply_filters(stmt, args).order_by(Student.id)
+    chunks = _iter_chunks(stmt, chunk_size)
+
+    if fmt == "csv":
+        return _stream_csv(keys, chunks)
+    if fmt == "ndjson":
+        return _stream_ndjson(keys, chunks)
+
+    # Imported here so CSV/NDJSON exports do not need pyarrow loaded
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    return _stream_parquet(keys, chunks, pa, pq)
@@ -0,0 +1,294 @@
+import os
+import time
+import uuid
+import heapq
+import atexit
+import socket
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, or_
+from sqlalchemy.exc import IntegrityError
+from models import db, CounselingSession, SchedulerLease, Student, User
+from email_utils import send_follow_up_reminder_email
+
+# "0" turns follow-up reminders off
+FOLLOWUP_REMINDERS = os.getenv("FOLLOWUP_REMINDERS", "1").lower() in ("true", "1", "t")
+
+# Seconds between refills of the due-queue from counseling_sessions
+FOLLOWUP_POLL_INTERVAL = float(os.getenv("FOLLOWUP_POLL_INTERVAL", 30))
+
+# Follow-ups due within this many seconds are loaded into the due-queue
+FOLLOWUP_LOOKAHEAD = float(os.getenv("FOLLOWUP_LOOKAHEAD", 600))
+
+# Most follow-ups held in the due-queue at once
+FOLLOWUP_QUEUE_SIZE = int(os.getenv("FOLLOWUP_QUEUE_SIZE", 1000))
+
+# Follow-ups claimed and notified per batch
+FOLLOWUP_BATCH_SIZE = int(os.getenv("FOLLOWUP_BATCH_SIZE", 100))
+
+# Follow-ups more overdue than this are not reminded about (e.g. after downtime)
+FOLLOWUP_MAX_LATENESS_HOURS = float(os.getenv("FOLLOWUP_MAX_LATENESS_HOURS", 24))
+
+# Seconds the leader's lease lasts unless renewed; another worker takes over after that
+FOLLOWUP_LEASE_SECONDS = float(os.getenv("FOLLOWUP_LEASE_SECONDS", 60))
+
+# Characters of session notes quoted in a reminder
+NOTES_PREVIEW_LENGTH = 200
+
+LEASE_NAME = "follow_up_reminders"
+
+
+class ReminderScheduler:
+    """Emails teachers when their counseling follow-ups fall due.
+
+    Every process runs a scheduler thread, but only the holder of the
+    "follow_up_reminders" row in scheduler_leases does any work. The others
+    retry the lease every poll and take over once it expires. The leader
+    keeps a min-heap of (follow_up_at, id) for pending follow-ups due within
+    `lookahead` seconds. It tops the heap up every `poll_interval` from a
+    range scan of ix_counseling_sessions_reminded_at_follow_up_at and sleeps
+    until the earliest one is due.
+
+    Due follow-ups are claimed (reminded_at set) in batches, in the same
+    transaction that locks the lease row and checks it is still held. So a
+    worker whose lease lapsed cannot send a reminder that another worker
+    sends too. Each teacher gets one email per batch through the mail queue,
+    which never blocks. When an email cannot be queued its follow-ups are
+    released and picked up again by the next refill.
+    """
+
+    def __init__(self, enabled=FOLLOWUP_REMINDERS, poll_interval=FOLLOWUP_POLL_INTERVAL,
+                 lookahead=FOLLOWUP_LOOKAHEAD, queue_size=FOLLOWUP_QUEUE_SIZE,
+                 batch_size=FOLLOWUP_BATCH_SIZE, max_lateness_hours=FOLLOWUP_MAX_LATENESS_HOURS,
+                 lease_seconds=FOLLOWUP_LEASE_SECONDS, notify=send_follow_up_reminder_email):
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self.lookahead = lookahead
+        self.queue_size = max(1, queue_size)
+        self.batch_size = max(1, batch_size)
+        self.max_lateness_hours = max_lateness_hours
+        self.lease_seconds = lease_seconds
+        # notify(teacher_email, reminders) -> bool, True once the message is queued
+        self.notify = notify
+
+        self.app = None
+        self.holder = None
+        self.stats = {"reminded": 0, "failed": 0}
+        self._heap = []
+        self._queued = set()
+        self._lease_until = None
+        self._next_refill = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        if self.enabled:
+            # Started by the first request in each process, so every forked
+            # worker gets its own thread
+            app.before_request(self._ensure_started)
+            atexit.register(self.release)
+
+    @property
+    def is_leader(self):
+        return self._lease_until is not None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker inherits the master's state but neither its thread nor its lease
+            self._pid = os.getpid()
+            self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            self._reset()
+            threading.Thread(target=self._run, name="follow-up-reminders", daemon=True).start()
+
+    def _reset(self):
+        self._heap = []
+        self._queued = set()
+        self._lease_until = None
+        self._next_refill = 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self.tick()
+            except Exception as e:
+                logging.error(f"Follow-up reminders failed: {str(e)}")
+                self._reset()
+                delay = self.poll_interval
+            self._stop.wait(delay)
+
+    def stop(self):
+        self._stop.set()
+        self.release()
+
+    def tick(self):
+        """Renew the lease, refill the heap when due and send what is due.
+
+        Returns the seconds to wait before the next call.
+        """
+        with self.app.app_context():
+            if not self._hold_lease(datetime.utcnow()):
+                self._reset()
+                return self.poll_interval
+
+            if time.monotonic() >= self._next_refill:
+                self._refill(datetime.utcnow())
+                self._next_refill = time.monotonic() + self.poll_interval
+
+            now = datetime.utcnow()
+            while self._heap and self._heap[0][0] <= now:
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    _, session_id = heapq.heappop(self._heap)
+                    self._queued.discard(session_id)
+                    due.append(session_id)
+                if not self._dispatch(due, now):
+                    # Lost the lease; whoever holds it now reloads these
+                    self._reset()
+                    return self.poll_interval
+
+        # Wake for the next follow-up, the next refill or the lease renewal, whichever is first
+        waits = [self._next_refill - time.monotonic(), self.lease_seconds / 3]
+        if self._heap:
+            waits.append((self._heap[0][0] - datetime.utcnow()).total_seconds())
+        return max(0.05, min(waits))
+
+    def _hold_lease(self, now):
+        """Take or renew the lease; True while this process holds it."""
+        if self._lease_until is not None and (self._lease_until - now).total_seconds() > self.lease_seconds / 2:
+            return True
+
+        t = SchedulerLease.__table__
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        with db.engine.begin() as conn:
+            held = conn.execute(
+                t.update()
+                .where(t.c.name == LEASE_NAME, or_(t.c.holder == self.holder, t.c.expires_at < now))
+                .values(holder=self.holder, expires_at=expires_at)
+            ).rowcount
+            if not held and conn.execute(select(t.c.name).where(t.c.name == LEASE_NAME)).first() is None:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(t.insert().values(name=LEASE_NAME, holder=self.holder, expires_at=expires_at))
+                    held = 1
+                except IntegrityError:
+                    # Another worker created it first and leads
+                    held = 0
+
+        if held and self._lease_until is None:
+            logging.info(f"Follow-up reminders: {self.holder} is now the leader")
+        self._lease_until = expires_at if held else None
+        return bool(held)
+
+    def _refill(self, now):
+        """Add pending follow-ups due before the lookahead horizon that are not queued yet."""
+        room = self.queue_size - len(self._heap)
+        if room <= 0:
+            return 0
+        t = CounselingSession.__table__
+        earliest = now - timedelta(hours=self.max_lateness_hours)
+        horizon = now + timedelta(seconds=self.lookahead)
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(t.c.id, t.c.follow_up_at)
+                .where(t.c.reminded_at.is_(None), t.c.follow_up_at >= earliest, t.c.follow_up_at <= horizon)
+                .order_by(t.c.follow_up_at, t.c.id)
+                # Enough to find `room` rows that are not queued already
+                .limit(room + len(self._queued))
+            ).all()
+
+        added = 0
+        for row in rows:
+            if added == room:
+                break
+            if row.id not in self._queued:
+                heapq.heappush(self._heap, (row.follow_up_at, row.id))
+                self._queued.add(row.id)
+                added += 1
+        return added
+
+    def _dispatch(self, session_ids, now):
+        """Claim and notify one batch; False if the lease is no longer ours."""
+        t = CounselingSession.__table__
+        lease = SchedulerLease.__table__
+        with db.engine.begin() as conn:
+            # Holds the lease row until commit, so the check stays true while claiming
+            current = conn.execute(
+                select(lease.c.holder, lease.c.expires_at).where(lease.c.name == LEASE_NAME).with_for_update()
+            ).first()
+            if current is None or current.holder != self.holder or current.expires_at <= now:
+                return False
+
+            # Skips sessions deleted, already reminded or moved later since they were queued
+            claimed = conn.execute(
+                select(
+                    t.c.id,
+                    t.c.follow_up_at,
+                    func.substr(t.c.notes, 1, NOTES_PREVIEW_LENGTH + 1).label("notes"),
+                    Student.full_name.label("student_name"),
+                    User.email.label("teacher_email"),
+                )
+                .select_from(t)
+                .outerjoin(Student, Student.id == t.c.student_id)
+                .outerjoin(User, User.id == t.c.teacher_id)
+                .where(t.c.id.in_(session_ids), t.c.reminded_at.is_(None), t.c.follow_up_at <= now)
+            ).all()
+            if claimed:
+                conn.execute(t.update().where(t.c.id.in_([r.id for r in claimed])).values(reminded_at=now))
+
+        by_teacher = defaultdict(list)
+        for r in claimed:
+            notes = r.notes
+            if notes and len(notes) > NOTES_PREVIEW_LENGTH:
+                notes = notes[:NOTES_PREVIEW_LENGTH] + "..."
+            by_teacher[r.teacher_email].append({
+                "session_id": r.id,
+                "student_name": r.student_name or "Unknown",
+                "follow_up_at": r.follow_up_at,
+                "notes": notes,
+            })
+
+        failed = []
+        for email, reminders in by_teacher.items():
+            if not email:
+                logging.error(f"Follow-up reminders: no teacher email for sessions {[r['session_id'] for r in reminders]}")
+                continue
+            if self.notify(email, reminders):
+                self.stats["reminded"] += len(reminders)
+            else:
+                self.stats["failed"] += len(reminders)
+                failed += [r["session_id"] for r in reminders]
+
+        if failed:
+            # Back to pending; the next refill queues them again
+            with db.engine.begin() as conn:
+                conn.execute(
+                    t.update().where(t.c.id.in_(failed), t.c.reminded_at == now).values(reminded_at=None)
+                )
+        return True
+
+    def release(self):
+        """Give up the lease so another worker takes over without waiting for it to expire."""
+        if self.app is None or self.holder is None or self._pid != os.getpid():
+            return
+        t = SchedulerLease.__table__
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                conn.execute(
+                    t.update()
+                    .where(t.c.name == LEASE_NAME, t.c.holder == self.holder)
+                    .values(expires_at=datetime.utcnow())
+                )
+        except Exception as e:
+            logging.error(f"Follow-up reminders: releasing the lease failed: {str(e)}")
+        self._lease_until = None
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,187 @@
+"""Gunicorn settings for the production server started by entrypoint.sh:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Each setting can be overridden with the environment variable read next to it.
+"""
+import os
+import math
+import time
+import signal
+import threading
+
+from ml.registry import MODEL_PATH, MODEL_META_PATH, CHECK_INTERVAL
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Memory a worker needs besides the shared model: interpreter, pandas,
+# request buffers and its SHAP explanation cache
+WORKER_BASE_MB = int(os.getenv("GUNICORN_WORKER_BASE_MB", 200))
+
+# Requests in flight per CPU across all workers; the rest is I/O wait on MySQL
+CONCURRENCY_PER_CPU = int(os.getenv("GUNICORN_CONCURRENCY_PER_CPU", 4))
+
+# Recycle workers when model.pkl changes instead of letting each one load
+# its own private copy ("0" keeps the per-worker reload)
+RECYCLE_ON_MODEL_CHANGE = os.getenv("GUNICORN_RECYCLE_ON_MODEL_CHANGE", "1").lower() in ("true", "1", "t")
+
+# Seconds a model-change recycle waits for background jobs (imports, batch
+# scoring, provisioning) running in the workers; they are recycled anyway after that
+RECYCLE_MAX_DEFER = float(os.getenv("GUNICORN_RECYCLE_MAX_DEFER", 3600))
+
+
+def _available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _model_bytes():
+    try:
+        return os.path.getsize(MODEL_PATH)
+    except OSError:
+        return 0
+
+
+def default_workers(cpus, model_bytes, available):
+    """One worker per CPU plus one, for CPU-bound scoring, capped by memory.
+
+    Workers share the preloaded model, but a worker that retrains, or one
+    running before it is recycled, holds a private copy. So each worker
+    is budgeted its base memory plus one model.
+    """
+    workers = cpus + 1
+    if available:
+        per_worker = WORKER_BASE_MB * 1024 * 1024 + model_bytes
+        # Keep a fifth of what is free for the master and the page cache
+        workers = min(workers, int(available * 0.8 // per_worker))
+    return max(1, workers)
+
+
+def default_threads(cpus, workers):
+    """Enough threads that all workers together serve CONCURRENCY_PER_CPU requests per CPU.
+
+    When memory caps the worker count (large models), each worker takes
+    more threads to keep the same concurrency.
+    """
+    return max(2, min(16, math.ceil(CONCURRENCY_PER_CPU * cpus / workers)))
+
+
+_cpus = os.cpu_count() or 1
+workers = int(os.getenv("GUNICORN_WORKERS", 0)) or default_workers(_cpus, _model_bytes(), _available_memory())
+threads = int(os.getenv("GUNICORN_THREADS", 0)) or default_threads(_cpus, workers)
+worker_class = "gthread"
+
+# Import the app, and with it the model, once in the master; workers share
+# it copy-on-write (see ModelRegistry.preload)
+preload_app = True
+os.environ.setdefault("PRELOAD_MODEL", "1")
+
+# Long enough for streamed exports; training runs as a background job
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def _artifact_mtimes():
+    mtimes = []
+    for path in (MODEL_PATH, MODEL_META_PATH):
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def _active_jobs(engine):
+    """Queued or running jobs whose workers are still alive (fresh heartbeat)."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import select, func
+    from models import Job
+    from jobs import ACTIVE_STATUSES, STALE_AFTER
+
+    table = Job.__table__
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count())
+            .select_from(table)
+            .where(table.c.status.in_(ACTIVE_STATUSES),
+                   table.c.heartbeat_at >= datetime.utcnow() - timedelta(seconds=STALE_AFTER))
+        ).scalar()
+
+
+def _watch_model(server):
+    """Send the master SIGHUP once the model files change and settle.
+
+    A retrain writes model.pkl and then its metadata, so the files must be
+    unchanged for one full interval before workers are recycled. Jobs run
+    on threads inside the workers and die with them, so the recycle also
+    waits, up to RECYCLE_MAX_DEFER seconds, until no job is active.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+    from config import Config
+
+    # No pooled connections in the master for the forked workers to inherit
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, poolclass=NullPool)
+    interval = max(CHECK_INTERVAL, 1.0)
+    seen = applied = _artifact_mtimes()
+    deferred_since = None
+    while True:
+        time.sleep(interval)
+        current = _artifact_mtimes()
+        if current != seen:
+            seen = current
+            continue
+        if current == applied:
+            continue
+
+        try:
+            active = _active_jobs(engine)
+        except Exception as e:
+            server.log.error(f"Counting active jobs failed: {str(e)}")
+            active = 0
+        if active:
+            if deferred_since is None:
+                deferred_since = time.monotonic()
+                server.log.info(f"Model artifacts changed; waiting for {active} background job(s) before recycling workers")
+            if time.monotonic() - deferred_since < RECYCLE_MAX_DEFER:
+                continue
+            server.log.warning(f"Recycling workers with {active} background job(s) still active")
+
+        deferred_since = None
+        applied = current
+        server.log.info("Model artifacts changed; recycling workers")
+        os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server):
+    if RECYCLE_ON_MODEL_CHANGE:
+        threading.Thread(target=_watch_model, args=(server,), name="model-watch", daemon=True).start()
+
+
+def on_reload(server):
+    # HUP: load the new model in the master before the new workers fork
+    from ml.registry import registry
+    loaded = registry.preload()
+    if loaded is not None:
+        server.log.info(f"Preloaded model {loaded.version} for new workers")
+
+
+def post_fork(server, worker):
+    if RECYCLE_ON_MODEL_CHANGE:
+        # The master recycles this worker when the model changes, so it
+        # never needs to load a private copy itself
+        from ml.registry import registry
+        registry.check_interval = float("inf")
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, inspect
+from models import db, Job
+
+# Background worker threads per process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+
+# Minimum seconds between progress writes for one job
+PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", 1.0))
+
+# Seconds between heartbeats for the jobs a process holds, whether or not they report progress
+HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", 15))
+
+# A queued or running job whose heartbeat is older than this is failed as orphaned
+STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 120))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+ORPHANED_ERROR = "The worker running this job exited before it finished"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Ids of the queued and running jobs this process holds
+_held = set()
+_held_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Handle passed to a job function for reporting progress.
+
+    Progress and cancellation go through their own short transactions so
+    they never commit or roll back the job's own session work.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def progress(self, fraction=None, message=None, force=False):
+        """Record progress (0..1) and raise JobCancelled if a cancel was requested."""
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+
+        values = {}
+        if fraction is not None:
+            values["progress"] = max(0.0, min(1.0, float(fraction)))
+        if message is not None:
+            values["message"] = message[:255]
+
+        table = Job.__table__
+        with db.engine.begin() as conn:
+            conn.execute(
+                table.update().where(table.c.id == self.job_id).values(heartbeat_at=datetime.utcnow(), **values)
+            )
+            cancel = conn.execute(
+                select(table.c.cancel_requested).where(table.c.id == self.job_id)
+            ).scalar()
+        if cancel:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        self.progress(force=True)
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Created lazily so each gunicorn worker gets its own threads after fork
+                _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+                threading.Thread(target=_heartbeat, args=(app,), name="job-heartbeat", daemon=True).start()
+    return _executor
+
+
+def _heartbeat(app):
+    """Keep the heartbeat of this process's jobs fresh, including ones stuck in a long step."""
+    table = Job.__table__
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _held_lock:
+            held = list(_held)
+        if not held:
+            continue
+        try:
+            with app.app_context(), db.engine.begin() as conn:
+                conn.execute(
+                    table.update()
+                    .where(table.c.id.in_(held), table.c.status.in_(ACTIVE_STATUSES))
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+        except Exception as e:
+            logging.error(f"Job heartbeat failed: {str(e)}")
+
+
+def submit(kind, fn, *args, user_id=None, **kwargs):
+    """Queue fn(job_context, *args, **kwargs) and return the new job id."""
+    app = current_app._get_current_object()
+    job = Job(id=str(uuid.uuid4()), kind=kind, status="queued", created_by=user_id,
+              owner=_owner(), heartbeat_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+
+    with _held_lock:
+        _held.add(job.id)
+    _get_executor(app).submit(_run, app, job.id, fn, args, kwargs)
+    return job.id
+
+
+def _finish(job_id, **values):
+    values.setdefault("finished_at", datetime.utcnow())
+    table = Job.__table__
+    with db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.id == job_id).values(**values))
+
+
+def _run(app, job_id, fn, args, kwargs):
+    with app.app_context():
+        try:
+            job = db.session.get(Job, job_id)
+            if job is None:
+                return
+            if job.cancel_requested:
+                _finish(job_id, status="cancelled")
+                return
+
+            job.status = "running"
+            job.started_at = job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+
+            try:
+                result = fn(JobContext(job_id), *args, **kwargs)
+            except JobCancelled:
+                db.session.rollback()
+                _finish(job_id, status="cancelled", message="Cancelled")
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Job {job_id} ({job.kind}) failed: {traceback.format_exc()}")
+                _finish(job_id, status="failed", error=str(e))
+            else:
+                _finish(job_id, status="succeeded", progress=1.0,
+                        result=json.dumps(result, default=str))
+        except Exception:
+            logging.error(f"Job runner error for {job_id}: {traceback.format_exc()}")
+        finally:
+            with _held_lock:
+                _held.discard(job_id)
+            db.session.remove()
+
+
+def _owner_exited(job_id, owner):
+    """True when `owner` ran on this host and is known to have exited."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        # Our pid, but a job we do not hold was left by an earlier process with it
+        with _held_lock:
+            return job_id not in _held
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def fail_orphaned_jobs(job_ids=None):
+    """Mark queued and running jobs whose process is gone as failed; returns their ids.
+
+    A job is orphaned when its heartbeat is older than STALE_AFTER, or when
+    its owner ran on this host and has exited. Checks every active job, or
+    only `job_ids`.
+    """
+    table = Job.__table__
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=STALE_AFTER)
+    stmt = select(
+        table.c.id, table.c.owner, table.c.heartbeat_at, table.c.started_at, table.c.created_at
+    ).where(table.c.status.in_(ACTIVE_STATUSES))
+    if job_ids is not None:
+        stmt = stmt.where(table.c.id.in_(job_ids))
+
+    with db.engine.begin() as conn:
+        orphaned = []
+        for row in conn.execute(stmt):
+            # Jobs from before heartbeats were recorded count from when they started
+            seen = row.heartbeat_at or row.started_at or row.created_at
+            if seen is None or seen < stale_before or _owner_exited(row.id, row.owner):
+                orphaned.append(row.id)
+        if orphaned:
+            conn.execute(
+                table.update()
+                .where(table.c.id.in_(orphaned), table.c.status.in_(ACTIVE_STATUSES))
+                .values(status="failed", error=ORPHANED_ERROR, finished_at=now)
+            )
+    for job_id in orphaned:
+        logging.error(f"Job {job_id} failed: {ORPHANED_ERROR}")
+    return orphaned
+
+
+def init_app(app):
+    """Fail jobs left running by processes that exited before this one started."""
+    try:
+        with app.app_context():
+            if inspect(db.engine).has_table(Job.__tablename__):
+                fail_orphaned_jobs()
+            # gunicorn forks its workers from this process; none should inherit its connections
+            db.engine.dispose()
+    except Exception as e:
+        logging.error(f"Recovering orphaned jobs failed: {str(e)}")
+
+
+def request_cancel(job):
+    """Flag a job for cancellation; a queued job is cancelled immediately."""
+    job.cancel_requested = True
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def job_to_dict(job):
+    eta_seconds = None
+    if job.status == "running" and job.started_at and job.progress:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed * (1 - job.progress) / job.progress, 1)
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": round(job.progress or 0.0, 4),
+        "message": job.message,
+        "eta_seconds": eta_seconds,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import atexit
+import smtplib
+import logging
+import threading
+
+# SMTP endpoint; the same variables configure Flask-Mail in config.py.
+# Point MAIL_SERVER/MAIL_PORT at a local stand-in server (MAIL_USE_TLS=0)
+# to exercise the queue without Gmail.
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", 587))
+MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "True").lower() in ("true", "1", "t")
+
+# Messages waiting per process; enqueue fails fast once it is full
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))
+
+# Sender threads per process, each holding one SMTP connection
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+
+# Messages a worker takes from the queue and sends on one connection in a row
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 20))
+
+# Attempts per message, and the first backoff delay (doubled each retry, capped)
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_DELAY = float(os.getenv("MAIL_RETRY_DELAY", 1.0))
+MAIL_RETRY_MAX_DELAY = float(os.getenv("MAIL_RETRY_MAX_DELAY", 60.0))
+
+# Seconds an idle connection is kept open before QUIT
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", 30))
+
+# Socket timeout for connect and every SMTP command
+MAIL_SMTP_TIMEOUT = float(os.getenv("MAIL_SMTP_TIMEOUT", 20))
+
+# Seconds a stopping process waits for queued mail to go out
+MAIL_DRAIN_TIMEOUT = float(os.getenv("MAIL_DRAIN_TIMEOUT", 10))
+
+_STOP = object()
+
+
+class _Permanent(Exception):
+    """A failure retrying cannot fix (bad credentials, refused recipient, 5xx)."""
+
+
+class MailDispatcher:
+    """Bounded in-process outbound mail queue with pooled SMTP connections.
+
+    enqueue() only puts the message on the queue, so a request never waits
+    for SMTP. Worker threads each keep one authenticated connection open
+    while mail keeps coming, send bursts of up to `batch_size` messages on
+    it, and close it after `idle_timeout` seconds without mail. Dropped
+    connections and temporary (4xx) errors are retried with exponential
+    backoff; permanent errors are logged and the message dropped.
+
+    Threads start on first use in each process, so a forking server gives
+    every worker its own queue and connections.
+    """
+
+    def __init__(self, host=MAIL_SERVER, port=MAIL_PORT, use_tls=MAIL_USE_TLS,
+                 username=None, password=None, queue_size=MAIL_QUEUE_SIZE,
+                 workers=MAIL_WORKERS, batch_size=MAIL_BATCH_SIZE,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_delay=MAIL_RETRY_DELAY,
+                 retry_max_delay=MAIL_RETRY_MAX_DELAY, idle_timeout=MAIL_IDLE_TIMEOUT,
+                 smtp_timeout=MAIL_SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        # Read from the environment at connect time when not given
+        self.username = username
+        self.password = password
+        self.queue_size = queue_size
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.idle_timeout = idle_timeout
+        self.smtp_timeout = smtp_timeout
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._threads = []
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "connections": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Fresh state in a forked child; the parent's threads did not survive
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._threads = [
+                threading.Thread(target=self._run, name=f"mail-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, sender, recipient, message, description="email"):
+        """Queue message (an email.message.Message) for delivery.
+
+        Returns False at once if the queue is full.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((sender, recipient, message.as_string(), description))
+        except queue.Full:
+            logging.error(f"Mail queue full; dropping {description} for {recipient}")
+            return False
+        return True
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stop(self, timeout=MAIL_DRAIN_TIMEOUT):
+        """Send what is queued (up to timeout seconds), then stop the workers."""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._pid = None
+
+    def _connect(self):
+        username = self.username or os.environ.get("GMAIL_SENDER")
+        password = self.password or os.environ.get("GMAIL_APP_PASSWORD")
+
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.smtp_timeout)
+        try:
+            if self.use_tls:
+                conn.starttls()
+            if password:
+                conn.login(username, password)
+        except smtplib.SMTPAuthenticationError:
+            conn.close()
+            raise _Permanent("SMTP Authentication Error: Check your Gmail credentials or App Password.")
+        except Exception:
+            conn.close()
+            raise
+        self._count("connections")
+        return conn
+
+    @staticmethod
+    def _close(conn, polite=True):
+        if conn is None:
+            return
+        try:
+            if polite:
+                conn.quit()
+            else:
+                conn.close()
+        except Exception:
+            conn.close()
+
+    def _take_batch(self, timeout):
+        """Block for one message, then take whatever else is already queued."""
+        batch = [self._queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            try:
+                batch = self._take_batch(self.idle_timeout)
+            except queue.Empty:
+                # Idle: hand the connection back rather than let the server drop it
+                self._close(conn)
+                conn = None
+                continue
+
+            for item in batch:
+                if item is _STOP:
+                    self._close(conn)
+                    return
+                conn = self._deliver(conn, *item)
+
+    def _deliver(self, conn, sender, recipient, raw, description):
+        """Send one message, reconnecting and backing off as needed.
+
+        Returns the connection to keep using (None if it was lost).
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if conn is None:
+                    conn = self._connect()
+                conn.sendmail(sender, recipient, raw)
+                self._count("sent")
+                logging.info(f"{description} sent successfully to {recipient}")
+                return conn
+            except _Permanent as e:
+                logging.error(str(e))
+                break
+            except smtplib.SMTPRecipientsRefused:
+                logging.error(f"Recipient refused: {recipient}")
+                break
+            except smtplib.SMTPResponseException as e:
+                if not 400 <= e.smtp_code < 500:
+                    logging.error(f"Error sending {description} to {recipient}: {e.smtp_code} {e.smtp_error!r}")
+                    break
+                # Temporary rejection: the connection itself is still usable
+                error = e
+            except (smtplib.SMTPException, OSError) as e:
+                self._close(conn, polite=False)
+                conn = None
+                error = e
+
+            if attempt < self.max_attempts:
+                self._count("retries")
+                delay = min(self.retry_max_delay, self.retry_delay * 2 ** (attempt - 1))
+                logging.warning(f"Sending {description} to {recipient} failed ({error}); retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                logging.error(f"Error sending {description} to {recipient} after {attempt} attempts: {error}")
+
+        self._count("failed")
+        return conn
+
+
+dispatcher = MailDispatcher()
+
+
+@atexit.register
+def _drain_on_exit():
+    dispatcher.stop()
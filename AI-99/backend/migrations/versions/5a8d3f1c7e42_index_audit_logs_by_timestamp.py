@@ -0,0 +1,36 @@
+"""Index audit_logs by timestamp, overall and per user
+
+Revision ID: 5a8d3f1c7e42
+Revises: 9e2f4a6b8c31
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '5a8d3f1c7e42'
+down_revision = '9e2f4a6b8c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    if 'audit_logs' not in insp.get_table_names():
+        return
+    indexes = {i['name'] for i in insp.get_indexes('audit_logs')}
+
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        if 'ix_audit_logs_timestamp' not in indexes:
+            batch_op.create_index('ix_audit_logs_timestamp', ['timestamp'])
+        if 'ix_audit_logs_user_id_timestamp' not in indexes:
+            batch_op.create_index('ix_audit_logs_user_id_timestamp', ['user_id', 'timestamp'])
+
+
+def downgrade():
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_audit_logs_user_id_timestamp')
+        batch_op.drop_index('ix_audit_logs_timestamp')
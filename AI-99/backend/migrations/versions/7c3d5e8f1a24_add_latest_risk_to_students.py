@@ -0,0 +1,71 @@
+"""Add denormalized latest-risk columns to students and backfill them
+
+Revision ID: 7c3d5e8f1a24
+Revises: 4b1e9c7d2a10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '7c3d5e8f1a24'
+down_revision = '4b1e9c7d2a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    existing = {c['name'] for c in insp.get_columns('students')}
+    indexes = {i['name'] for i in insp.get_indexes('students')}
+
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        if 'latest_risk_score' not in existing:
+            batch_op.add_column(sa.Column('latest_risk_score', sa.Float(), nullable=True))
+        if 'latest_risk_tier' not in existing:
+            batch_op.add_column(sa.Column('latest_risk_tier', sa.String(length=20), nullable=True))
+        if 'latest_prediction_at' not in existing:
+            batch_op.add_column(sa.Column('latest_prediction_at', sa.DateTime(), nullable=True))
+        if 'latest_model_version' not in existing:
+            batch_op.add_column(sa.Column('latest_model_version', sa.String(length=64), nullable=True))
+
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        if 'ix_students_latest_risk_score' not in indexes:
+            batch_op.create_index('ix_students_latest_risk_score', ['latest_risk_score'])
+        if 'ix_students_latest_risk_tier' not in indexes:
+            batch_op.create_index('ix_students_latest_risk_tier', ['latest_risk_tier'])
+
+    # Backfill from each student's newest prediction (highest id)
+    latest = (
+        "(SELECT p.{col} FROM predictions p WHERE p.student_id = students.id "
+        "ORDER BY p.id DESC LIMIT 1)"
+    )
+    op.execute(
+        "UPDATE students SET "
+        f"latest_risk_score = {latest.format(col='risk_score')}, "
+        f"latest_prediction_at = {latest.format(col='created_at')}, "
+        f"latest_model_version = {latest.format(col='model_version')}"
+    )
+    op.execute(
+        "UPDATE students SET latest_risk_tier = CASE "
+        "WHEN latest_risk_score IS NULL THEN NULL "
+        "WHEN latest_risk_score >= 0.85 THEN 'Very High' "
+        "WHEN latest_risk_score >= 0.70 THEN 'High' "
+        "WHEN latest_risk_score >= 0.50 THEN 'Moderate' "
+        "WHEN latest_risk_score >= 0.30 THEN 'Low' "
+        "ELSE 'Minimal' END"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.drop_index('ix_students_latest_risk_tier')
+        batch_op.drop_index('ix_students_latest_risk_score')
+        batch_op.drop_column('latest_model_version')
+        batch_op.drop_column('latest_prediction_at')
+        batch_op.drop_column('latest_risk_tier')
+        batch_op.drop_column('latest_risk_score')
@@ -0,0 +1,33 @@
+"""Add feature_fingerprint to students for incremental batch scoring
+
+Revision ID: 9e2f4a6b8c31
+Revises: 7c3d5e8f1a24
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = '9e2f4a6b8c31'
+down_revision = '7c3d5e8f1a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    if 'feature_fingerprint' in {c['name'] for c in insp.get_columns('students')}:
+        return
+
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('feature_fingerprint', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.drop_column('feature_fingerprint')
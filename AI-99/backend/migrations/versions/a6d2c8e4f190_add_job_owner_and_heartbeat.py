@@ -0,0 +1,36 @@
+"""Record which process holds a job and when it last reported in
+
+Revision ID: a6d2c8e4f190
+Revises: f3b9d5c2a6e1
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2c8e4f190'
+down_revision = 'f3b9d5c2a6e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    insp = inspect(op.get_bind())
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    if 'jobs' not in insp.get_table_names():
+        return
+    columns = {c['name'] for c in insp.get_columns('jobs')}
+
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        if 'owner' not in columns:
+            batch_op.add_column(sa.Column('owner', sa.String(length=128), nullable=True))
+        if 'heartbeat_at' not in columns:
+            batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('owner')
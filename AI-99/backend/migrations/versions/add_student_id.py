@@ -1,3 +1,29 @@
 """add student_id column to students table
 
-Revision ID
+Revision ID: add_student_id
+Revises: 9876a5762856
+Create Date: 2025-12-07 16:57:26.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_student_id'
+down_revision = '9876a5762856'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('student_id', sa.String(length=50), nullable=True))
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.drop_column('student_id')
+    # ### end Alembic commands ###
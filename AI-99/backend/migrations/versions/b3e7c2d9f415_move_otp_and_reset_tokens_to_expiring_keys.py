@@ -0,0 +1,52 @@
+"""Move OTP and reset-token state from users to expiring_keys
+
+Revision ID: b3e7c2d9f415
+Revises: 5a8d3f1c7e42
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'b3e7c2d9f415'
+down_revision = '5a8d3f1c7e42'
+branch_labels = None
+depends_on = None
+
+USER_COLUMNS = ('otp_code', 'otp_expiry', 'reset_token', 'reset_token_expiry')
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+
+    # entrypoint.sh runs db.create_all() first, so the table may already exist
+    if 'expiring_keys' not in insp.get_table_names():
+        op.create_table(
+            'expiring_keys',
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('value', sa.String(length=255), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('key')
+        )
+        op.create_index('ix_expiring_keys_expires_at', 'expiring_keys', ['expires_at'])
+
+    # Outstanding codes are not carried over; they expire within minutes anyway
+    existing = {c['name'] for c in insp.get_columns('users')}
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        for column in USER_COLUMNS:
+            if column in existing:
+                batch_op.drop_column(column)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('otp_code', sa.String(length=6), nullable=True))
+        batch_op.add_column(sa.Column('otp_expiry', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('reset_token', sa.String(length=256), nullable=True))
+        batch_op.add_column(sa.Column('reset_token_expiry', sa.DateTime(), nullable=True))
+
+    op.drop_index('ix_expiring_keys_expires_at', table_name='expiring_keys')
+    op.drop_table('expiring_keys')
@@ -0,0 +1,49 @@
+"""Add indexes for the columns routes filter, join and sort on
+
+Revision ID: d41f6a2b8c57
+Revises: b3e7c2d9f415
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6a2b8c57'
+down_revision = 'b3e7c2d9f415'
+branch_labels = None
+depends_on = None
+
+# (table, index name, columns); check_query_plans.py lists the queries each one serves
+INDEXES = [
+    ('predictions', 'ix_predictions_student_id_created_at', ['student_id', 'created_at']),
+    ('predictions', 'ix_predictions_created_at', ['created_at']),
+    ('counseling_sessions', 'ix_counseling_sessions_student_id_created_at', ['student_id', 'created_at']),
+    ('counseling_sessions', 'ix_counseling_sessions_teacher_id_follow_up_at', ['teacher_id', 'follow_up_at']),
+    ('counseling_sessions', 'ix_counseling_sessions_follow_up_at', ['follow_up_at']),
+    ('students', 'ix_students_user_id', ['user_id']),
+    ('teacher_details', 'ix_teacher_details_user_id', ['user_id']),
+    ('raw_students', 'ix_raw_students_student_id', ['student_id']),
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    tables = set(insp.get_table_names())
+
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    for table, name, columns in INDEXES:
+        if table not in tables:
+            continue
+        if name in {i['name'] for i in insp.get_indexes(table)}:
+            continue
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    for table, name, _ in reversed(INDEXES):
+        if name in {i['name'] for i in insp.get_indexes(table)}:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,58 @@
+"""Track follow-up reminders and the scheduler lease
+
+Revision ID: e8c4b1a7d2f9
+Revises: d41f6a2b8c57
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b1a7d2f9'
+down_revision = 'd41f6a2b8c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    tables = set(insp.get_table_names())
+
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    if 'scheduler_leases' not in tables:
+        op.create_table(
+            'scheduler_leases',
+            sa.Column('name', sa.String(length=64), nullable=False),
+            sa.Column('holder', sa.String(length=128), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+    if 'counseling_sessions' not in tables:
+        return
+    columns = {c['name'] for c in insp.get_columns('counseling_sessions')}
+    indexes = {i['name'] for i in insp.get_indexes('counseling_sessions')}
+    with op.batch_alter_table('counseling_sessions', schema=None) as batch_op:
+        if 'reminded_at' not in columns:
+            batch_op.add_column(sa.Column('reminded_at', sa.DateTime(), nullable=True))
+    # Follow-ups already past are not reminded about after the upgrade
+    if 'reminded_at' not in columns:
+        bind.execute(
+            sa.text("UPDATE counseling_sessions SET reminded_at = follow_up_at "
+                    "WHERE follow_up_at IS NOT NULL AND follow_up_at < :now"),
+            {"now": datetime.utcnow()}
+        )
+    if 'ix_counseling_sessions_reminded_at_follow_up_at' not in indexes:
+        op.create_index('ix_counseling_sessions_reminded_at_follow_up_at', 'counseling_sessions',
+                        ['reminded_at', 'follow_up_at'])
+
+
+def downgrade():
+    op.drop_index('ix_counseling_sessions_reminded_at_follow_up_at', table_name='counseling_sessions')
+    with op.batch_alter_table('counseling_sessions', schema=None) as batch_op:
+        batch_op.drop_column('reminded_at')
+    op.drop_table('scheduler_leases')
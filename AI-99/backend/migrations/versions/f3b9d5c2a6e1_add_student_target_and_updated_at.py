@@ -0,0 +1,45 @@
+"""Store students' known outcome and when each row last changed
+
+Revision ID: f3b9d5c2a6e1
+Revises: e8c4b1a7d2f9
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d5c2a6e1'
+down_revision = 'e8c4b1a7d2f9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = inspect(bind)
+    # entrypoint.sh runs db.create_all() first, which only creates missing tables
+    if 'students' not in insp.get_table_names():
+        return
+    columns = {c['name'] for c in insp.get_columns('students')}
+    indexes = {i['name'] for i in insp.get_indexes('students')}
+
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        if 'target' not in columns:
+            batch_op.add_column(sa.Column('target', sa.String(length=20), nullable=True))
+        if 'updated_at' not in columns:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # Existing rows count as changed now, so the first dataset snapshot takes them all
+    if 'updated_at' not in columns:
+        bind.execute(sa.text("UPDATE students SET updated_at = :now"), {"now": datetime.utcnow()})
+    if 'ix_students_updated_at' not in indexes:
+        op.create_index('ix_students_updated_at', 'students', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_students_updated_at', table_name='students')
+    with op.batch_alter_table('students', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('target')
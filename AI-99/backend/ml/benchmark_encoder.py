@@ -0,0 +1,91 @@
+"""Compare the pandas preprocessing path with the compiled feature encoder.
+
+Checks that encoding a dict gives exactly the bytes align_features +
+preprocessor.transform give, row by row and for the CSV rows as one
+batch, after a JSON round trip of the feature spec. Then reports p50/p99
+latency for a single-row encode:
+
+    python ml/benchmark_encoder.py [--rows 2000] [--repeats 500]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.encoder import FeatureEncoder, build_feature_spec
+from ml.preprocess import align_features
+from ml.registry import MODEL_PATH
+from ml.train_model import DATA_PATH
+
+# Raw values the routes can receive besides clean CSV rows
+EDGE_CASES = [
+    {},
+    {"attendance": " 75 ", "avg_score": "6.5e1", "debtor": "No", "grade": "B"},
+    {"attendance": None, "avg_score": float("nan"), "behavior_score": True},
+    {"attendance": "-0", "cu1_enrolled": "1_000", "course": "Unknown course"},
+    {" academic_score ": "88", "scholarship_holder": "yes", "unused": 1},
+]
+
+
+def _records(n, columns, rng):
+    df = pd.read_csv(DATA_PATH)
+    df.columns = df.columns.str.strip()
+    picked = df[columns].iloc[rng.integers(0, len(df), size=n)]
+    return picked.to_dict("records") + EDGE_CASES
+
+
+def _timings(fn, records, repeats):
+    samples = []
+    for i in range(repeats):
+        record = records[i % len(records)]
+        start = time.perf_counter()
+        fn(record)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=500)
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.model)
+    preprocessor = pipeline.named_steps["preprocessor"]
+    columns = list(preprocessor.feature_names_in_)
+    encoder = FeatureEncoder(json.loads(json.dumps(build_feature_spec(pipeline))))
+
+    def pandas_path(record):
+        return preprocessor.transform(align_features(pd.DataFrame([record]), columns))
+
+    records = _records(args.rows, columns, np.random.default_rng(0))
+    mismatched = [i for i, r in enumerate(records) if pandas_path(r).tobytes() != encoder.encode(r).tobytes()]
+    if mismatched:
+        print(f"MISMATCH on {len(mismatched)} rows, first: {records[mismatched[0]]}")
+        sys.exit(1)
+    # Edge cases mix key spellings, which pandas cannot put in one frame
+    rows = records[:-len(EDGE_CASES)]
+    expected = preprocessor.transform(align_features(pd.DataFrame(rows), columns))
+    if expected.tobytes() != encoder.encode_many(rows).tobytes():
+        print("MISMATCH on the batch encode")
+        sys.exit(1)
+    print(f"Encoded vectors identical on {len(records)} rows")
+
+    pd50, pd99 = _timings(pandas_path, records, args.repeats)
+    en50, en99 = _timings(encoder.encode, records, args.repeats)
+    print(f"{'':>8} {'p50':>9} {'p99':>9}  (ms per row)")
+    print(f"{'pandas':>8} {pd50:>9.3f} {pd99:>9.3f}")
+    print(f"{'encoder':>8} {en50:>9.3f} {en99:>9.3f}")
+    print(f"Speedup at p50: {pd50 / en50:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
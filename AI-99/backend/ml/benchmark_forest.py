@@ -0,0 +1,81 @@
+"""Compare sklearn's predict_proba with the compiled forest evaluator.
+
+Checks that both give identical probabilities, then reports p50/p99
+latency per call for 1, 100 and 10k rows:
+
+    python ml/benchmark_forest.py [--repeats 200]
+"""
+import os
+import sys
+import time
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.forest import CompiledForest
+from ml.registry import MODEL_PATH
+from ml.train_model import DATA_PATH
+
+BATCH_SIZES = [1, 100, 10000]
+
+
+def _rows(preprocessor, n, rng):
+    df = pd.read_csv(DATA_PATH)
+    df.columns = df.columns.str.strip()
+    base = preprocessor.transform(df[list(preprocessor.feature_names_in_)])
+    if hasattr(base, "toarray"):
+        base = base.toarray()
+    picked = base[rng.integers(0, len(base), size=n)]
+    # Jitter so rows land on both sides of split thresholds
+    return picked + rng.normal(0, 0.25, size=picked.shape)
+
+
+def _timings(fn, X, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.model)
+    preprocessor = pipeline.named_steps["preprocessor"]
+    classifier = pipeline.named_steps["classifier"]
+
+    start = time.perf_counter()
+    forest = CompiledForest.from_estimator(classifier)
+    print(f"Compiled {forest.n_trees} trees, {len(forest.feature)} nodes, "
+          f"depth {forest.max_depth} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    X_check = _rows(preprocessor, 20000, rng)
+    expected = classifier.predict_proba(X_check)
+    actual = forest.predict_proba(X_check)
+    if not np.array_equal(expected, actual):
+        print(f"MISMATCH: max abs diff {np.abs(expected - actual).max():.3e}")
+        sys.exit(1)
+    print(f"Probabilities identical on {len(X_check)} rows")
+
+    print(f"{'rows':>6} {'sklearn p50':>12} {'p99':>9} {'compiled p50':>13} {'p99':>9}  (ms)")
+    for n in BATCH_SIZES:
+        X = _rows(preprocessor, n, rng)
+        # 10k-row calls are slow under sklearn; fewer repeats keep the run short
+        repeats = max(5, args.repeats // 20) if n >= 10000 else args.repeats
+        sk50, sk99 = _timings(classifier.predict_proba, X, repeats)
+        cf50, cf99 = _timings(forest.predict_proba, X, repeats)
+        print(f"{n:>6} {sk50:>12.3f} {sk99:>9.3f} {cf50:>13.3f} {cf99:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
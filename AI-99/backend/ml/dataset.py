@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import fcntl
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select, or_, String
+
+# `python ml/dataset.py` puts ml/ rather than backend/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Student
+from ml.preprocess import BOOL_MAP, STUDENT_SCHEMA
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Snapshot directory: parts/, manifests/ and the CURRENT pointer
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join(BASE_DIR, "datasets"))
+
+# Rows fetched from the server-side cursor and written as one Parquet row group
+FETCH_SIZE = int(os.getenv("DATASET_FETCH_SIZE", 5000))
+
+# Rows changed in the last this-many seconds wait for the next build, so a
+# transaction still open with an earlier updated_at is not skipped
+WATERMARK_LAG = float(os.getenv("DATASET_WATERMARK_LAG", 60))
+
+# Parts a snapshot grows to before the next build rewrites it as one base part
+MAX_PARTS = int(os.getenv("DATASET_MAX_PARTS", 20))
+
+# Manifests kept; parts none of them reference are deleted
+KEEP_VERSIONS = int(os.getenv("DATASET_KEEP_VERSIONS", 5))
+
+LABEL = "Target"
+
+
+class DatasetError(Exception):
+    pass
+
+
+def _number(value):
+    # The yes/no flags are stored as text; the model reads them as 0/1
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).strip().lower()
+    if value in BOOL_MAP:
+        return BOOL_MAP[value]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _columns(pa):
+    """(name, column, Arrow type, converter) for every column a snapshot stores."""
+    text = pa.dictionary(pa.int32(), pa.string())
+    columns = [
+        ("id", Student.id, pa.int64(), None),
+        ("updated_at", Student.updated_at, pa.timestamp("us"), None),
+    ]
+    for name, kind in STUDENT_SCHEMA.items():
+        column = getattr(Student, name)
+        if kind == "category":
+            columns.append((name, column, text, None))
+        else:
+            columns.append((name, column, pa.float64(), _number if isinstance(column.type, String) else None))
+    columns.append((LABEL, Student.target, text, None))
+    return columns
+
+
+def _to_table(chunk, columns, schema, pa):
+    arrays = []
+    for (name, _, arrow_type, convert), values in zip(columns, zip(*chunk)):
+        if convert is not None:
+            values = [convert(v) for v in values]
+        if pa.types.is_dictionary(arrow_type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=arrow_type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _write_part(path, stmt, columns, fetch_size, pa, pq):
+    """Stream stmt's rows into a Parquet file; returns (rows written, last row)."""
+    schema = pa.schema([(name, arrow_type) for name, _, arrow_type, _ in columns])
+    rows, last = 0, None
+    with db.engine.connect() as conn:
+        result = conn.execute(stmt.execution_options(stream_results=True, yield_per=fetch_size))
+        try:
+            with pq.ParquetWriter(path, schema) as writer:
+                # One row group per fetch
+                for chunk in result.partitions(fetch_size):
+                    writer.write_table(_to_table(chunk, columns, schema, pa))
+                    rows += len(chunk)
+                    last = chunk[-1]
+        finally:
+            result.close()
+    return rows, last
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(directory=DATASET_DIR, version=None):
+    """The manifest of `version`, by default the CURRENT one; None if there is none."""
+    if version is None:
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+    with open(os.path.join(directory, "manifests", f"{version}.json")) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _locked(directory):
+    # One build at a time per directory, across processes
+    with open(os.path.join(directory, ".lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _prune(directory, keep):
+    manifests_dir = os.path.join(directory, "manifests")
+    parts_dir = os.path.join(directory, "parts")
+    # Version names sort in watermark order
+    versions = sorted(name[:-len(".json")] for name in os.listdir(manifests_dir) if name.endswith(".json"))
+    kept = versions[-max(1, keep):]
+    for version in versions[:-max(1, keep)]:
+        os.remove(os.path.join(manifests_dir, f"{version}.json"))
+
+    referenced = set()
+    for version in kept:
+        referenced.update(p["file"] for p in read_manifest(directory, version)["parts"])
+    for name in os.listdir(parts_dir):
+        if name not in referenced:
+            os.remove(os.path.join(parts_dir, name))
+
+
+def build_snapshot(directory=DATASET_DIR, full=False, fetch_size=FETCH_SIZE, lag=WATERMARK_LAG,
+                   max_parts=MAX_PARTS, keep=KEEP_VERSIONS):
+    """Write or extend the training snapshot of the students table; returns its manifest.
+
+    Rows are read in (updated_at, id) order through a server-side cursor
+    and written `fetch_size` at a time as typed Arrow columns: features as
+    float64 or dictionary-encoded strings, the label (students.target) as
+    a dictionary-encoded "Target". The newest (updated_at, id) covered is
+    the watermark. Later builds read only rows past it, labelled or not,
+    and append them as a delta part; load_snapshot() lets the newest copy of a
+    row win. A build writes a new base part instead when there is no
+    snapshot yet, when `full` is set, when the columns have changed or
+    when the snapshot has `max_parts` parts. Only a base part drops
+    students deleted since the last one.
+
+    Parts are immutable and every version has its own manifest, so a
+    training run reading an older version is unaffected by a build. Needs
+    an app context; raises DatasetError when there are no labelled
+    students. pyarrow is imported here, so only callers that build or
+    read snapshots need it.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _columns(pa)
+    signature = [[name, str(arrow_type)] for name, _, arrow_type, _ in columns]
+    parts_dir = os.path.join(directory, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    os.makedirs(os.path.join(directory, "manifests"), exist_ok=True)
+
+    with _locked(directory):
+        current = read_manifest(directory)
+        if full or current is None or current["columns"] != signature or len(current["parts"]) >= max_parts:
+            current = None
+        cutoff = datetime.utcnow() - timedelta(seconds=lag)
+
+        stmt = (
+            select(*[column for _, column, _, _ in columns])
+            .where(Student.updated_at <= cutoff)
+            .order_by(Student.updated_at, Student.id)
+        )
+        if current is None:
+            kind = "base"
+            stmt = stmt.where(Student.target.isnot(None))
+            # The newest row of any kind, so unlabelled rows already covered are not read again
+            with db.engine.connect() as conn:
+                newest = conn.execute(
+                    select(Student.updated_at, Student.id)
+                    .where(Student.updated_at <= cutoff)
+                    .order_by(Student.updated_at.desc(), Student.id.desc())
+                    .limit(1)
+                ).first()
+        else:
+            # Keyset past the watermark; unlabelled rows too, so a cleared label replaces the old one
+            kind = "delta"
+            since = datetime.fromisoformat(current["watermark"]["updated_at"])
+            since_id = current["watermark"]["id"]
+            newest = None
+            stmt = stmt.where(
+                Student.updated_at >= since,
+                or_(Student.updated_at > since, Student.id > since_id),
+            )
+
+        tmp_path = os.path.join(parts_dir, f"{kind}.parquet.tmp")
+        try:
+            rows, last = _write_part(tmp_path, stmt, columns, fetch_size, pa, pq)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if not rows:
+            os.remove(tmp_path)
+            if current is None:
+                raise DatasetError("No labelled students to build a dataset from")
+            return current
+
+        last = newest or last
+        watermark = {"updated_at": last.updated_at.isoformat(), "id": last.id}
+        version = f"{last.updated_at:%Y%m%dT%H%M%S%f}-{last.id:010d}"
+        part = f"{kind}-{version}.parquet"
+        os.replace(tmp_path, os.path.join(parts_dir, part))
+
+        manifest = {
+            "version": version,
+            "watermark": watermark,
+            "parts": (current["parts"] if current else []) + [{"file": part, "rows": rows}],
+            "columns": signature,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        _write_json(os.path.join(directory, "manifests", f"{version}.json"), manifest)
+        # Written last: readers see the new version only once all of it is in place
+        tmp_path = os.path.join(directory, "CURRENT.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(directory, "CURRENT"))
+
+        _prune(directory, keep)
+        return manifest
+
+
+def load_snapshot(path=DATASET_DIR):
+    """Read a snapshot into a DataFrame of float64 and categorical columns.
+
+    `path` is a snapshot directory (its CURRENT version) or a manifest
+    file. The parts are concatenated as Arrow tables. The last copy of each
+    student is kept, students without a label are dropped, and only then
+    is the result converted, so no object-dtype column is ever built.
+    df.attrs["dataset"] is the version read.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.compute as pc
+
+    if os.path.isdir(path):
+        directory = path
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise DatasetError(f"No dataset snapshot in {directory}; run ml/dataset.py first")
+    else:
+        directory = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+        with open(path) as f:
+            manifest = json.load(f)
+
+    table = pa.concat_tables([
+        pq.read_table(os.path.join(directory, "parts", p["file"])) for p in manifest["parts"]
+    ]).unify_dictionaries()
+
+    ids = table.column("id").to_numpy()
+    # First occurrence in reverse order is the newest copy of each id
+    _, newest = np.unique(ids[::-1], return_index=True)
+    if len(newest) < len(ids):
+        table = table.take(np.sort(len(ids) - 1 - newest))
+    table = table.filter(pc.is_valid(table.column(LABEL)))
+
+    df = table.to_pandas()
+    df.attrs["dataset"] = manifest["version"]
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write or extend the training dataset snapshot from the database")
+    parser.add_argument("--dir", default=DATASET_DIR)
+    parser.add_argument("--full", action="store_true", help="rewrite the snapshot instead of appending changed rows")
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        manifest = build_snapshot(args.dir, full=args.full)
+    print(f"Dataset {manifest['version']} in {args.dir}: {len(manifest['parts'])} part(s), "
+          f"{manifest['parts'][-1]['rows']} rows in the newest")
@@ -0,0 +1,249 @@
+import os
+import json
+import math
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from ml.preprocess import BOOL_MAP, BOOL_COLS, CLIP_BOUNDS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_SPEC_PATH = os.getenv("FEATURE_SPEC_PATH", os.path.join(BASE_DIR, "feature_spec.json"))
+
+SPEC_FORMAT = 1
+
+
+def _steps(transformer):
+    if isinstance(transformer, Pipeline):
+        return [step for _, step in transformer.steps if step not in (None, "passthrough")]
+    return [transformer]
+
+
+def _imputer_fill(imputer):
+    if imputer.add_indicator:
+        raise ValueError("SimpleImputer with add_indicator is not supported")
+    if not (isinstance(imputer.missing_values, float) and math.isnan(imputer.missing_values)):
+        raise ValueError("Only NaN missing_values are supported")
+    fill = list(imputer.statistics_)
+    if any(isinstance(v, float) and math.isnan(v) for v in fill):
+        raise ValueError("Imputer dropped an all-missing column")
+    return fill
+
+
+def _numeric_block(name, columns, steps):
+    block = {"name": name, "kind": "numeric", "columns": columns, "fill": None, "mean": None, "scale": None}
+    for step in steps:
+        if isinstance(step, SimpleImputer) and block["fill"] is None and block["mean"] is None:
+            block["fill"] = [float(v) for v in _imputer_fill(step)]
+        elif isinstance(step, StandardScaler) and block["mean"] is None:
+            if getattr(step, "mean_", None) is not None:
+                block["mean"] = step.mean_.tolist()
+            if getattr(step, "scale_", None) is not None:
+                block["scale"] = step.scale_.tolist()
+        else:
+            raise ValueError(f"Unsupported step in {name!r}: {type(step).__name__}")
+    return block
+
+
+def _onehot_block(name, columns, steps):
+    *head, ohe = steps
+    fill = None
+    if len(head) > 1 or (head and not isinstance(head[0], SimpleImputer)):
+        raise ValueError(f"Unsupported steps before OneHotEncoder in {name!r}")
+    if head:
+        fill = [v.item() if hasattr(v, "item") else v for v in _imputer_fill(head[0])]
+    if ohe.drop is not None or ohe.handle_unknown != "ignore":
+        raise ValueError("OneHotEncoder must use drop=None and handle_unknown='ignore'")
+    if getattr(ohe, "_infrequent_enabled", False):
+        raise ValueError("OneHotEncoder infrequent categories are not supported")
+    return {
+        "name": name,
+        "kind": "onehot",
+        "columns": columns,
+        "fill": fill,
+        "categories": [[c.item() if hasattr(c, "item") else c for c in cats] for cats in ohe.categories_],
+    }
+
+
+def build_feature_spec(pipeline):
+    """Describe a fitted preprocessor as plain JSON-serializable data.
+
+    Records the input column order, per-block imputer fills, scaler
+    parameters and one-hot vocabularies, in the ColumnTransformer's output
+    order. Raises ValueError for transformers the encoder cannot reproduce.
+    """
+    prep = pipeline.named_steps["preprocessor"]
+    columns = [str(c) for c in prep.feature_names_in_]
+
+    blocks = []
+    for name, transformer, cols in prep.transformers_:
+        if transformer == "drop" or len(cols) == 0:
+            continue
+        if transformer == "passthrough":
+            raise ValueError(f"Passthrough columns are not supported ({name!r})")
+        cols = [columns[c] if isinstance(c, (int, np.integer)) else str(c) for c in cols]
+        steps = _steps(transformer)
+        if steps and isinstance(steps[-1], OneHotEncoder):
+            blocks.append(_onehot_block(name, cols, steps))
+        else:
+            blocks.append(_numeric_block(name, cols, steps))
+
+    spec = {
+        "format": SPEC_FORMAT,
+        "columns": columns,
+        # align_features fills absent columns with 0
+        "defaults": {c: 0 for c in columns},
+        "blocks": blocks,
+        "n_features_out": len(prep.get_feature_names_out()),
+    }
+    width = sum(
+        len(b["columns"]) if b["kind"] == "numeric" else sum(len(c) for c in b["categories"])
+        for b in blocks
+    )
+    if width != spec["n_features_out"]:
+        raise ValueError(f"Spec describes {width} outputs, preprocessor produces {spec['n_features_out']}")
+    return spec
+
+
+def save_feature_spec(spec, path=FEATURE_SPEC_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(spec, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_feature_spec(path=FEATURE_SPEC_PATH):
+    with open(path, "r") as f:
+        spec = json.load(f)
+    if spec.get("format") != SPEC_FORMAT:
+        raise ValueError(f"Unsupported feature spec format: {spec.get('format')}")
+    return spec
+
+
+def _parse_number(text):
+    """pd.to_numeric's reading of one stripped string, or None if it rejects it."""
+    # float() also takes digit separators and non-ASCII digits; pandas does not
+    if not text.isascii() or "_" in text:
+        return None
+    try:
+        return float(int(text))
+    except ValueError:
+        pass
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    # "nan" parses for float() but not for pandas; both end up as 0
+    return None if math.isnan(value) else value
+
+
+def coerce_value(column, value):
+    """The number align_features leaves in `column` for one raw value."""
+    if isinstance(value, str):
+        value = value.strip()
+        parsed = _parse_number(value)
+        if parsed is not None:
+            value = parsed
+    if column in BOOL_COLS and not isinstance(value, float):
+        mapped = BOOL_MAP.get(str(value).lower())
+        if mapped is not None:
+            value = mapped
+    if isinstance(value, (bool, np.bool_)):
+        value = float(value)
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        value = float(value)
+        if math.isnan(value):
+            value = 0.0
+    else:
+        return 0.0
+
+    bounds = CLIP_BOUNDS.get(column)
+    if bounds is not None:
+        lower, upper = bounds
+        if lower is not None and value < lower:
+            value = float(lower)
+        if upper is not None and value > upper:
+            value = float(upper)
+    return value
+
+
+class FeatureEncoder:
+    """Turns raw feature dicts straight into the preprocessor's output rows.
+
+    Built from a feature spec (see build_feature_spec), it reproduces
+    align_features followed by preprocessor.transform bit for bit without
+    building a DataFrame: values are coerced the way the pandas path does,
+    then imputed, scaled and one-hot encoded with the fitted parameters.
+    """
+
+    def __init__(self, spec):
+        self.columns = list(spec["columns"])
+        self.defaults = dict(spec["defaults"])
+        self.n_features_out = spec["n_features_out"]
+        self._numeric = []
+        self._onehot = []
+
+        offset = 0
+        for block in spec["blocks"]:
+            cols = block["columns"]
+            if block["kind"] == "numeric":
+                self._numeric.append((
+                    cols,
+                    offset,
+                    np.asarray(block["fill"], dtype=np.float64) if block["fill"] is not None else None,
+                    np.asarray(block["mean"], dtype=np.float64) if block["mean"] is not None else None,
+                    np.asarray(block["scale"], dtype=np.float64) if block["scale"] is not None else None,
+                ))
+                offset += len(cols)
+            else:
+                # (column, imputer fill, first output index, {category: position})
+                for j, (col, cats) in enumerate(zip(cols, block["categories"])):
+                    fill = block["fill"][j] if block["fill"] is not None else None
+                    self._onehot.append((col, fill, offset, {c: i for i, c in enumerate(cats)}))
+                    offset += len(cats)
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        return cls(build_feature_spec(pipeline))
+
+    def _coerced(self, record):
+        if any(isinstance(k, str) and k != k.strip() for k in record):
+            record = {k.strip() if isinstance(k, str) else k: v for k, v in record.items()}
+        values = {c: coerce_value(c, record.get(c, self.defaults[c])) for c in self.columns}
+        # preprocessor.transform rejects these too
+        if any(math.isinf(v) for v in values.values()):
+            raise ValueError("Input X contains infinity or a value too large for dtype('float64').")
+        return values
+
+    def encode_many(self, records):
+        """One output row per input dict, shaped (len(records), n_features_out)."""
+        rows = [self._coerced(r) for r in records]
+        out = np.zeros((len(rows), self.n_features_out), dtype=np.float64)
+
+        for cols, offset, fill, mean, scale in self._numeric:
+            block = np.array([[row[c] for c in cols] for row in rows], dtype=np.float64)
+            block = block.reshape(len(rows), len(cols))
+            if fill is not None:
+                missing = np.isnan(block)
+                if missing.any():
+                    block[missing] = np.broadcast_to(fill, block.shape)[missing]
+            # Same in-place operations as StandardScaler.transform
+            if mean is not None:
+                block -= mean
+            if scale is not None:
+                block /= scale
+            out[:, offset:offset + len(cols)] = block
+
+        for col, fill, offset, vocabulary in self._onehot:
+            for i, row in enumerate(rows):
+                value = row[col]
+                if fill is not None and math.isnan(value):
+                    value = fill
+                index = vocabulary.get(value)
+                if index is not None:
+                    out[i, offset + index] = 1.0
+        return out
+
+    def encode(self, record):
+        """A single dict as a (1, n_features_out) matrix."""
+        return self.encode_many([record])
@@ -1,33 +1,194 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
 import shap
 import pandas as pd
 import numpy as np
+from ml.registry import registry
 
-def explain_prediction(model, X_sample):
+# Max cached explanations per process; 0 disables the cache
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", 2048))
+
+_explainer_lock = threading.Lock()
+_explainer = None  # (version, id(classifier), TreeExplainer)
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def get_explainer(classifier, version=None):
+    """TreeExplainer for classifier, built once per model version.
+
+    Without a version a fresh explainer is built, as before.
+    """
+    global _explainer
+    if version is None:
+        return shap.TreeExplainer(classifier)
+
+    key = (version, id(classifier))
+    cached = _explainer
+    if cached is not None and cached[:2] == key:
+        return cached[2]
+
+    with _explainer_lock:
+        cached = _explainer
+        if cached is not None and cached[:2] == key:
+            return cached[2]
+        explainer = shap.TreeExplainer(classifier)
+        _explainer = (version, id(classifier), explainer)
+        return explainer
+
+
+def clear_cache():
+    """Drop the cached explainer and every cached explanation."""
+    global _explainer
+    with _explainer_lock:
+        _explainer = None
+    with _cache_lock:
+        _cache.clear()
+
+
+@registry.on_swap
+def _on_model_swap(old, new):
+    clear_cache()
+    if not registry.warm_in_background:
+        _warm_explainer(new.classifier, new.version)
+        return
+    # Build the new explainer off the request path so the first
+    # prediction after a retrain does not pay for the tree walk
+    threading.Thread(
+        target=_warm_explainer, args=(new.classifier, new.version), daemon=True
+    ).start()
+
+
+def _warm_explainer(classifier, version):
     try:
-        if isinstance(X_sample, pd.Series):
-            X_sample = X_sample.to_frame().T
+        get_explainer(classifier, version)
+    except Exception as e:
+        logging.warning(f"Background explainer build failed: {str(e)}")
+
+
+def _row_key(version, row):
+    digest = hashlib.blake2b(np.ascontiguousarray(row, dtype=np.float64).tobytes(), digest_size=16)
+    return (version, digest.hexdigest())
+
+
+def _cache_get(key):
+    with _cache_lock:
+        values = _cache.get(key)
+        if values is not None:
+            _cache.move_to_end(key)
+        return values
+
+
+def _cache_put(key, values):
+    with _cache_lock:
+        _cache[key] = values
+        _cache.move_to_end(key)
+        while len(_cache) > EXPLANATION_CACHE_SIZE:
+            _cache.popitem(last=False)
 
-        preprocessor = model.named_steps["preprocessor"]
-        classifier = model.named_steps["classifier"]
 
-        X_trans = preprocessor.transform(X_sample)
+def _class_values(shap_raw, class_index):
+    # shap<0.45 returns one array per class, newer versions a (rows, features, classes) array
+    if isinstance(shap_raw, list):
+        return np.asarray(shap_raw[class_index])
+    shap_raw = np.asarray(shap_raw)
+    if shap_raw.ndim == 3:
+        return shap_raw[:, :, class_index]
+    return shap_raw
 
-        feature_names = preprocessor.get_feature_names_out()
 
-        if hasattr(classifier, "predict_proba"):
-            explainer = shap.TreeExplainer(classifier)
-            shap_raw = explainer.shap_values(X_trans)
-            shap_values = shap_raw[1][0]
-        else:
-            explainer = shap.TreeExplainer(classifier)
-            shap_values = explainer.shap_values(X_trans)[0]
+def _compute_shap(classifier, X_trans, class_index, version):
+    explainer = get_explainer(classifier, version)
+    if hasattr(classifier, "predict_proba"):
+        return _class_values(explainer.shap_values(X_trans), class_index)
+    return np.asarray(explainer.shap_values(X_trans))
 
-        explanation = {
-            name: round(float(val), 3)
-            for name, val in zip(feature_names, shap_values)
-        }
 
-        return explanation
+def shap_matrix(classifier, X_trans, class_index=1, version=None):
+    """SHAP values for every row of an already-transformed matrix.
+
+    With a version, the explainer is reused and rows already explained for
+    that version come from the LRU cache; only the misses are sent to SHAP,
+    in one call.
+    """
+    X_trans = np.asarray(X_trans)
+    if version is None or EXPLANATION_CACHE_SIZE <= 0:
+        return _compute_shap(classifier, X_trans, class_index, version)
+
+    keys = [_row_key(version, row) for row in X_trans]
+    rows = [_cache_get(key) for key in keys]
+    missing = [i for i, values in enumerate(rows) if values is None]
+
+    if missing:
+        computed = _compute_shap(classifier, X_trans[missing], class_index, version)
+        for i, values in zip(missing, computed):
+            rows[i] = values.copy()
+            _cache_put(keys[i], rows[i])
+
+    return np.vstack(rows)
+
+
+def top_contributions(values, feature_names, k=5):
+    """Per row, the k features with the largest |shap| as [{"feature", "shap"}].
+
+    Only the selected k entries are materialised; the full feature dict is
+    never built.
+    """
+    values = np.round(np.asarray(values, dtype=float), 3)
+    if values.ndim == 1:
+        values = values.reshape(1, -1)
+    k = min(k, values.shape[1])
+    if k <= 0:
+        return [[] for _ in range(values.shape[0])]
+
+    magnitude = np.abs(values)
+    idx = np.argpartition(-magnitude, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(magnitude, idx, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(idx, order, axis=1)
+    top = np.take_along_axis(values, idx, axis=1)
+
+    return [
+        [{"feature": feature_names[j], "shap": float(v)} for j, v in zip(row_idx, row_vals)]
+        for row_idx, row_vals in zip(idx.tolist(), top.tolist())
+    ]
+
+
+def explain_batch(model, X, top_k=None, X_trans=None, version=None):
+    """Explain all rows of X at once.
+
+    Returns one entry per row: the full {feature: shap} dict, or with
+    top_k set, the top_k contributions list. Pass X_trans to reuse a
+    transform the caller already ran, and the model version to reuse the
+    cached explainer and explanations.
+    """
+    preprocessor = model.named_steps["preprocessor"]
+    classifier = model.named_steps["classifier"]
+
+    if X_trans is None:
+        X_trans = preprocessor.transform(X)
+    feature_names = list(preprocessor.get_feature_names_out())
+
+    values = shap_matrix(classifier, X_trans, version=version)
+
+    if top_k is not None:
+        return top_contributions(values, feature_names, top_k)
+
+    return [
+        {name: round(float(val), 3) for name, val in zip(feature_names, row)}
+        for row in values
+    ]
+
+
+def explain_prediction(model, X_sample, version=None, X_trans=None):
+    try:
+        if isinstance(X_sample, pd.Series):
+            X_sample = X_sample.to_frame().T
+
+        return explain_batch(model, X_sample, X_trans=X_trans, version=version)[0]
 
     except Exception as e:
         return {"error": "Explanation failed", "details": str(e)}
@@ -0,0 +1,140 @@
+import os
+import joblib
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FOREST_PATH = os.getenv("FOREST_PATH", os.path.join(BASE_DIR, "forest.joblib"))
+
+# Rows evaluated per step; bounds the (trees, rows) node and leaf arrays
+ROW_BLOCK = 1024
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    All trees share one set of arrays indexed by global node id. Leaves
+    point to themselves, so every row walks every tree in lockstep for
+    `max_depth` steps with plain NumPy gathers and no per-tree Python
+    loop. Probabilities match sklearn's predict_proba bit for bit: inputs
+    are compared as float32 like sklearn's trees, leaf values are
+    normalised the same way and trees are summed in the same order.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * node + went_left] is the next node
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_estimator(cls, forest):
+        estimators = getattr(forest, "estimators_", None)
+        if not estimators:
+            raise ValueError("Estimator is not a fitted tree ensemble")
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Multi-output forests are not supported")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        n_classes = len(forest.classes_)
+
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            node_ids = np.arange(n, dtype=np.intp)
+            is_leaf = tree.children_left == -1
+
+            feature = tree.feature.astype(np.intp)
+            feature[is_leaf] = 0
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+
+            features.append(feature)
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        children = np.stack([np.concatenate(rights), np.concatenate(lefts)], axis=1).ravel()
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            children=np.ascontiguousarray(children),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=forest.classes_,
+        )
+
+    def save(self, path=FOREST_PATH):
+        """Write the node arrays uncompressed, so load() can memory-map them."""
+        state = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "children": self.children,
+            "value": self.value,
+            "roots": self.roots,
+            "max_depth": self.max_depth,
+            "classes": self.classes_,
+        }
+        tmp_path = f"{path}.tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=FOREST_PATH, mmap_mode="r"):
+        """Read a saved forest. With mmap_mode the node arrays stay in the
+        page cache, shared by every process that maps the same file.
+        """
+        state = joblib.load(path, mmap_mode=mmap_mode)
+        for key, value in state.items():
+            # Plain ndarray views of the mapping skip np.memmap's per-call wrapping
+            if isinstance(value, np.memmap):
+                state[key] = value.view(np.ndarray)
+        return cls(**state)
+
+    def _leaves(self, X):
+        """Leaf node id reached in every tree, shaped (trees, rows)."""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_offsets = np.arange(n_rows, dtype=np.intp) * n_features
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            go_left = np.take(flat, row_offsets + np.take(self.feature, nodes)) <= np.take(self.threshold, nodes)
+            nodes = np.take(self.children, 2 * nodes + go_left)
+        return nodes
+
+    def predict_proba(self, X):
+        if hasattr(X, "toarray"):
+            X = X.toarray()
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        out = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start in range(0, X.shape[0], ROW_BLOCK):
+            block = X[start:start + ROW_BLOCK]
+            leaf_values = np.take(self.value, self._leaves(block), axis=0)
+            # Reducing over the leading axis adds trees strictly in order,
+            # as sklearn's accumulation does
+            out[start:start + ROW_BLOCK] = leaf_values.sum(axis=0)
+        out /= self.n_trees
+        return out
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
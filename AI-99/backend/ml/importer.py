@@ -1,11 +1,35 @@
 import os
 import json
+import logging
 import pandas as pd
+from sqlalchemy import bindparam
 from sqlalchemy.exc import SQLAlchemyError
 from models import RawStudent, Student, db
 
 COMMON_ID_FIELDS = ["student_id", "id", "student id", "studentid", "sid", "email"]
 
+# Rows read, prefetched and written per round-trip
+CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))
+
+BASIC_FIELDS = ("name", "full_name", "email", "age", "gender")
+
+ACADEMIC_FIELD_MAP = {
+    "curricular_units_1st_sem_enrolled": "cu1_enrolled",
+    "curricular_units_1st_sem_approved": "cu1_approved",
+    "curricular_units_1st_sem_grade": "cu1_grade",
+    "curricular_units_2nd_sem_enrolled": "cu2_enrolled",
+    "curricular_units_2nd_sem_approved": "cu2_approved",
+    "curricular_units_2nd_sem_grade": "cu2_grade",
+    "attendance": "attendance",
+    "avg_score": "avg_score",
+    "academic_score": "academic_score",
+}
+
+# CSV column -> Student text column, stored as stripped strings
+TEXT_FIELD_MAP = {
+    "target": "target",
+}
+
 
 def _normalize_key(key):
     return key.strip().lower().replace(" ", "_")
@@ -19,105 +43,144 @@ def _pick_student_id(row):
     return None
 
 
-def import_csv_file(app, csv_path, commit_every=200):
-    df = pd.read_csv(csv_path, dtype=object, keep_default_na=True)
-
-    # normalize column names
-    df = df.rename(columns=lambda c: _normalize_key(c))
-    df = df.where(pd.notnull(df), None)
-
-    total = len(df)
-    successes = 0
-    failures = 0
-    updated = 0
-    created = 0
-
-    academic_field_map = {
-        "curricular_units_1st_sem_enrolled": "cu1_enrolled",
-        "curricular_units_1st_sem_approved": "cu1_approved",
-        "curricular_units_1st_sem_grade": "cu1_grade",
-        "curricular_units_2nd_sem_enrolled": "cu2_enrolled",
-        "curricular_units_2nd_sem_approved": "cu2_approved",
-        "curricular_units_2nd_sem_grade": "cu2_grade",
-        "attendance": "attendance",
-        "avg_score": "avg_score",
-        "academic_score": "academic_score",
+def _coerce(model_attr, val):
+    try:
+        if model_attr.endswith("_grade") or model_attr in ("attendance", "avg_score"):
+            return float(val)
+        return int(val)
+    except Exception:
+        return None
+
+
+def _student_changes(row_dict):
+    """Column -> value updates a CSV row carries for an existing student."""
+    changes = {}
+    for fld in BASIC_FIELDS:
+        val = row_dict.get(_normalize_key(fld))
+        if val is not None and hasattr(Student, fld):
+            changes[fld] = val
+
+    for csv_key, model_attr in ACADEMIC_FIELD_MAP.items():
+        if csv_key in row_dict and hasattr(Student, model_attr):
+            val = row_dict[csv_key]
+            if val is not None:
+                changes[model_attr] = _coerce(model_attr, val)
+
+    for csv_key, model_attr in TEXT_FIELD_MAP.items():
+        val = row_dict.get(csv_key)
+        if val is not None and str(val).strip():
+            changes[model_attr] = str(val).strip()
+    return changes
+
+
+def _bulk_update_students(session, updates):
+    """One executemany UPDATE per distinct column set, keyed by primary key."""
+    table = Student.__table__
+    by_columns = {}
+    for student_pk, changes in updates.items():
+        by_columns.setdefault(tuple(sorted(changes)), []).append(
+            {"_pk": student_pk, **{f"_{col}": val for col, val in changes.items()}}
+        )
+
+    for columns, params in by_columns.items():
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("_pk"))
+            .values({col: bindparam(f"_{col}") for col in columns})
+        )
+        session.execute(stmt, params)
+
+
+def _import_chunk(session, chunk):
+    rows = chunk.to_dict("records")
+    raw_rows = []
+    sids = []
+    for row_dict in rows:
+        sid = _pick_student_id(row_dict)
+        raw_rows.append({"student_id": sid, "data": json.dumps(row_dict)})
+        if sid:
+            sids.append(sid)
+
+    # One IN (...) lookup for every student this chunk mentions
+    existing = {}
+    if sids:
+        existing = dict(
+            session.query(Student.student_id, Student.id)
+            .filter(Student.student_id.in_(set(sids)))
+            .all()
+        )
+
+    updates = {}
+    unmatched = 0
+    for row_dict, raw in zip(rows, raw_rows):
+        sid = raw["student_id"]
+        if not sid:
+            continue
+        student_pk = existing.get(sid)
+        if student_pk is None:
+            unmatched += 1
+            continue
+        changes = _student_changes(row_dict)
+        if changes:
+            # Later rows for the same student win, as with row-by-row setattr
+            updates.setdefault(student_pk, {}).update(changes)
+
+    session.execute(RawStudent.__table__.insert(), raw_rows)
+    if updates:
+        _bulk_update_students(session, updates)
+
+    matched = sum(1 for raw in raw_rows if raw["student_id"] in existing)
+    return len(raw_rows), matched, unmatched
+
+
+def iter_csv_chunks(csv_path, chunk_size=CHUNK_SIZE):
+    """Yield normalised DataFrame chunks of the CSV without loading it whole."""
+    for chunk in pd.read_csv(csv_path, dtype=object, keep_default_na=True, chunksize=chunk_size):
+        chunk = chunk.rename(columns=lambda c: _normalize_key(c))
+        yield chunk.astype(object).where(pd.notnull(chunk), None)
+
+
+def import_csv_file(app, csv_path, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream csv_path into raw_students and update matching students.
+
+    The file is read `chunk_size` rows at a time. Each chunk costs one
+    SELECT for the students it references, one bulk INSERT into
+    raw_students and one executemany UPDATE per changed column set, then a
+    commit. A failing chunk is rolled back and counted without stopping
+    the import. `progress(stats)` is called after every chunk.
+
+    Rows whose id matches no student are kept in raw_students only; a
+    Student needs a User account, which /api/students/import provisions.
+    """
+    stats = {
+        "total": 0,
+        "raw_saved": 0,
+        "failures": 0,
+        "students_updated": 0,
+        "students_unmatched": 0,
+        "chunks": 0,
     }
 
     with app.app_context():
         session = db.session
 
-        for idx, row in df.iterrows():
-            row_dict = row.to_dict()
-            sid = _pick_student_id(row_dict)
-
+        for chunk in iter_csv_chunks(csv_path, chunk_size):
+            stats["total"] += len(chunk)
             try:
-                # Save raw uploaded CSV row
-                raw = RawStudent(student_id=sid, data=json.dumps(row_dict))
-                session.add(raw)
-                successes += 1
-
-                if sid:
-                    # lookup student by student_id or email
-                    student = None
-
-                    if hasattr(Student, "student_id"):
-                        student = session.query(Student).filter_by(student_id=sid).first()
-
-                    if not student and hasattr(Student, "email"):
-                        student = session.query(Student).filter_by(email=sid).first()
-
-                    if student:
-                        # basic fields
-                        for fld in ("name", "full_name", "email", "age", "gender"):
-                            csv_key = _normalize_key(fld)
-                            val = row_dict.get(csv_key)
-                            if val is not None and hasattr(student, fld):
-                                setattr(student, fld, val)
-
-                        # academic fields
-                        for csv_key, model_attr in academic_field_map.items():
-                            if csv_key in row_dict and hasattr(student, model_attr):
-                                val = row_dict[csv_key]
-                                if val is not None:
-                                    try:
-                                        if model_attr.endswith("_grade") or model_attr in ("attendance", "avg_score"):
-                                            val = float(val)
-                                        else:
-                                            val = int(val)
-                                    except Exception:
-                                        val = None
-
-                                    setattr(student, model_attr, val)
-
-                        updated += 1
-
-                    else:
-                        # create new student record
-                        s_kwargs = {}
-                        if hasattr(Student, "student_id"):
-                            s_kwargs["student_id"] = sid
-                        if hasattr(Student, "name") and row_dict.get("name"):
-                            s_kwargs["name"] = row_dict.get("name")
-
-                        new_s = Student(**s_kwargs)
-                        session.add(new_s)
-                        created += 1
-
-                # periodic commit
-                if (idx + 1) % commit_every == 0:
-                    session.commit()
-
-            except SQLAlchemyError:
+                saved, updated, unmatched = _import_chunk(session, chunk)
+                session.commit()
+                stats["raw_saved"] += saved
+                stats["students_updated"] += updated
+                stats["students_unmatched"] += unmatched
+            except SQLAlchemyError as e:
                 session.rollback()
-                failures += 1
+                stats["failures"] += len(chunk)
+                logging.error(f"CSV import chunk {stats['chunks'] + 1} failed: {str(e)}")
 
-        session.commit()
+            stats["chunks"] += 1
+            if progress:
+                progress(dict(stats))
+            else:
+                logging.info(f"CSV import: {stats['total']} rows processed ({stats['chunks']} chunks)")
 
-    return {
-        "total": total,
-        "raw_saved": successes,
-        "failures": failures,
-        "students_created": created,
-        "students_updated": updated,
-    }
+    return stats
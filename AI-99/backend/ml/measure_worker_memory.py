@@ -0,0 +1,137 @@
+"""Measure per-worker memory with and without a preloaded, memory-mapped model.
+
+Forks N workers the way gunicorn does, has each one score a batch, then
+reads /proc/self/smaps_rollup (Linux) in every worker while all of them
+are still alive:
+
+    private  every worker loads model.pkl itself, without mmap
+    shared   the parent runs registry.preload() with mmap, then forks
+
+RSS counts shared pages in full for every process. PSS splits them among
+the processes sharing them, so the PSS total is the real footprint.
+
+    python ml/measure_worker_memory.py [--workers 4] [--model ml/model.pkl]
+
+Set INFERENCE_ENGINE=compiled to include the memory-mapped compiled forest.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import joblib
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.forest import CompiledForest
+from ml.preprocess import align_features, STUDENT_SCHEMA
+from ml.registry import ModelRegistry, MODEL_PATH, INFERENCE_ENGINE
+from ml.train_model import DATA_PATH
+
+SCORED_ROWS = 1000
+
+
+def _memory_kib():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def _score(loaded):
+    df = pd.read_csv(DATA_PATH)
+    df = pd.concat([df] * (SCORED_ROWS // len(df) + 1), ignore_index=True).head(SCORED_ROWS)
+    X = align_features(df, loaded.features, schema=STUDENT_SCHEMA, inplace=True)
+    loaded.predict_proba(loaded.preprocessor.transform(X))
+
+
+def _worker(mode, registry_kwargs, shared, ready_w, go_r, result_w):
+    if mode == "private":
+        loaded = ModelRegistry(mmap_mode=None, **registry_kwargs).reload()
+    else:
+        loaded = shared.get()
+    _score(loaded)
+
+    os.write(ready_w, b".")
+    os.read(go_r, 1)
+    os.write(result_w, (json.dumps(_memory_kib()) + "\n").encode())
+    os._exit(0)
+
+
+def run(mode, workers, registry_kwargs):
+    shared = None
+    if mode == "shared":
+        shared = ModelRegistry(mmap_mode="r", **registry_kwargs)
+        if shared.preload() is None:
+            raise SystemExit(f"No model at {registry_kwargs['model_path']}")
+    parent = _memory_kib()
+
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    result_r, result_w = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            _worker(mode, registry_kwargs, shared, ready_w, go_r, result_w)
+        pids.append(pid)
+
+    # Measure only once every worker has loaded and scored
+    for _ in range(workers):
+        os.read(ready_r, 1)
+    os.write(go_w, b"." * workers)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    os.close(result_w)
+
+    with os.fdopen(result_r) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return parent, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Written fresh so the shared run maps a forest that matches the model
+        forest_path = os.path.join(tmp, "forest.joblib")
+        pipeline = joblib.load(args.model)
+        CompiledForest.from_estimator(pipeline.named_steps["classifier"]).save(forest_path)
+        del pipeline
+        registry_kwargs = {
+            "model_path": args.model,
+            "meta_path": os.path.join(tmp, "model_meta.json"),
+            "spec_path": os.path.join(tmp, "feature_spec.json"),
+            "forest_path": forest_path,
+        }
+
+        print(f"{args.workers} workers, INFERENCE_ENGINE={INFERENCE_ENGINE}, model {args.model}")
+        print(f"{'mode':>8} {'parent RSS':>11} {'worker RSS':>11} {'worker PSS':>11} "
+              f"{'private':>9} {'PSS total':>10}  (MiB)")
+        for mode in ("private", "shared"):
+            # Each mode in its own child so the first run leaves nothing behind
+            pid = os.fork()
+            if pid:
+                os.waitpid(pid, 0)
+                continue
+            parent, results = run(mode, args.workers, registry_kwargs)
+            mib = lambda key: sum(r[key] for r in results) / len(results) / 1024
+            total = (parent["pss"] + sum(r["pss"] for r in results)) / 1024
+            print(f"{mode:>8} {parent['rss'] / 1024:>11.1f} {mib('rss'):>11.1f} {mib('pss'):>11.1f} "
+                  f"{mib('private'):>9.1f} {total:>10.1f}", flush=True)
+            os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,169 @@
 import pandas as pd
 import numpy as np
-
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+from pandas.api.types import is_numeric_dtype
+
+BOOL_MAP = {
+    "yes": 1, "no": 0,
+    "sim": 1, "nao": 0,
+    "s": 1, "n": 0,
+    "true": 1, "false": 0,
+    "1": 1, "0": 0
+}
+
+BOOL_COLS = [
+    "Debtor",
+    "Tuition fees up to date",
+    "Scholarship holder",
+    "Educational special needs",
+    "Daytime/evening attendance"
+]
+
+# column -> (lower, upper); None leaves that side open
+CLIP_BOUNDS = {
+    "Curricular units 1st sem (grade)": (0, 20),
+    "Curricular units 2nd sem (grade)": (0, 20),
+    "Curricular units 1st sem (evaluations)": (0, None),
+    "Curricular units 1st sem (approved)": (0, None),
+    "Curricular units 2nd sem (evaluations)": (0, None),
+    "Curricular units 2nd sem (approved)": (0, None),
+    "Unemployment rate": (0, 100),
+    "Inflation rate": (-10, 50),
+    "GDP": (0, None),
+}
+
+# Declared column types understood by clean_data(schema=...)
+COLUMN_TYPES = ("numeric", "bool", "category", "text")
+
+# Model features as train_model.py splits them for students.csv, where the
+# yes/no flags are stored as 0/1
+STUDENT_SCHEMA = {
+    "attendance": "numeric",
+    "avg_score": "numeric",
+    "assignments_completed": "numeric",
+    "behavior_score": "numeric",
+    "grade": "category",
+    "marital_status": "category",
+    "application_mode": "category",
+    "course": "category",
+    "cu1_enrolled": "numeric",
+    "cu1_approved": "numeric",
+    "scholarship_holder": "numeric",
+    "debtor": "numeric",
+    "tuition_fees_up_to_date": "numeric",
+    "academic_score": "numeric",
+}
+
+
+def _to_numeric(series):
+    if not is_numeric_dtype(series):
+        # Unparseable values become NaN and then 0, as align_features does
+        series = pd.to_numeric(series, errors="coerce")
+    return series.fillna(0) if series.hasnans else series
+
+
+def _to_bool(series):
+    if is_numeric_dtype(series):
+        return series.fillna(0) if series.hasnans else series
+    mapped = series.astype(str).str.strip().str.lower().map(BOOL_MAP)
+    return mapped.fillna(pd.to_numeric(series, errors="coerce")).fillna(0)
+
+
+def _to_labels(series):
+    # Strip each distinct value once instead of every row
+    codes, uniques = pd.factorize(series)
+    labels = pd.Index([str(u).strip() for u in uniques] + ["Unknown"], dtype=object)
+    return labels.take(np.where(codes < 0, len(uniques), codes))
+
+
+def _to_category(series):
+    return pd.Series(pd.Categorical(_to_labels(series)), index=series.index, name=series.name)
+
+
+def _to_text(series):
+    return pd.Series(_to_labels(series), index=series.index, name=series.name)
+
+
+_CONVERTERS = {
+    "numeric": _to_numeric,
+    "bool": _to_bool,
+    "category": _to_category,
+    "text": _to_text,
+}
+
+
+def _infer_column(series, col):
+    """The original per-column inference, for columns the schema does not declare."""
+    if series.dtype == object:
+        series = series.astype(str).str.strip()
+        try:
+            series = pd.to_numeric(series)
+        except (ValueError, TypeError):
+            pass
+
+    if col in BOOL_COLS:
+        series = series.astype(str).str.lower().map(BOOL_MAP).fillna(series)
+
+    if series.dtype in (np.int64, np.float64):
+        series = series.fillna(0)
+    elif series.dtype == object:
+        series = series.fillna("Unknown")
+    return series
+
+
+def clean_data(df: pd.DataFrame, schema=None, inplace=False) -> pd.DataFrame:
+    """Strip, type and fill every column, then apply CLIP_BOUNDS.
+
+    `schema` maps column names to one of COLUMN_TYPES. Declared columns
+    are converted once, straight to their type, so a value's result never
+    depends on the other rows: cleaning a frame chunk by chunk gives the
+    same values as cleaning it whole. Undeclared columns are inferred from
+    their contents as before. With inplace=True the caller's frame is
+    modified and returned instead of a shallow copy; either way only
+    converted columns are reallocated.
+    """
+    schema = schema or {}
+    unknown = set(schema.values()) - set(COLUMN_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown column type(s): {', '.join(sorted(unknown))}")
+
+    if not inplace:
+        df = df.copy(deep=False)
     df.columns = df.columns.str.strip()
 
     for col in df.columns:
-        if df[col].dtype == object:
-            df[col] = df[col].astype(str).str.strip()
+        series = df[col]
+        kind = schema.get(col)
+        cleaned = _CONVERTERS[kind](series) if kind else _infer_column(series, col)
+
+        bounds = CLIP_BOUNDS.get(col)
+        if bounds is not None:
+            cleaned = cleaned.clip(*bounds)
+
+        # Whole-column assignment replaces the array; the caller's is untouched
+        if cleaned is not series:
+            df[col] = cleaned
+
+    return df
 
-    for col in df.columns:
-        if df[col].dtype == object:
-            try:
-                df[col] = pd.to_numeric(df[col])
-            except:
-                pass
-
-    bool_map = {
-        "yes": 1, "no": 0,
-        "sim": 1, "nao": 0,
-        "s": 1, "n": 0,
-        "true": 1, "false": 0,
-        "1": 1, "0": 0
-    }
-
-    bool_cols = [
-        "Debtor",
-        "Tuition fees up to date",
-        "Scholarship holder",
-        "Educational special needs",
-        "Daytime/evening attendance"
-    ]
-
-    for col in bool_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.lower().map(bool_map).fillna(df[col])
-
-    numeric_cols = df.select_dtypes(include=["int64", "float64"]).columns
-    df[numeric_cols] = df[numeric_cols].fillna(0)
-
-    categorical_cols = df.select_dtypes(include=["object"]).columns
-    df[categorical_cols] = df[categorical_cols].fillna("Unknown")
-
-    grade_cols = [
-        "Curricular units 1st sem (grade)",
-        "Curricular units 2nd sem (grade)"
-    ]
-
-    for col in grade_cols:
-        if col in df.columns:
-            df[col] = df[col].clip(0, 20)
-
-    academic_cols = [
-        "Curricular units 1st sem (evaluations)",
-        "Curricular units 1st sem (approved)",
-        "Curricular units 2nd sem (evaluations)",
-        "Curricular units 2nd sem (approved)"
-    ]
-
-    for col in academic_cols:
-        if col in df.columns:
-            df[col] = df[col].clip(lower=0)
-
-    if "Unemployment rate" in df.columns:
-        df["Unemployment rate"] = df["Unemployment rate"].clip(0, 100)
-
-    if "Inflation rate" in df.columns:
-        df["Inflation rate"] = df["Inflation rate"].clip(-10, 50)
-
-    if "GDP" in df.columns:
-        df["GDP"] = df["GDP"].clip(lower=0)
 
+def align_features(df: pd.DataFrame, expected, schema=None, inplace=False) -> pd.DataFrame:
+    """clean_data, then exactly the `expected` columns, each coerced to a number.
+
+    Missing columns and values that do not parse as numbers become 0.
+    This is the reference path ml/encoder.py reproduces for single rows.
+    `schema` and `inplace` are passed on to clean_data.
+    """
+    # Columns the model does not use are dropped before cleaning, not after
+    wanted = set(expected)
+    used = [c for c in df.columns if str(c).strip() in wanted]
+    if len(used) < len(df.columns):
+        df, inplace = df[used], True
+    df = clean_data(df, schema=schema, inplace=inplace)
+    df = df.reindex(columns=expected, fill_value=0)
+    for col in expected:
+        series = df[col]
+        # Columns clean_data already made numeric need no second pass
+        if is_numeric_dtype(series) and not series.hasnans:
+            continue
+        df[col] = pd.to_numeric(series, errors="coerce").fillna(0)
     return df
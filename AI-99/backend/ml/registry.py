@@ -0,0 +1,268 @@
+import os
+import gc
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+import joblib
+from ml.forest import CompiledForest, FOREST_PATH
+from ml.encoder import FeatureEncoder, FEATURE_SPEC_PATH, load_feature_spec
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(BASE_DIR, "model.pkl"))
+PREPROCESSOR_PATH = os.getenv("PREPROCESSOR_PATH", os.path.join(BASE_DIR, "preprocess.pkl"))
+MODEL_META_PATH = os.getenv("MODEL_META_PATH", os.path.join(BASE_DIR, "model_meta.json"))
+
+# How often (seconds) a worker stats the artifact files to pick up a retrain
+CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", 2))
+
+# "sklearn" or "compiled" (ml/forest.py) for request-path probabilities
+INFERENCE_ENGINE = os.getenv("INFERENCE_ENGINE", "sklearn").lower()
+
+# Larger batches go to sklearn, which parallelises across trees
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_FOREST_MAX_ROWS", 1000))
+
+# joblib mmap_mode for model.pkl and forest.joblib; empty loads them into
+# private memory. Mapped arrays live in the page cache and are shared by
+# every process reading the same file.
+MMAP_MODE = os.getenv("MODEL_MMAP_MODE", "r") or None
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _read_metadata(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _expected_features(pipeline):
+    prep = pipeline.named_steps["preprocessor"]
+    if getattr(prep, "feature_names_in_", None) is not None:
+        return list(prep.feature_names_in_)
+    if getattr(pipeline, "feature_names_in_", None) is not None:
+        return list(pipeline.feature_names_in_)
+    return []
+
+
+def _compile_forest(classifier):
+    try:
+        return CompiledForest.from_estimator(classifier)
+    except (ValueError, AttributeError) as e:
+        logging.warning(f"Compiled inference unavailable, using sklearn: {str(e)}")
+        return None
+
+
+def _load_forest(path, mtime, mmap_mode):
+    """The compiled forest saved at train time, or None if it is missing or stale."""
+    forest_mtime = _mtime(path)
+    if forest_mtime is None or forest_mtime < mtime:
+        return None
+    try:
+        return CompiledForest.load(path, mmap_mode=mmap_mode)
+    except Exception as e:
+        logging.warning(f"Ignoring compiled forest {path}: {str(e)}")
+        return None
+
+
+def _load_encoder(pipeline, mtime, spec_path):
+    """FeatureEncoder from the spec written at train time, else derived from the pipeline."""
+    spec_mtime = _mtime(spec_path)
+    # Like model_meta.json, a spec older than model.pkl belongs to an earlier model
+    if spec_mtime is not None and spec_mtime >= mtime:
+        try:
+            return FeatureEncoder(load_feature_spec(spec_path))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring feature spec {spec_path}: {str(e)}")
+    try:
+        return FeatureEncoder.from_pipeline(pipeline)
+    except (ValueError, AttributeError) as e:
+        logging.warning(f"Feature encoder unavailable, using pandas preprocessing: {str(e)}")
+        return None
+
+
+class LoadedModel:
+    """One immutable load of model.pkl.
+
+    The preprocessor, classifier and version always come from the same
+    snapshot, so a request holding a reference keeps using a consistent
+    model even if a retrain swaps in a new one mid-request.
+    """
+
+    def __init__(self, pipeline, mtime, metadata=None, meta_mtime=None, forest=None, encoder=None):
+        self.pipeline = pipeline
+        self.preprocessor = pipeline.named_steps["preprocessor"]
+        self.classifier = pipeline.named_steps["classifier"]
+        self.features = _expected_features(pipeline)
+        self.classes = list(getattr(self.classifier, "classes_", []))
+        self.mtime = mtime
+        self.meta_mtime = meta_mtime
+        self.metadata = metadata or {}
+        if forest is None and INFERENCE_ENGINE == "compiled":
+            forest = _compile_forest(self.classifier)
+        self.forest = forest
+        # None when the preprocessor has steps ml/encoder.py cannot reproduce
+        self.encoder = encoder
+
+        # Only trust model_meta.json if it was written for this model file
+        if metadata and metadata.get("version") and meta_mtime is not None and meta_mtime >= mtime:
+            self.version = metadata["version"]
+        else:
+            self.version = f"v{datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M%S')}"
+
+    def with_metadata(self, metadata, meta_mtime):
+        return LoadedModel(self.pipeline, self.mtime, metadata, meta_mtime, self.forest, self.encoder)
+
+    def predict_proba(self, X_trans):
+        """Class probabilities for already-transformed rows, via the configured engine."""
+        if self.forest is not None and X_trans.shape[0] <= COMPILED_MAX_ROWS:
+            return self.forest.predict_proba(X_trans)
+        return self.classifier.predict_proba(X_trans)
+
+    def class_index(self, label="Dropout"):
+        return self.classes.index(label) if label in self.classes else None
+
+
+class ModelRegistry:
+    """Process-wide cache of the trained pipeline.
+
+    Each artifact is unpickled once per process. `get()` re-stats the
+    files at most every `check_interval` seconds and atomically swaps in
+    a new snapshot when model.pkl (or its metadata) changes on disk.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, meta_path=MODEL_META_PATH,
+                 preprocessor_path=PREPROCESSOR_PATH, check_interval=CHECK_INTERVAL,
+                 spec_path=FEATURE_SPEC_PATH, forest_path=FOREST_PATH, mmap_mode=MMAP_MODE):
+        self.model_path = model_path
+        self.spec_path = spec_path
+        self.forest_path = forest_path
+        self.mmap_mode = mmap_mode
+        # Swap listeners may defer work to a thread; preload() turns that off
+        self.warm_in_background = True
+        self.meta_path = meta_path
+        self.preprocessor_path = preprocessor_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._current = None
+        self._last_check = None
+        self._preprocessor = None
+        self._preprocessor_mtime = None
+        self._listeners = []
+
+    def get(self):
+        """Return the current LoadedModel, or None if no model is trained."""
+        last = self._last_check
+        if last is not None and time.monotonic() - last < self.check_interval:
+            return self._current
+        return self.reload(force=False)
+
+    def reload(self, force=True):
+        """Re-read the artifacts. With force=False only changed files are reloaded."""
+        with self._lock:
+            self._last_check = time.monotonic()
+            current = self._current
+
+            mtime = _mtime(self.model_path)
+            if mtime is None:
+                if current is not None:
+                    logging.warning(f"Model file {self.model_path} disappeared; keeping loaded version {current.version}")
+                return current
+
+            meta_mtime = _mtime(self.meta_path)
+            if not force and current is not None and current.mtime == mtime:
+                if current.meta_mtime != meta_mtime:
+                    self._swap(current.with_metadata(_read_metadata(self.meta_path), meta_mtime))
+                return self._current
+
+            try:
+                # Retrains replace the file rather than rewrite it, so an
+                # existing mapping keeps reading the old model intact
+                pipeline = joblib.load(self.model_path, mmap_mode=self.mmap_mode)
+            except Exception as e:
+                logging.error(f"Failed to load model from {self.model_path}: {str(e)}")
+                return current
+
+            if not (hasattr(pipeline, "named_steps")
+                    and "preprocessor" in pipeline.named_steps
+                    and "classifier" in pipeline.named_steps):
+                logging.error("Model is not a valid Pipeline with required steps.")
+                return current
+
+            encoder = _load_encoder(pipeline, mtime, self.spec_path)
+            forest = None
+            if INFERENCE_ENGINE == "compiled":
+                forest = _load_forest(self.forest_path, mtime, self.mmap_mode)
+            self._swap(LoadedModel(pipeline, mtime, _read_metadata(self.meta_path), meta_mtime,
+                                   forest=forest, encoder=encoder))
+            logging.info(f"Model {self._current.version} loaded from {self.model_path}")
+            return self._current
+
+    def preload(self):
+        """Load the model now, in a process about to fork workers.
+
+        Swap listeners run inline so no half-finished thread is forked, and
+        gc.freeze() keeps the collector from writing to (and so copying) the
+        model's pages in every worker. Workers then share the parent's
+        copy until a retrain swaps in a new one. Safe to call again to
+        pick up a retrain before forking fresh workers.
+        """
+        # Let a previously frozen model be collected once it is swapped out
+        gc.unfreeze()
+        self.warm_in_background = False
+        try:
+            loaded = self.reload(force=False)
+        finally:
+            self.warm_in_background = True
+        gc.collect()
+        gc.freeze()
+        return loaded
+
+    def preprocessor(self):
+        """The standalone preprocess.pkl artifact, loaded once per mtime."""
+        mtime = _mtime(self.preprocessor_path)
+        if mtime is None:
+            return None
+        if mtime != self._preprocessor_mtime:
+            with self._lock:
+                if mtime != self._preprocessor_mtime:
+                    try:
+                        loaded = joblib.load(self.preprocessor_path, mmap_mode=self.mmap_mode)
+                    except Exception as e:
+                        logging.error(f"Failed to load preprocessor: {str(e)}")
+                        loaded = None
+                    if loaded is not None and not hasattr(loaded, "feature_names_in_"):
+                        logging.warning("Preprocessor loaded but lacks feature_names_in_.")
+                        loaded = None
+                    self._preprocessor = loaded
+                    self._preprocessor_mtime = mtime
+        return self._preprocessor
+
+    def on_swap(self, fn):
+        """Register fn(old, new) to run whenever a new snapshot is installed."""
+        self._listeners.append(fn)
+        return fn
+
+    def _swap(self, new):
+        old = self._current
+        self._current = new
+        for fn in self._listeners:
+            try:
+                fn(old, new)
+            except Exception as e:
+                logging.error(f"Model swap listener failed: {str(e)}")
+
+
+registry = ModelRegistry()
+
+
+def get_model():
+    return registry.get()
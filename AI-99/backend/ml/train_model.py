@@ -1,14 +1,26 @@
 import os
+import sys
+import time
 import joblib
+import argparse
+import multiprocessing
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold, ParameterGrid
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.compose import ColumnTransformer
-from sklearn.metrics import classification_report
+from sklearn.metrics import classification_report, accuracy_score, f1_score
+
+# `python ml/train_model.py` puts ml/ rather than backend/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml.encoder import build_feature_spec, save_feature_spec, FEATURE_SPEC_PATH
+from ml.forest import CompiledForest, FOREST_PATH
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "students.csv")
@@ -34,7 +46,47 @@ FEATURES = [
     "academic_score"
 ]
 
+# Forest trained when no search is run; also the first search candidate
+DEFAULT_PARAMS = {
+    "n_estimators": 300,
+    "max_depth": 15,
+    "min_samples_split": 4,
+    "min_samples_leaf": 2,
+}
+
+# RandomForestClassifier parameters a search grid may vary
+SEARCH_PARAMS = ["n_estimators", "max_depth", "min_samples_split", "min_samples_leaf", "max_features"]
+
+# Candidates tried by search=True when no grid is given
+SEARCH_GRID = {
+    "n_estimators": [200, 300],
+    "max_depth": [10, 15, None],
+    "min_samples_split": [2, 4],
+    "min_samples_leaf": [1, 2],
+}
+
+# Cross-validation folds per candidate (fewer when a class has fewer rows)
+CV_FOLDS = int(os.getenv("TRAIN_CV_FOLDS", 5))
+
+# Search processes; 0 uses every core this process may run on
+SEARCH_WORKERS = int(os.getenv("TRAIN_SEARCH_WORKERS", 0))
+
+# Seconds after which no further fits start (0 = no limit)
+SEARCH_TIME_BUDGET = float(os.getenv("TRAIN_SEARCH_TIME_BUDGET", 0))
+
+# How the search processes start. forkserver children are forked from a
+# clean server process, not from a threaded app worker
+SEARCH_MP_CONTEXT = os.getenv("TRAIN_SEARCH_MP_CONTEXT", "forkserver")
+
+# Mean CV score the winner is picked by; accuracy is reported too
+SEARCH_SCORING = "f1_macro"
+
 def load_data(path=DATA_PATH):
+    # A snapshot directory or manifest written by ml/dataset.py
+    if os.path.isdir(path) or str(path).endswith(".json"):
+        from ml.dataset import load_snapshot
+        return load_snapshot(path)
+
     df = pd.read_csv(path)
     df.columns = df.columns.str.strip()
 
@@ -45,8 +97,9 @@ def load_data(path=DATA_PATH):
     return df
 
 def build_preprocessor(X):
-    cat_cols = [c for c in X.columns if X[c].dtype == "object"]
-    num_cols = [c for c in X.columns if X[c].dtype != "object"]
+    # Snapshots hold categoricals rather than object columns
+    num_cols = [c for c in X.columns if pd.api.types.is_numeric_dtype(X[c])]
+    cat_cols = [c for c in X.columns if c not in num_cols]
 
     num_pipe = Pipeline([
         ("imputer", SimpleImputer(strategy="median")),
@@ -63,7 +116,149 @@ def build_preprocessor(X):
         ("cat", cat_pipe, cat_cols)
     ])
 
-def train_and_save(path=DATA_PATH, model_path=MODEL_PATH):
+def build_classifier(params=None, n_jobs=-1):
+    return RandomForestClassifier(
+        **{**DEFAULT_PARAMS, **(params or {})},
+        class_weight="balanced",
+        random_state=42,
+        n_jobs=n_jobs
+    )
+
+def validate_grid(grid):
+    """Check a {param: [values]} search grid; returns it with every value a list."""
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError("grid must be a non-empty object of parameter lists")
+    unknown = [k for k in grid if k not in SEARCH_PARAMS]
+    if unknown:
+        raise ValueError(f"Cannot search {', '.join(unknown)}; allowed: {', '.join(SEARCH_PARAMS)}")
+    grid = {k: v if isinstance(v, list) else [v] for k, v in grid.items()}
+    if any(not v for v in grid.values()):
+        raise ValueError("Every grid parameter needs at least one value")
+    return grid
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Transformed folds, set once in each search process by _init_search_worker
+_search_folds = None
+
+def _init_search_worker(folds):
+    global _search_folds
+    _search_folds = folds
+
+def _score_candidate(params, fold):
+    """Fit one candidate on one cached fold; returns (accuracy, macro F1) on its validation part."""
+    X_fit, y_fit, X_val, y_val = _search_folds[fold]
+    # One core per fit; the pool provides the parallelism
+    clf = build_classifier(params, n_jobs=1).fit(X_fit, y_fit)
+    preds = clf.predict(X_val)
+    return accuracy_score(y_val, preds), f1_score(y_val, preds, average="macro")
+
+def search_hyperparameters(X, y, grid=None, folds=CV_FOLDS, workers=SEARCH_WORKERS,
+                           time_budget=SEARCH_TIME_BUDGET, progress=None):
+    """Cross-validated grid search over forest parameters on a process pool.
+
+    The preprocessor is fitted once per fold here, and every candidate is
+    scored on those cached arrays, which each process receives once. Fits
+    are queued candidate by candidate, so when `time_budget` seconds pass
+    the fits not yet started are dropped and the search picks among the
+    candidates scored on every fold (at least the first one).
+
+    progress(fraction, message) is called as fits finish. Returns the
+    winning parameters and a summary of the search.
+    """
+    started = time.monotonic()
+    candidates = list(ParameterGrid(validate_grid(grid) if grid is not None else SEARCH_GRID))
+    # DEFAULT_PARAMS first, so a short budget still covers the usual model
+    candidates.sort(key=lambda c: c != {k: DEFAULT_PARAMS.get(k) for k in c})
+
+    # Every validation fold needs each class at least once
+    folds = max(2, min(folds, int(y.value_counts().min())))
+    cached = []
+    for fit_idx, val_idx in StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(X, y):
+        preprocessor = build_preprocessor(X)
+        X_fit = preprocessor.fit_transform(X.iloc[fit_idx])
+        X_val = preprocessor.transform(X.iloc[val_idx])
+        cached.append((X_fit, y.iloc[fit_idx].to_numpy(), X_val, y.iloc[val_idx].to_numpy()))
+
+    tasks = [(i, fold) for i in range(len(candidates)) for fold in range(folds)]
+    workers = max(1, min(workers or _available_cores(), len(tasks)))
+    deadline = started + time_budget if time_budget else None
+    scores = {i: [] for i in range(len(candidates))}
+    stopped_early = False
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(SEARCH_MP_CONTEXT),
+                               initializer=_init_search_worker, initargs=(cached,))
+    try:
+        pending = {pool.submit(_score_candidate, candidates[i], fold): i for i, fold in tasks}
+        finished = 0
+        while pending:
+            # Past the deadline, block until the next fit finishes instead of
+            # polling; the loop stops once a candidate has every fold
+            timeout = None
+            if deadline is not None and deadline > time.monotonic():
+                timeout = deadline - time.monotonic()
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                scores[pending.pop(future)].append(future.result())
+                finished += 1
+            if progress is not None and done:
+                progress(finished / len(tasks), f"Cross-validated {finished}/{len(tasks)} fits")
+            if deadline is not None and time.monotonic() >= deadline and any(len(s) == folds for s in scores.values()):
+                stopped_early = bool(pending)
+                break
+    finally:
+        # Fits already running finish; queued ones are dropped
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    results = []
+    for i, fold_scores in scores.items():
+        if len(fold_scores) < folds:
+            continue
+        acc, f1 = np.array(fold_scores).T
+        results.append({
+            "params": candidates[i],
+            "mean_accuracy": float(acc.mean()),
+            "std_accuracy": float(acc.std()),
+            "mean_f1_macro": float(f1.mean()),
+            "std_f1_macro": float(f1.std()),
+        })
+    # Ties go to the earlier candidate
+    results.sort(key=lambda r: -r["mean_" + SEARCH_SCORING])
+    best = results[0]
+
+    summary = {
+        "scoring": SEARCH_SCORING,
+        "folds": folds,
+        "best_params": best["params"],
+        "mean_accuracy": best["mean_accuracy"],
+        "std_accuracy": best["std_accuracy"],
+        "mean_f1_macro": best["mean_f1_macro"],
+        "std_f1_macro": best["std_f1_macro"],
+        "candidates_scored": len(results),
+        "candidates_total": len(candidates),
+        "stopped_early": stopped_early,
+        "workers": workers,
+        "seconds": round(time.monotonic() - started, 2),
+        "top_candidates": results[:5],
+    }
+    return best["params"], summary
+
+def train_and_save(path=DATA_PATH, model_path=MODEL_PATH, spec_path=FEATURE_SPEC_PATH,
+                   forest_path=FOREST_PATH, search=False, grid=None, folds=CV_FOLDS,
+                   workers=SEARCH_WORKERS, time_budget=SEARCH_TIME_BUDGET, progress=None):
+    """Train the pipeline, report hold-out accuracy and save the artifacts.
+
+    With search=True the forest's parameters come from
+    search_hyperparameters() on the training split; the hold-out split is
+    only used for the final accuracy. Returns (model, accuracy,
+    training_samples, report), where report holds the parameters used,
+    after a search its cross-validation summary under "cv" and, when
+    `path` is a dataset snapshot, its version under "dataset".
+    """
     df = load_data(path)
 
     # Filter only available features
@@ -71,41 +266,68 @@ def train_and_save(path=DATA_PATH, model_path=MODEL_PATH):
     X = df[feature_cols]
     y = df["Target"]
 
-    preprocessor = build_preprocessor(X)
-
-    clf = RandomForestClassifier(
-        n_estimators=300,
-        max_depth=15,
-        min_samples_split=4,
-        min_samples_leaf=2,
-        class_weight="balanced",
-        random_state=42,
-        n_jobs=-1
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
     )
 
+    report = {"params": dict(DEFAULT_PARAMS)}
+    if "dataset" in df.attrs:
+        report["dataset"] = df.attrs["dataset"]
+    if search:
+        params, report["cv"] = search_hyperparameters(
+            X_train, y_train, grid=grid, folds=folds, workers=workers,
+            time_budget=time_budget, progress=progress
+        )
+        report["params"] = {**DEFAULT_PARAMS, **params}
+        cv = report["cv"]
+        print(f"Search: {cv['candidates_scored']}/{cv['candidates_total']} candidates, "
+              f"{cv['folds']} folds, {cv['seconds']}s; best {report['params']} "
+              f"(f1_macro {cv['mean_f1_macro']:.3f} +/- {cv['std_f1_macro']:.3f})")
+
+    preprocessor = build_preprocessor(X)
+    clf = build_classifier(report["params"])
+
     model = Pipeline([
         ("preprocessor", preprocessor),
         ("classifier", clf)
     ])
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-
     model.fit(X_train, y_train)
     preds = model.predict(X_test)
     print(classification_report(y_test, preds))
     
     # Calculate accuracy
-    from sklearn.metrics import accuracy_score
     accuracy = accuracy_score(y_test, preds)
     training_samples = len(X_train)
 
     Path(model_path).parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, model_path)
+    # Write beside the target and rename so running workers never read a half-written file
+    tmp_path = f"{model_path}.tmp"
+    # Uncompressed, so the registry can memory-map the arrays (MODEL_MMAP_MODE)
+    joblib.dump(model, tmp_path, compress=0)
+    os.replace(tmp_path, model_path)
     print(f"Saved model to {model_path}")
+
+    # Written after the model so its mtime marks it as current (see ml/registry.py)
+    try:
+        save_feature_spec(build_feature_spec(model), spec_path)
+        print(f"Saved feature spec to {spec_path}")
+    except ValueError as e:
+        print(f"Feature spec not written: {e}")
+
+    # Node arrays for INFERENCE_ENGINE=compiled, memory-mapped by every worker
+    CompiledForest.from_estimator(clf).save(forest_path)
+    print(f"Saved compiled forest to {forest_path}")
     
-    return model, accuracy, training_samples
+    return model, accuracy, training_samples, report
 
 if __name__ == "__main__":
-    train_and_save()
+    parser = argparse.ArgumentParser(description="Train the dropout model and save its artifacts")
+    parser.add_argument("--data", default=DATA_PATH, help="CSV file, or a dataset snapshot directory (ml/dataset.py)")
+    parser.add_argument("--search", action="store_true", help="pick forest parameters by cross-validated search")
+    parser.add_argument("--folds", type=int, default=CV_FOLDS)
+    parser.add_argument("--workers", type=int, default=SEARCH_WORKERS)
+    parser.add_argument("--time-budget", type=float, default=SEARCH_TIME_BUDGET, help="seconds; 0 for no limit")
+    args = parser.parse_args()
+    train_and_save(args.data, search=args.search, folds=args.folds, workers=args.workers,
+                   time_budget=args.time_budget)
@@ -1,27 +1,70 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, bindparam, or_
+from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+# Lower bound (inclusive) of each tier; a tier ends where the next one starts
+RISK_TIERS = [
+    ("Very High", 0.85),
+    ("High", 0.70),
+    ("Moderate", 0.50),
+    ("Low", 0.30),
+    ("Minimal", None),
+]
+
+
+def classify_risk(score):
+    if score is None:
+        return "Unknown"
+    for tier, lower in RISK_TIERS:
+        if lower is None or score >= lower:
+            return tier
+
 
 class RawStudent(db.Model):
     __tablename__ = 'raw_students'
 
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.String(50))
+    student_id = db.Column(db.String(50), index=True)
     data = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    # Time-range reads, overall and per user, and the retention purge
+    __table_args__ = (
+        db.Index('ix_audit_logs_user_id_timestamp', 'user_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, nullable=False)
     action = db.Column(db.String(255))
     target_id = db.Column(db.Integer)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+# Session.info key holding audit events staged in the current transaction
+AUDIT_EVENTS_KEY = 'audit_events'
+
+
+def record_audit(user_id, action, target_id=None, session=None):
+    """Stage an audit event on the session.
+
+    Nothing is written in the caller's transaction: once it commits, the
+    events go to the audit writer (audit.py), which inserts them in
+    batches; a rollback discards them.
+    """
+    session = session or db.session
+    session.info.setdefault(AUDIT_EVENTS_KEY, []).append({
+        'user_id': user_id,
+        'action': action,
+        'target_id': target_id,
+        'timestamp': datetime.utcnow(),
+    })
 
 
 class User(db.Model):
@@ -33,10 +76,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(256), nullable=True)
     role = db.Column(db.Enum('student', 'teacher', 'admin', name='user_roles'), default='student', nullable=False)
     verified = db.Column(db.Boolean, default=False)
-    otp_code = db.Column(db.String(6), nullable=True)
-    otp_expiry = db.Column(db.DateTime, nullable=True)
-    reset_token = db.Column(db.String(256), nullable=True)
-    reset_token_expiry = db.Column(db.DateTime, nullable=True)
+    # OTPs and reset tokens live in the token store (token_store.py), not here
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     student_profile = db.relationship("Student", uselist=False, back_populates="user")
@@ -51,25 +91,8 @@ class User(db.Model):
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password) if self.password_hash else False
 
-    def set_otp(self, code, expiry_minutes=5):
-        self.otp_code = code
-        self.otp_expiry = datetime.utcnow() + timedelta(minutes=expiry_minutes)
-        db.session.add(self)
-        self.log_action("set_otp", self.id)
-
-    def verify_otp(self, code):
-        if self.otp_code == code and self.otp_expiry and datetime.utcnow() < self.otp_expiry:
-            self.verified = True
-            self.otp_code = None
-            self.otp_expiry = None
-            db.session.add(self)
-            self.log_action("verify_otp", self.id)
-            return True
-        return False
-
     def log_action(self, action, target_id=None):
-        log = AuditLog(user_id=self.id, action=action, target_id=target_id)
-        db.session.add(log)
+        record_audit(self.id, action, target_id)
 
 
 class Student(db.Model):
@@ -78,7 +101,7 @@ class Student(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(50), unique=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     full_name = db.Column(db.String(256), nullable=False)
     assignments_completed = db.Column(db.Integer, default=0) 
     behavior_score = db.Column(db.Float, default=0.0)
@@ -105,21 +128,36 @@ class Student(db.Model):
     grade = db.Column(db.String(10))
     additional_info = db.Column(db.Text)
     academic_score = db.Column(db.Integer)
+
+    # Known outcome (Dropout, Enrolled, Graduate) from imported CSVs; the training label
+    target = db.Column(db.String(20))
+    # Set on every change to the row's data; ml/dataset.py snapshots by it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # Copy of the newest Prediction, kept current by sync_latest_risk()
+    latest_risk_score = db.Column(db.Float, index=True)
+    latest_risk_tier = db.Column(db.String(20), index=True)
+    latest_prediction_at = db.Column(db.DateTime)
+    latest_model_version = db.Column(db.String(64))
+
+    # Hash of the aligned feature vector and model version at the last batch scoring
+    feature_fingerprint = db.Column(db.String(32))
+
     user = db.relationship("User", back_populates="student_profile")
-    predictions = db.relationship('Prediction', backref='student', lazy=True)
-    counseling_sessions = db.relationship('CounselingSession', backref='student', lazy=True)
+    # Ordered so predictions[-1] is the latest however the collection is loaded
+    predictions = db.relationship('Prediction', backref='student', lazy=True, order_by='Prediction.id')
+    counseling_sessions = db.relationship('CounselingSession', backref='student', lazy=True, order_by='CounselingSession.id')
 
 
     def log_update(self, user_id, action="update_student"):
-        log = AuditLog(user_id=user_id, action=action, target_id=self.id)
-        db.session.add(log)
+        record_audit(user_id, action, self.id)
 
 
 class TeacherDetails(db.Model):
     __tablename__ = 'teacher_details'
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
     full_name = db.Column(db.String(256), nullable=False)
     employee_id = db.Column(db.String(50), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
@@ -130,22 +168,137 @@ class TeacherDetails(db.Model):
 
 class Prediction(db.Model):
     __tablename__ = 'predictions'
+    # A student's history in order, and the newest predictions overall
+    __table_args__ = (
+        db.Index('ix_predictions_student_id_created_at', 'student_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'))
     risk_score = db.Column(db.Float)
     model_version = db.Column(db.String(64), default='v0.1')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+def sync_latest_risk(connection, predictions):
+    """Copy the newest of `predictions` onto each student's latest_* columns.
+
+    `predictions` are dicts with student_id, risk_score, model_version and
+    created_at. One executemany UPDATE is issued; a student already holding
+    a newer prediction is left alone.
+    """
+    newest = {}
+    for p in predictions:
+        sid = p.get("student_id")
+        if sid is None:
+            continue
+        current = newest.get(sid)
+        if current is None or (p["created_at"] or datetime.min) >= (current["created_at"] or datetime.min):
+            newest[sid] = p
+    if not newest:
+        return
+
+    table = Student.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("_sid"))
+        .where(or_(
+            table.c.latest_prediction_at.is_(None),
+            table.c.latest_prediction_at <= bindparam("_at"),
+        ))
+        .values(
+            latest_risk_score=bindparam("_score"),
+            latest_risk_tier=bindparam("_tier"),
+            latest_prediction_at=bindparam("_at"),
+            latest_model_version=bindparam("_version"),
+            # Scoring is not a change to the student's data
+            updated_at=table.c.updated_at,
+        )
+    )
+    connection.execute(stmt, [
+        {
+            "_sid": sid,
+            "_score": p["risk_score"],
+            "_tier": classify_risk(p["risk_score"]),
+            "_at": p["created_at"],
+            "_version": p["model_version"],
+        }
+        for sid, p in newest.items()
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_latest_risk_after_flush(session, flush_context):
+    # Prediction rows added through the ORM update their student in the same transaction
+    new = [obj for obj in session.new if isinstance(obj, Prediction)]
+    if new:
+        sync_latest_risk(session.connection(), [
+            {
+                "student_id": p.student_id,
+                "risk_score": p.risk_score,
+                "model_version": p.model_version,
+                "created_at": p.created_at,
+            }
+            for p in new
+        ])
 
 
 class CounselingSession(db.Model):
     __tablename__ = 'counseling_sessions'
+    # Sessions of one student, a teacher's follow-ups by date, all due
+    # follow-ups, and those still waiting for a reminder (followups.py)
+    __table_args__ = (
+        db.Index('ix_counseling_sessions_student_id_created_at', 'student_id', 'created_at'),
+        db.Index('ix_counseling_sessions_teacher_id_follow_up_at', 'teacher_id', 'follow_up_at'),
+        db.Index('ix_counseling_sessions_reminded_at_follow_up_at', 'reminded_at', 'follow_up_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'))
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     notes = db.Column(db.Text)
-    follow_up_at = db.Column(db.DateTime, nullable=True)
+    follow_up_at = db.Column(db.DateTime, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When the follow-up reminder was sent; NULL while it is pending
+    reminded_at = db.Column(db.DateTime, nullable=True)
 
     teacher = db.relationship("User", back_populates="counseling_sessions")
+
+
+class SchedulerLease(db.Model):
+    """Which process leads a background scheduler, and until when (followups.py)."""
+    __tablename__ = 'scheduler_leases'
+
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+class ExpiringKey(db.Model):
+    """Short-lived key/value pairs (OTPs, reset tokens) for SQLTokenStore."""
+    __tablename__ = 'expiring_keys'
+
+    # Hex SHA-256 of the purpose and token, never the token itself
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(255), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.String(36), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum('queued', 'running', 'succeeded', 'failed', 'cancelled', name='job_status'), default='queued', nullable=False)
+    progress = db.Column(db.Float, default=0.0)
+    message = db.Column(db.String(255))
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # "hostname:pid" of the process holding the job, and when it last reported in
+    owner = db.Column(db.String(128), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
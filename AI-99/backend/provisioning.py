@@ -0,0 +1,254 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from models import db, User, Student, AuditLog
+from ml.importer import iter_csv_chunks
+
+# Rows validated, hashed and inserted per transaction
+CHUNK_SIZE = int(os.getenv("PROVISION_CHUNK_SIZE", 1000))
+
+# Processes hashing passwords; 1 hashes inline in the calling thread
+HASH_WORKERS = int(os.getenv("PROVISION_HASH_WORKERS", 0)) or os.cpu_count() or 1
+
+# How the hashing processes start. forkserver children are forked from a
+# clean server process, not from a threaded app worker
+MP_CONTEXT = os.getenv("PROVISION_MP_CONTEXT", "forkserver")
+
+# Per-row errors kept in the result; the count covers all of them
+MAX_REPORTED_ERRORS = int(os.getenv("PROVISION_MAX_ERRORS", 1000))
+
+DEFAULT_PASSWORD = "changeme123"
+
+FLOAT_FIELDS = ("attendance", "avg_score", "cu1_grade", "cu2_grade")
+INT_FIELDS = ("academic_score", "age_at_enrollment", "cu1_enrolled", "cu1_approved", "cu2_enrolled", "cu2_approved")
+TEXT_FIELDS = ("grade", "course", "gender", "marital_status", "application_mode",
+               "scholarship_holder", "debtor", "tuition_fees_up_to_date", "target")
+
+# Values for a student row that leaves these columns out
+FIELD_DEFAULTS = {"attendance": 100.0, "avg_score": 0.0}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _hash_password(password):
+    return generate_password_hash(password)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _student_values(row):
+    values = {}
+    for field in FLOAT_FIELDS:
+        raw = row.get(field)
+        if raw is None:
+            values[field] = FIELD_DEFAULTS.get(field)
+            continue
+        try:
+            values[field] = float(raw)
+        except (TypeError, ValueError):
+            raise RowError(f"invalid {field}: {raw!r}")
+
+    for field in INT_FIELDS:
+        raw = row.get(field)
+        if raw is None:
+            values[field] = None
+            continue
+        try:
+            values[field] = int(float(raw))
+        except (TypeError, ValueError, OverflowError):
+            raise RowError(f"invalid {field}: {raw!r}")
+
+    for field in TEXT_FIELDS:
+        values[field] = _text(row.get(field))
+    return values
+
+
+def _parse_row(row):
+    """Validate one CSV row into (user values, student values, password)."""
+    username = _text(row.get("username")) or _text(row.get("full_name"))
+    if not username:
+        raise RowError("username or full_name required")
+    email = _text(row.get("email"))
+    if not email:
+        raise RowError("email required")
+
+    student = _student_values(row)
+    student["full_name"] = _text(row.get("full_name")) or username
+    password = _text(row.get("password")) or DEFAULT_PASSWORD
+    return {"username": username, "email": email}, student, password
+
+
+class _Hasher:
+    """Hash passwords inline or across a process pool, in input order."""
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context(MP_CONTEXT))
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    def map(self, passwords):
+        if self._pool is None or len(passwords) < 2:
+            return [_hash_password(p) for p in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._pool.map(_hash_password, passwords, chunksize=chunksize))
+
+
+def _existing_accounts(session, usernames, emails):
+    """Usernames and emails among the given ones that already have accounts."""
+    table = User.__table__
+    rows = session.execute(
+        select(table.c.username, table.c.email)
+        .where(or_(table.c.username.in_(usernames), table.c.email.in_(emails)))
+    ).all()
+    return {r.username for r in rows}, {r.email for r in rows}
+
+
+def _insert_accounts(session, accounts, now):
+    """Insert users, then their students and audit rows, as three executemany statements."""
+    users = User.__table__
+    session.execute(users.insert(), [
+        {**user, "password_hash": password_hash, "role": "student", "verified": False, "created_at": now}
+        for _, user, _, password_hash in accounts
+    ])
+    ids = dict(session.execute(
+        select(users.c.username, users.c.id)
+        .where(users.c.username.in_([user["username"] for _, user, _, _ in accounts]))
+    ).all())
+
+    session.execute(Student.__table__.insert(), [
+        {**student, "user_id": ids[user["username"]]}
+        for _, user, student, _ in accounts
+    ])
+    # Same trail User.set_password leaves for a single account
+    session.execute(AuditLog.__table__.insert(), [
+        {"user_id": ids[user["username"]], "action": "set_password",
+         "target_id": ids[user["username"]], "timestamp": now}
+        for _, user, _, _ in accounts
+    ])
+
+
+def _provision_chunk(session, rows, first_line, hasher, seen_usernames, seen_emails, errors):
+    """Validate, hash and insert one chunk; returns the number of accounts created.
+
+    `first_line` is the CSV line of rows[0] (the header is line 1), used to
+    report errors.
+    """
+    parsed = []
+    for offset, row in enumerate(rows):
+        line = first_line + offset
+        try:
+            user, student, password = _parse_row(row)
+        except RowError as e:
+            errors.append({"line": line, "error": str(e)})
+            continue
+        parsed.append((line, user, student, password))
+    if not parsed:
+        return 0
+
+    # One lookup for every username and email in the chunk
+    taken_usernames, taken_emails = _existing_accounts(
+        session, {u["username"] for _, u, _, _ in parsed}, {u["email"] for _, u, _, _ in parsed}
+    )
+
+    accepted = []
+    for line, user, student, password in parsed:
+        if user["username"] in taken_usernames or user["username"] in seen_usernames:
+            errors.append({"line": line, "error": f"username already exists: {user['username']}"})
+            continue
+        if user["email"] in taken_emails or user["email"] in seen_emails:
+            errors.append({"line": line, "error": f"email already exists: {user['email']}"})
+            continue
+        seen_usernames.add(user["username"])
+        seen_emails.add(user["email"])
+        accepted.append((line, user, student, password))
+    if not accepted:
+        return 0
+
+    hashes = hasher.map([password for _, _, _, password in accepted])
+    accounts = [(line, user, student, password_hash)
+                for (line, user, student, _), password_hash in zip(accepted, hashes)]
+    now = datetime.utcnow()
+
+    try:
+        with session.begin_nested():
+            _insert_accounts(session, accounts, now)
+        return len(accounts)
+    except IntegrityError:
+        # An account created since the lookup, or a constraint the checks
+        # above do not cover: insert row by row so only the offenders fail
+        pass
+
+    created = 0
+    for account in accounts:
+        try:
+            with session.begin_nested():
+                _insert_accounts(session, [account], now)
+            created += 1
+        except IntegrityError as e:
+            errors.append({"line": account[0], "error": f"rejected by database: {e.orig}"})
+    return created
+
+
+def provision_students(app, csv_path, chunk_size=CHUNK_SIZE, hash_workers=HASH_WORKERS, progress=None):
+    """Create a student account (User, Student, audit row) per CSV row.
+
+    The file is streamed `chunk_size` rows at a time. Each chunk costs one
+    SELECT for the usernames and emails it uses, a parallel hashing pass
+    over its passwords, one executemany INSERT each into users, students
+    and audit_logs, and a commit. Invalid or duplicate rows are reported
+    in `errors` (by CSV line) and skipped; the rest of the chunk is still
+    inserted. `progress(stats)` is called after every chunk.
+    """
+    stats = {"total": 0, "created": 0, "failed": 0, "chunks": 0}
+    errors = []
+    seen_usernames, seen_emails = set(), set()
+
+    with app.app_context(), _Hasher(hash_workers) as hasher:
+        session = db.session
+        for chunk in iter_csv_chunks(csv_path, chunk_size):
+            rows = chunk.to_dict("records")
+            chunk_errors = []
+            claimed = (set(seen_usernames), set(seen_emails))
+            try:
+                created = _provision_chunk(session, rows, stats["total"] + 2, hasher,
+                                           seen_usernames, seen_emails, chunk_errors)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                seen_usernames, seen_emails = claimed
+                logging.error(f"Student provisioning chunk {stats['chunks'] + 1} failed: {str(e)}")
+                created = 0
+                chunk_errors = [{"line": stats["total"] + 2 + i, "error": "chunk failed"} for i in range(len(rows))]
+
+            chunk_errors.sort(key=lambda e: e["line"])
+            stats["total"] += len(rows)
+            stats["created"] += created
+            stats["failed"] += len(chunk_errors)
+            stats["chunks"] += 1
+            errors.extend(chunk_errors[:max(0, MAX_REPORTED_ERRORS - len(errors))])
+            if progress:
+                progress(dict(stats))
+
+    stats["errors"] = errors
+    return stats
@@ -1,12 +1,18 @@
-from flask import Blueprint, jsonify, request, Response
+from flask import Blueprint, jsonify, request, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash
-from models import db, User, Student, Prediction
+from models import db, User, Student, Prediction, RISK_TIERS
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func
-import csv
-import io
+from sqlalchemy import func, case
+from sqlalchemy.orm import contains_eager
+import os
+import time
+import threading
 from datetime import datetime, timedelta
+from ml.registry import registry
+from student_queries import ListingError
+from audit import query_audit_log
+import exporter
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -65,47 +71,45 @@ def create_user():
 
     return jsonify({'id': user.id, 'msg': 'User created successfully'}), 201
 
-@admin_bp.route('/analytics', methods=['GET'])
-@jwt_required()
-def analytics():
-    if not admin_only():
-        return jsonify({'msg': 'Access denied. Admins only.'}), 403
+# Seconds an analytics payload is reused for the same model version
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", 30))
 
-    students = Student.query.all()
-    
-    # High risk count (latest prediction > 0.6)
-    high_risk = 0
-    risk_distribution = {"Very High": 0, "High": 0, "Moderate": 0, "Low": 0, "Minimal": 0}
-    
-    for s in students:
-        if s.predictions:
-            latest = s.predictions[-1]
-            if latest.risk_score > 0.6:
-                high_risk += 1
-            # Determine risk tier
-            if latest.risk_score >= 0.85:
-                risk_distribution["Very High"] += 1
-            elif latest.risk_score >= 0.70:
-                risk_distribution["High"] += 1
-            elif latest.risk_score >= 0.50:
-                risk_distribution["Moderate"] += 1
-            elif latest.risk_score >= 0.30:
-                risk_distribution["Low"] += 1
-            else:
-                risk_distribution["Minimal"] += 1
-    
-    # Risk by course
+_analytics_cache = {}  # model version -> (computed_at, payload)
+_analytics_lock = threading.Lock()
+
+
+def _tier_count(tier):
+    return func.coalesce(func.sum(case((Student.latest_risk_tier == tier, 1), else_=0)), 0)
+
+
+def compute_analytics():
+    """Build the analytics payload with grouped aggregates; no rows reach Python."""
+    tiers = [tier for tier, _ in RISK_TIERS]
+
+    # Totals, tier buckets and averages in one pass over students
+    totals = db.session.query(
+        func.count(Student.id).label('total'),
+        func.count(Student.latest_risk_score).label('with_predictions'),
+        func.coalesce(func.sum(case((Student.latest_risk_score > 0.6, 1), else_=0)), 0).label('high_risk'),
+        func.coalesce(func.sum(Student.attendance), 0).label('attendance_sum'),
+        func.coalesce(func.sum(Student.academic_score), 0).label('academic_sum'),
+        *[_tier_count(tier).label(f'tier_{i}') for i, tier in enumerate(tiers)]
+    ).one()
+
+    risk_distribution = {tier: int(getattr(totals, f'tier_{i}')) for i, tier in enumerate(tiers)}
+
+    # Risk by course, averaged over each student's latest prediction
     course_risk = db.session.query(
         Student.course,
         func.count(Student.id).label('total'),
-        func.avg(func.coalesce(Prediction.risk_score, 0)).label('avg_risk')
-    ).outerjoin(Prediction).group_by(Student.course).all()
+        func.avg(func.coalesce(Student.latest_risk_score, 0)).label('avg_risk')
+    ).group_by(Student.course).all()
     
     course_risk_data = [
         {
             "course": c.course or "Unknown",
             "total": c.total,
-            "avg_risk": round(c.avg_risk, 3) if c.avg_risk else 0
+            "avg_risk": round(float(c.avg_risk), 3) if c.avg_risk else 0
         }
         for c in course_risk
     ]
@@ -124,27 +128,53 @@ def analytics():
         {
             "month": m.month,
             "predictions": m.count,
-            "avg_risk": round(m.avg_risk, 3) if m.avg_risk else 0
+            "avg_risk": round(float(m.avg_risk), 3) if m.avg_risk else 0
         }
         for m in monthly_predictions
     ]
     
-    # Student stats
-    total_students = len(students)
-    students_with_predictions = sum(1 for s in students if s.predictions)
-    avg_attendance = sum(s.attendance for s in students if s.attendance) / total_students if total_students > 0 else 0
-    avg_academic = sum(s.academic_score for s in students if s.academic_score) / total_students if total_students > 0 else 0
+    # Student stats (averaged over all students, as before)
+    total_students = totals.total
+    avg_attendance = float(totals.attendance_sum) / total_students if total_students > 0 else 0
+    avg_academic = float(totals.academic_sum) / total_students if total_students > 0 else 0
 
-    return jsonify({
+    return {
         'total_students': total_students,
-        'high_risk_count': high_risk,
+        'high_risk_count': int(totals.high_risk),
         'risk_distribution': risk_distribution,
         'course_risk': course_risk_data,
         'monthly_trend': monthly_trend,
-        'students_with_predictions': students_with_predictions,
+        'students_with_predictions': totals.with_predictions,
         'avg_attendance': round(avg_attendance, 1),
         'avg_academic_score': round(avg_academic, 1)
-    }), 200
+    }
+
+
+def get_analytics():
+    """compute_analytics(), reused for ANALYTICS_CACHE_TTL seconds per model version."""
+    loaded = registry.get()
+    version = loaded.version if loaded else None
+    now = time.monotonic()
+
+    cached = _analytics_cache.get(version)
+    if cached and now - cached[0] < ANALYTICS_CACHE_TTL:
+        return cached[1]
+
+    payload = compute_analytics()
+    with _analytics_lock:
+        # Entries for other (older) versions are dead once the model changes
+        _analytics_cache.clear()
+        _analytics_cache[version] = (now, payload)
+    return payload
+
+
+@admin_bp.route('/analytics', methods=['GET'])
+@jwt_required()
+def analytics():
+    if not admin_only():
+        return jsonify({'msg': 'Access denied. Admins only.'}), 403
+
+    return jsonify(get_analytics()), 200
 
 @admin_bp.route('/predictions', methods=['GET'])
 @jwt_required()
@@ -157,7 +187,9 @@ def get_predictions():
     per_page = request.args.get('per_page', 50, type=int)
     
     # Get all predictions with student info
-    predictions = Prediction.query.join(Student).order_by(
+    predictions = Prediction.query.join(Student).options(
+        contains_eager(Prediction.student)
+    ).order_by(
         Prediction.created_at.desc()
     ).paginate(page=page, per_page=per_page, error_out=False)
     
@@ -178,39 +210,48 @@ def get_predictions():
         'current_page': page
     }), 200
 
+@admin_bp.route('/audit-logs', methods=['GET'])
+@jwt_required()
+def get_audit_logs():
+    """Audit trail, newest first, one page at a time.
+
+    Query params: user_id, action (comma-separated), since, until (ISO
+    8601, UTC), limit and cursor (the next_cursor of the previous page).
+    """
+    if not admin_only():
+        return jsonify({'msg': 'Access denied. Admins only.'}), 403
+
+    try:
+        rows, next_cursor = query_audit_log(request.args)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'audit_logs': rows, 'next_cursor': next_cursor}), 200
+
 @admin_bp.route('/export', methods=['GET'])
 @jwt_required()
 def export_data():
-    """Export student data as CSV"""
+    """Stream student data as CSV, NDJSON or Parquet.
+
+    Query params: format (csv|ndjson|parquet), columns (comma-separated)
+    and the student listing filters (course, risk_tier, min_attendance,
+    max_attendance).
+    """
     if not admin_only():
         return jsonify({'msg': 'Access denied. Admins only.'}), 403
-    
-    students = Student.query.all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow([
-        'ID', 'Student ID', 'Full Name', 'Course', 'Gender', 
-        'Attendance', 'Academic Score', 'Grade', 'Risk Score', 
-        'Latest Prediction Date'
-    ])
-    
-    # Data
-    for s in students:
-        risk_score = s.predictions[-1].risk_score if s.predictions else None
-        pred_date = s.predictions[-1].created_at if s.predictions else None
-        
-        writer.writerow([
-            s.id, s.student_id, s.full_name, s.course, s.gender,
-            s.attendance, s.academic_score, s.grade, risk_score,
-            pred_date.isoformat() if pred_date else ''
-        ])
-    
-    output.seek(0)
+
+    fmt = (request.args.get('format') or 'csv').lower()
+    try:
+        keys = exporter.parse_columns(request.args.get('columns'))
+        body = exporter.stream_export(fmt, keys, request.args)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    except ImportError:
+        return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+
+    mimetype, extension = exporter.FORMATS[fmt]
     return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-disposition": "attachment; filename=students_export.csv"}
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-disposition": f"attachment; filename=students_export.{extension}"}
     )
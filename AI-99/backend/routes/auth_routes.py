@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify
 from email_utils import send_otp_email, send_password_reset_email
 from models import User, Student, TeacherDetails, db
+from token_store import issue_otp, verify_otp as check_otp, issue_reset_token, consume_reset_token
 from random import randint
 from flask_jwt_extended import create_access_token
-from datetime import datetime, timedelta
 import secrets
 
 auth_bp = Blueprint("auth", __name__)
@@ -72,7 +72,7 @@ def register():
     db.session.commit()
 
     otp = generate_otp()
-    user.set_otp(otp, expiry_minutes=OTP_EXPIRY_MINUTES)
+    issue_otp(user, otp, expiry_minutes=OTP_EXPIRY_MINUTES)
     db.session.commit()
 
     if not send_otp_email(email, otp):
@@ -97,7 +97,7 @@ def verify_otp():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    if user.verify_otp(otp):
+    if check_otp(user, otp):
         access_token = create_access_token(identity={
             "id": user.id,
             "username": user.username,
@@ -159,9 +159,7 @@ def forgot_password():
         return jsonify({"message": "If account exists reset email sent"}), 200
 
     reset_token = generate_reset_token()
-    user.reset_token = reset_token
-    user.reset_token_expiry = datetime.utcnow() + timedelta(minutes=RESET_TOKEN_EXPIRY_MINUTES)
-    db.session.commit()
+    issue_reset_token(user, reset_token, expiry_minutes=RESET_TOKEN_EXPIRY_MINUTES)
 
     if not send_password_reset_email(user.email, reset_token):
         return jsonify({"error": "Failed to send reset email"}), 500
@@ -184,17 +182,14 @@ def reset_password():
     if len(new_password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
 
-    user = User.query.filter_by(reset_token=token).first()
+    # One primary-key lookup by the token's hash; the token is used up here
+    user_id = consume_reset_token(token)
+    user = db.session.get(User, user_id) if user_id is not None else None
 
     if not user:
-        return jsonify({"error": "Invalid token"}), 400
-
-    if user.reset_token_expiry and datetime.utcnow() > user.reset_token_expiry:
-        return jsonify({"error": "Token expired"}), 400
+        return jsonify({"error": "Invalid or expired token"}), 400
 
     user.set_password(new_password)
-    user.reset_token = None
-    user.reset_token_expiry = None
     db.session.commit()
 
     return jsonify({"message": "Password reset successful"}), 200
@@ -233,7 +228,7 @@ def login():
         return jsonify({"token": access_token}), 200
 
     otp = generate_otp()
-    user.set_otp(otp, expiry_minutes=OTP_EXPIRY_MINUTES)
+    issue_otp(user, otp, expiry_minutes=OTP_EXPIRY_MINUTES)
     db.session.commit()
 
     if not send_otp_email(email, otp):
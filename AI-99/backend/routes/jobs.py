@@ -0,0 +1,62 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Job
+from jobs import job_to_dict, request_cancel, fail_orphaned_jobs, ACTIVE_STATUSES
+
+jobs_bp = Blueprint("jobs", __name__)
+
+
+def _visible_job(job_id):
+    identity = get_jwt_identity() or {}
+    role = (identity.get("role") or "").lower()
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+    if role != "admin" and job.created_by != identity.get("id"):
+        return None
+    # A job whose worker exited would otherwise stay queued or running forever
+    if job.status in ACTIVE_STATUSES and fail_orphaned_jobs([job.id]):
+        db.session.refresh(job)
+    return job
+
+
+@jobs_bp.route("/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    job = _visible_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job)), 200
+
+
+@jobs_bp.route("/<job_id>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_job(job_id):
+    job = _visible_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status in ("succeeded", "failed", "cancelled"):
+        return jsonify({"error": f"Job already {job.status}"}), 409
+
+    request_cancel(job)
+    return jsonify(job_to_dict(job)), 202
+
+
+@jobs_bp.route("/", methods=["GET"])
+@jwt_required()
+def list_jobs():
+    identity = get_jwt_identity() or {}
+    role = (identity.get("role") or "").lower()
+    limit = min(request.args.get("limit", 20, type=int), 100)
+
+    query = Job.query
+    if role != "admin":
+        query = query.filter_by(created_by=identity.get("id"))
+    jobs = query.order_by(Job.created_at.desc()).limit(limit).all()
+    active = [j.id for j in jobs if j.status in ACTIVE_STATUSES]
+    orphaned = set(fail_orphaned_jobs(active)) if active else set()
+    for j in jobs:
+        if j.id in orphaned:
+            db.session.refresh(j)
+
+    return jsonify({"jobs": [job_to_dict(j) for j in jobs]}), 200
@@ -1,21 +1,23 @@
 from flask import Blueprint, request, jsonify
 from functools import wraps
-import os, joblib, json
+import os, json
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from ..ml.preprocess import clean_data
-from ..ml.explain import explain_prediction
-from ..ml.recommend import get_recommendation
+from ml.preprocess import clean_data, STUDENT_SCHEMA
+from ml.explain import explain_batch
+from ml.recommend import get_recommendation
+from ml.registry import registry, MODEL_PATH, MODEL_META_PATH
+import jobs
 
 ml_bp = Blueprint("ml", __name__)
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "ml", "model.pkl")
-MODEL_META_PATH = os.path.join(os.path.dirname(__file__), "..", "ml", "model_meta.json")
-
 def save_model_metadata(metadata):
     """Save model metadata to a JSON file"""
-    with open(MODEL_META_PATH, 'w') as f:
+    tmp_path = MODEL_META_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, MODEL_META_PATH)
 
 def get_model_metadata():
     """Get model metadata from file"""
@@ -48,21 +50,21 @@ def get_expected_features(model):
 @ml_bp.route("/status", methods=["GET"])
 def model_status():
     """Get model status and metadata"""
-    if not os.path.exists(MODEL_PATH):
+    loaded = registry.get()
+    if loaded is None:
         return jsonify({
             "status": "not_trained",
             "message": "Model has not been trained yet"
         }), 404
     
     try:
-        model = joblib.load(MODEL_PATH)
-        metadata = get_model_metadata()
+        metadata = loaded.metadata
         
         # Calculate feature importance from the model
         feature_importance = []
-        if hasattr(model.named_steps.get("classifier"), "feature_importances_"):
-            importances = model.named_steps["classifier"].feature_importances_
-            feature_names = get_expected_features(model)
+        if hasattr(loaded.classifier, "feature_importances_"):
+            importances = loaded.classifier.feature_importances_
+            feature_names = loaded.features
             feature_importance = [
                 {"feature": name, "importance": float(imp)}
                 for name, imp in zip(feature_names, importances)
@@ -70,16 +72,17 @@ def model_status():
             feature_importance = sorted(feature_importance, key=lambda x: x["importance"], reverse=True)
         
         # Get classes
-        classes = []
-        if hasattr(model, "named_steps") and hasattr(model.named_steps["classifier"], "classes_"):
-            classes = list(model.named_steps["classifier"].classes_)
+        classes = [str(c) for c in loaded.classes]
         
         return jsonify({
             "status": "ready",
             "trained": metadata.get("trained_at") if metadata else None,
             "accuracy": metadata.get("accuracy") if metadata else None,
             "training_samples": metadata.get("training_samples") if metadata else None,
-            "model_version": metadata.get("version") if metadata else "v1.0",
+            "params": metadata.get("params") if metadata else None,
+            "cv": metadata.get("cv") if metadata else None,
+            "dataset": metadata.get("dataset") if metadata else None,
+            "model_version": loaded.version,
             "feature_importance": feature_importance[:10] if feature_importance else [],
             "classes": classes
         }), 200
@@ -89,40 +92,94 @@ def model_status():
 @ml_bp.route("/retrain", methods=["POST"])
 @admin_required
 def retrain():
-    from ..ml.train_model import train_and_save
+    from flask_jwt_extended import get_jwt_identity
     data = request.get_json(silent=True) or {}
     csv_path = data.get("csv_path")
     if not csv_path:
         csv_path = os.path.join(os.path.dirname(__file__), "..", "ml", "students.csv")
-    try:
-        # Train the model
-        model, accuracy, training_samples = train_and_save(csv_path, MODEL_PATH)
-        
-        # Save metadata
-        metadata = {
-            "trained_at": datetime.now().isoformat(),
-            "accuracy": accuracy,
-            "training_samples": training_samples,
-            "version": f"v{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        }
-        save_model_metadata(metadata)
-        
-    except Exception as e:
-        return jsonify({"status": "error", "exc": str(e)}), 500
-    return jsonify({
-        "status": "ok", 
+
+    # "database" trains on the dataset snapshot (ml/dataset.py), refreshed first
+    source = data.get("source", "csv")
+    if source not in ("csv", "database"):
+        return jsonify({"error": "source must be csv or database"}), 400
+
+    # Optional cross-validated search: {"search": true, "grid": {...}, "cv_folds": 5, "time_budget": 120}
+    search = None
+    if data.get("search"):
+        from ml.train_model import validate_grid, CV_FOLDS, SEARCH_TIME_BUDGET
+        try:
+            search = {
+                "grid": validate_grid(data["grid"]) if data.get("grid") is not None else None,
+                "folds": int(data.get("cv_folds") or CV_FOLDS),
+                "time_budget": float(data.get("time_budget") or SEARCH_TIME_BUDGET),
+            }
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        if search["folds"] < 2 or search["time_budget"] < 0:
+            return jsonify({"error": "cv_folds must be at least 2 and time_budget not negative"}), 400
+
+    identity = get_jwt_identity() or {}
+    job_id = jobs.submit("retrain", run_retrain, csv_path, search, source == "database",
+                         user_id=identity.get("id"))
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
+
+def run_retrain(job, csv_path, search=None, from_database=False):
+    """Train, save metadata and hot-swap the registry. Runs as a background job."""
+    from ml.train_model import train_and_save
+
+    if from_database:
+        from ml.dataset import build_snapshot, DATASET_DIR
+        job.progress(0.01, "Updating dataset snapshot", force=True)
+        manifest = build_snapshot(DATASET_DIR)
+        job.progress(0.02, f"Dataset {manifest['version']}", force=True)
+        csv_path = DATASET_DIR
+
+    if search:
+        job.progress(0.02, "Searching hyperparameters", force=True)
+        # The search takes most of the time; the final fit and saving the rest
+        model, accuracy, training_samples, report = train_and_save(
+            csv_path, MODEL_PATH, search=True, grid=search["grid"], folds=search["folds"],
+            time_budget=search["time_budget"],
+            progress=lambda fraction, message: job.progress(0.02 + 0.88 * fraction, message)
+        )
+    else:
+        job.progress(0.05, "Training model", force=True)
+        model, accuracy, training_samples, report = train_and_save(csv_path, MODEL_PATH)
+
+    metadata = {
+        "trained_at": datetime.now().isoformat(),
+        "accuracy": accuracy,
+        "training_samples": training_samples,
+        "params": report["params"],
+        "version": f"v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    }
+    if "cv" in report:
+        metadata["cv"] = report["cv"]
+    if "dataset" in report:
+        metadata["dataset"] = report["dataset"]
+    save_model_metadata(metadata)
+    registry.reload()
+
+    return {
+        "status": "ok",
         "model_path": str(MODEL_PATH),
         "model_version": metadata.get("version"),
         "accuracy": accuracy,
-        "training_samples": training_samples
-    })
+        "training_samples": training_samples,
+        "params": report["params"],
+        "cv": report.get("cv"),
+        "dataset": report.get("dataset")
+    }
 
 @ml_bp.route("/predict", methods=["POST"])
 def predict():
-    if not os.path.exists(MODEL_PATH):
+    loaded = registry.get()
+    if loaded is None:
         return jsonify({"error": "model not trained"}), 400
+    model = loaded.pipeline
 
-    model = joblib.load(MODEL_PATH)
+    # top_k contributions per row; 0 skips the SHAP pass entirely
+    top_k = request.args.get("top_k", 5, type=int)
 
     if request.is_json:
         payload = request.get_json()
@@ -163,8 +220,8 @@ def predict():
             df[col] = val
 
     try:
-        df = clean_data(df)
-        expected_features = get_expected_features(model)
+        df = clean_data(df, schema=STUDENT_SCHEMA, inplace=True)
+        expected_features = loaded.features
         for col in expected_features:
             if col not in df.columns:
                 df[col] = 0
@@ -173,36 +230,36 @@ def predict():
         if not hasattr(model, "predict_proba"):
             return jsonify({"error": "model does not support probability prediction"}), 400
 
-        probas = model.predict_proba(df)
-        preds = model.predict(df)
-
         # Assume classes are ["Dropout", "Enrolled", "Graduate"], Dropout is risk
-        classes = model.named_steps["classifier"].classes_
-        if "Dropout" not in classes:
+        dropout_idx = loaded.class_index("Dropout")
+        if dropout_idx is None:
             return jsonify({"error": "model does not have 'Dropout' class"}), 400
-        dropout_idx = list(classes).index("Dropout")
 
+        # Transform, score and explain the whole frame once instead of per row
+        X_trans = loaded.preprocessor.transform(df)
+        probs = loaded.predict_proba(X_trans)[:, dropout_idx]
+        tiers = np.select(
+            [probs >= 0.85, probs >= 0.70, probs >= 0.50, probs >= 0.30],
+            ["Very High", "High", "Moderate", "Low"],
+            default="Minimal"
+        )
+
+        if top_k > 0:
+            try:
+                explanations = explain_batch(model, df, top_k=top_k, X_trans=X_trans, version=loaded.version)
+            except Exception:
+                explanations = [[] for _ in range(len(df))]
+        else:
+            explanations = [[] for _ in range(len(df))]
+
+        suggestions_by_tier = {}
         results = []
-        for i, row in df.iterrows():
-            prob = probas[i][dropout_idx]
-            risk_tier = (
-                "Very High" if prob >= 0.85 else
-                "High" if prob >= 0.70 else
-                "Moderate" if prob >= 0.50 else
-                "Low" if prob >= 0.30 else
-                "Minimal"
-            )
-            rec = get_recommendation(prob)
-            suggestions = [s.strip() for s in rec.split(" – ") if s.strip()]
-            expl = explain_prediction(model, row)
-            if "error" in expl:
-                explanation = []
-            else:
-                explanation = sorted(
-                    [{"feature": k, "shap": v} for k, v in expl.items()],
-                    key=lambda x: abs(x["shap"]),
-                    reverse=True
-                )[:5]  # top 5
+        for prob, risk_tier, explanation in zip(probs.tolist(), tiers.tolist(), explanations):
+            suggestions = suggestions_by_tier.get(risk_tier)
+            if suggestions is None:
+                rec = get_recommendation(prob)
+                suggestions = [s.strip() for s in rec.split(" – ") if s.strip()]
+                suggestions_by_tier[risk_tier] = suggestions
 
             results.append({
                 "risk_tier": risk_tier,
@@ -215,6 +272,6 @@ def predict():
         return jsonify({"error": "prediction failed", "exc": str(e)}), 500
 
     if len(results) == 1:
-        return jsonify(results[0])
+        return jsonify({**results[0], "model_version": loaded.version})
     else:
-        return jsonify({"predictions": results, "n": len(results)})
+        return jsonify({"predictions": results, "n": len(results), "model_version": loaded.version})
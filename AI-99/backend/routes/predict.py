@@ -1,53 +1,28 @@
 from flask import Blueprint, request, jsonify
-import joblib
-import os
 import pandas as pd
 import logging
 from ml.recommend import get_recommendation
 from ml.explain import explain_prediction
-from ml.preprocess import clean_data
+from ml.preprocess import align_features, STUDENT_SCHEMA
+from ml.registry import registry
 
 predict_bp = Blueprint("predict", __name__)
 
-MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml", "model.pkl"))
-PREPROCESSOR_PATH = os.getenv("PREPROCESSOR_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml", "preprocess.pkl"))
 
-model = None
-preprocessor = None
+def get_expected_features(loaded):
+    if loaded and loaded.features:
+        return loaded.features
 
-try:
-    loaded_model = joblib.load(MODEL_PATH)
-    if loaded_model and hasattr(loaded_model, "named_steps"):
-        model = loaded_model
-except:
-    pass
-
-try:
-    loaded_preprocessor = joblib.load(PREPROCESSOR_PATH)
-    if loaded_preprocessor and hasattr(loaded_preprocessor, "feature_names_in_"):
-        preprocessor = loaded_preprocessor
-except:
-    pass
-
-def get_expected_features():
-    if model and hasattr(model.named_steps["preprocessor"], "feature_names_in_"):
-        return list(model.named_steps["preprocessor"].feature_names_in_)
-
-    if preprocessor and hasattr(preprocessor, "feature_names_in_"):
+    preprocessor = registry.preprocessor()
+    if preprocessor is not None:
         return list(preprocessor.feature_names_in_)
 
     raise ValueError("Missing feature names")
 
-def format_and_align(df, expected):
-    df = clean_data(df)
-    df = df.reindex(columns=expected, fill_value=0)
-    for col in expected:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-    return df
-
 @predict_bp.route("/predict", methods=["POST"])
 def predict():
-    if model is None:
+    loaded = registry.get()
+    if loaded is None:
         return jsonify({"error": "Model not available"}), 500
 
     data = request.get_json()
@@ -77,14 +52,22 @@ def predict():
             if col not in data:
                 data[col] = val
 
-        expected = get_expected_features()
-        df = pd.DataFrame([data])
-        df = format_and_align(df, expected)
-
-        X_processed = model.named_steps["preprocessor"].transform(df)
-        classifier = model.named_steps["classifier"]
+        # The compiled encoder skips the DataFrame round trip; same output
+        if loaded.encoder is not None:
+            df = None
+            X_processed = loaded.encoder.encode(data)
+        else:
+            df = align_features(pd.DataFrame([data]), get_expected_features(loaded))
+            X_processed = loaded.preprocessor.transform(df)
+        classifier = loaded.classifier
 
-        predicted_label = classifier.predict(X_processed)[0]
+        # One forest evaluation gives both the label and the probabilities
+        prob_array = None
+        if hasattr(classifier, "predict_proba"):
+            prob_array = loaded.predict_proba(X_processed)
+            predicted_label = classifier.classes_[prob_array[0].argmax()]
+        else:
+            predicted_label = classifier.predict(X_processed)[0]
 
         class_to_risk = {
             "Dropout": "High Risk",
@@ -93,8 +76,7 @@ def predict():
         }
         class_risk = class_to_risk.get(predicted_label, "Unknown")
 
-        if hasattr(classifier, "predict_proba"):
-            prob_array = classifier.predict_proba(X_processed)
+        if prob_array is not None:
             classes = list(classifier.classes_)
             if "Dropout" in classes:
                 idx = classes.index("Dropout")
@@ -115,7 +97,7 @@ def predict():
         rec = get_recommendation(prob)
         suggestions = [s.strip() for s in rec.split(" – ") if s.strip()]
 
-        expl = explain_prediction(model, df)
+        expl = explain_prediction(loaded.pipeline, df, version=loaded.version, X_trans=X_processed)
         explanation = (
             [] if "error" in expl else
             sorted(
@@ -130,6 +112,7 @@ def predict():
             "class_based_risk": class_risk,
             "probability": float(prob),
             "risk_tier": risk_tier,
+            "model_version": loaded.version,
             "suggestions": suggestions,
             "explanation": explanation
         }), 200
@@ -140,7 +123,8 @@ def predict():
 
 @predict_bp.route("/batch_predict", methods=["POST"])
 def batch_predict():
-    if model is None:
+    loaded = registry.get()
+    if loaded is None:
         return jsonify({"error": "Model not available"}), 500
 
     if "file" not in request.files:
@@ -158,14 +142,15 @@ def batch_predict():
         if df.empty:
             return jsonify({"error": "CSV is empty"}), 400
 
-        expected = get_expected_features()
-        df = format_and_align(df, expected)
+        expected = get_expected_features(loaded)
+        # The uploaded frame is ours, so clean it in place
+        df = align_features(df, expected, schema=STUDENT_SCHEMA, inplace=True)
 
-        X_processed = model.named_steps["preprocessor"].transform(df)
-        classifier = model.named_steps["classifier"]
+        X_processed = loaded.preprocessor.transform(df)
+        classifier = loaded.classifier
 
         if hasattr(classifier, "predict_proba"):
-            prob_array = classifier.predict_proba(X_processed)
+            prob_array = loaded.predict_proba(X_processed)
             classes = list(classifier.classes_)
             if "Dropout" in classes:
                 idx = classes.index("Dropout")
@@ -183,7 +168,7 @@ def batch_predict():
                 "recommendation": recommendation
             })
 
-        return jsonify({"predictions": results, "n": len(results)}), 200
+        return jsonify({"predictions": results, "n": len(results), "model_version": loaded.version}), 200
 
     except Exception as e:
         logging.error(str(e))
@@ -1,25 +1,23 @@
-from flask import Blueprint, jsonify, request
+import os
+import shutil
+import tempfile
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Student, User
+from models import db, Student, classify_risk
 import pandas as pd
-import os
-import joblib
+from sqlalchemy.orm import selectinload
+from ml.preprocess import align_features
+from ml.explain import explain_prediction
+from ml.recommend import get_recommendation
+from ml.registry import registry
+from student_queries import list_students, ListingError, STUDENT_FIELDS
+from provisioning import provision_students
+import jobs
 
 students_bp = Blueprint('students', __name__, url_prefix='/api/students')
 
-
-def classify_risk(score):
-    if score is None:
-        return "Unknown"
-    if score >= 0.85:
-        return "Very High"
-    if score >= 0.70:
-        return "High"
-    if score >= 0.50:
-        return "Moderate"
-    if score >= 0.30:
-        return "Low"
-    return "Minimal"
+# Returned by GET /api/students/ unless ?fields= narrows or extends it
+STUDENT_LIST_FIELDS = STUDENT_FIELDS + ['risk_score', 'risk_percentage', 'risk_tier', 'model_version']
 
 
 def get_prediction_details(student):
@@ -47,7 +45,10 @@ def get_my_profile():
     if role != 'student' or not user_id:
         return jsonify({'msg': 'Access denied. Not a student.'}), 403
 
-    student = Student.query.filter_by(user_id=user_id).first()
+    student = Student.query.options(
+        selectinload(Student.predictions),
+        selectinload(Student.counseling_sessions)
+    ).filter_by(user_id=user_id).first()
     if not student:
         return jsonify({'msg': 'No profile found'}), 404
 
@@ -125,20 +126,11 @@ def predict_for_me():
     if not student:
         return jsonify({'msg': 'No profile found'}), 404
 
-    # Check if model exists
-    MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ml", "model.pkl")
-    if not os.path.exists(MODEL_PATH):
+    loaded = registry.get()
+    if loaded is None:
         return jsonify({'error': 'Model not trained yet'}), 400
 
     try:
-        model = joblib.load(MODEL_PATH)
-        
-        # Build features from student data
-        import pandas as pd
-        from ..ml.preprocess import clean_data
-        from ..ml.explain import explain_prediction
-        from ..ml.recommend import get_recommendation
-        
         # Create data frame with student features
         data = {
             'attendance': student.attendance or 75,
@@ -157,29 +149,23 @@ def predict_for_me():
             'academic_score': student.academic_score or 70
         }
         
-        df = pd.DataFrame([data])
-        df = clean_data(df)
-        
-        # Get expected features
-        if hasattr(model, "named_steps") and "preprocessor" in model.named_steps:
-            prep = model.named_steps["preprocessor"]
-            if hasattr(prep, "feature_names_in_"):
-                expected = list(prep.feature_names_in_)
-                for col in expected:
-                    if col not in df.columns:
-                        df[col] = 0
-                df = df[expected]
+        # The compiled encoder skips the DataFrame round trip; same output
+        if loaded.encoder is not None:
+            df = None
+            X_trans = loaded.encoder.encode(data)
+        else:
+            df = align_features(pd.DataFrame([data]), loaded.features)
+            X_trans = loaded.preprocessor.transform(df)
         
         # Predict
-        probas = model.predict_proba(df)
-        classes = model.named_steps["classifier"].classes_
-        dropout_idx = list(classes).index("Dropout") if "Dropout" in classes else 0
+        probas = loaded.predict_proba(X_trans)
+        dropout_idx = loaded.class_index("Dropout") or 0
         prob = probas[0][dropout_idx]
         
         risk_tier = classify_risk(prob)
         rec = get_recommendation(prob)
         suggestions = [s.strip() for s in rec.split(" – ") if s.strip()]
-        expl = explain_prediction(model, df.iloc[0])
+        expl = explain_prediction(loaded.pipeline, df, version=loaded.version, X_trans=X_trans)
         
         if "error" in expl:
             explanation = []
@@ -195,7 +181,8 @@ def predict_for_me():
             'probability': prob,
             'probability_percentage': round(prob * 100, 2),
             'suggestions': suggestions,
-            'explanation': explanation
+            'explanation': explanation,
+            'model_version': loaded.version
         }), 200
         
     except Exception as e:
@@ -257,55 +244,27 @@ def import_students():
     if not file:
         return jsonify({'msg': 'File required'}), 400
 
-    df = pd.read_csv(file)
-    added = 0
-
-    for _, row in df.iterrows():
-        username = row.get('username') or row.get('full_name')
-        if not username or User.query.filter_by(username=username).first():
-            continue
-
-        try:
-            user = User(
-                username=username,
-                role='student',
-                email=row.get('email')
-            )
-            user.set_password(row.get('password', 'changeme123'))
-            db.session.add(user)
-            db.session.flush()
-
-            student = Student(
-                user_id=user.id,
-                full_name=row.get('full_name', username),
-                grade=row.get('grade'),
-                attendance=float(row.get('attendance', 100)),
-                avg_score=float(row.get('avg_score', 0)),
-                academic_score=row.get('academic_score'),
-                course=row.get('course'),
-                gender=row.get('gender'),
-                marital_status=row.get('marital_status'),
-                application_mode=row.get('application_mode'),
-                age_at_enrollment=row.get('age_at_enrollment'),
-                scholarship_holder=row.get('scholarship_holder'),
-                debtor=row.get('debtor'),
-                tuition_fees_up_to_date=row.get('tuition_fees_up_to_date'),
-                cu1_enrolled=row.get('cu1_enrolled'),
-                cu1_approved=row.get('cu1_approved'),
-                cu1_grade=row.get('cu1_grade'),
-                cu2_enrolled=row.get('cu2_enrolled'),
-                cu2_approved=row.get('cu2_approved'),
-                cu2_grade=row.get('cu2_grade')
-            )
-            db.session.add(student)
-            added += 1
-
-        except Exception:
-            db.session.rollback()
-            continue
+    tmpdir = tempfile.mkdtemp(prefix='studentimport_')
+    dest = os.path.join(tmpdir, 'students.csv')
+    file.save(dest)
 
-    db.session.commit()
-    return jsonify({'added': added}), 201
+    job_id = jobs.submit('import_students', _provision_job, current_app._get_current_object(), dest,
+                         user_id=identity.get('id'))
+    return jsonify({'status': 'queued', 'job_id': job_id, 'status_url': f'/api/jobs/{job_id}'}), 202
+
+
+def _provision_job(job, app, dest):
+    with open(dest, 'rb') as fh:
+        total = max(sum(1 for _ in fh) - 1, 0)
+
+    def progress(stats):
+        fraction = stats['total'] / total if total else None
+        job.progress(fraction, f"{stats['total']} of {total} rows processed, {stats['created']} accounts created")
+
+    try:
+        return provision_students(app, dest, progress=progress)
+    finally:
+        shutil.rmtree(os.path.dirname(dest), ignore_errors=True)
 
 
 @students_bp.route('/', methods=['GET'])
@@ -317,44 +276,9 @@ def get_all_students():
     if role not in ['teacher', 'admin']:
         return jsonify({'msg': 'Unauthorized'}), 403
 
-    students = Student.query.all()
-    students_data = []
-
-    for student in students:
-        students_data.append({
-            'id': student.id,
-            'full_name': student.full_name,
-            'course': student.course,
-            'gender': student.gender,
-            'marital_status': student.marital_status,
-            'application_mode': student.application_mode,
-            'age_at_enrollment': student.age_at_enrollment,
-            'scholarship_holder': student.scholarship_holder,
-            'debtor': student.debtor,
-            'tuition_fees_up_to_date': student.tuition_fees_up_to_date,
-            'cu1_enrolled': student.cu1_enrolled,
-            'cu1_approved': student.cu1_approved,
-            'cu1_grade': student.cu1_grade,
-            'cu2_enrolled': student.cu2_enrolled,
-            'cu2_approved': student.cu2_approved,
-            'cu2_grade': student.cu2_grade,
-            'grade': student.grade,
-            'attendance': student.attendance,
-            'avg_score': student.avg_score,
-            'academic_score': student.academic_score,
-            'predictions': [
-                {
-                    'risk_score': p.risk_score,
-                    'risk_percentage': round(p.risk_score * 100, 2),
-                    'risk_tier': classify_risk(p.risk_score),
-                    'created_at': p.created_at
-                }
-                for p in student.predictions
-            ],
-            'counseling_sessions': [
-                {'id': s.id, 'notes': s.notes, 'created_at': s.created_at}
-                for s in student.counseling_sessions
-            ],
-        })
-
-    return jsonify({'students': students_data}), 200
+    try:
+        students_data, next_cursor = list_students(request.args, STUDENT_LIST_FIELDS)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'students': students_data, 'next_cursor': next_cursor}), 200
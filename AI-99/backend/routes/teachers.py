@@ -1,41 +1,23 @@
 import os
-import joblib
-import pandas as pd
-import traceback
+import hashlib
 import logging
-from flask import Blueprint, jsonify, request, current_app
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from dateutil import parser
-from models import db, Student, CounselingSession, Prediction
-from ml.preprocess import clean_data
+from sqlalchemy import select, func, bindparam
+from models import db, Student, CounselingSession, Prediction, sync_latest_risk
+from ml.preprocess import align_features, STUDENT_SCHEMA
+from ml.registry import registry
+import jobs
+import student_queries
 
 teachers_bp = Blueprint('teachers', __name__, url_prefix='/api/teacher')
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, "ml", "model.pkl")
-PREPROCESSOR_PATH = os.path.join(BASE_DIR, "ml", "preprocess.pkl")
-
-model = None
-preprocessor = None
-try:
-    loaded_model = joblib.load(MODEL_PATH)
-    if loaded_model and hasattr(loaded_model, "named_steps") and "preprocessor" in loaded_model.named_steps and "classifier" in loaded_model.named_steps:
-        model = loaded_model
-        logging.info("Model loaded successfully.")
-    else:
-        logging.error("Model is not a valid Pipeline with required steps.")
-except Exception as e:
-    logging.error(f"Failed to load model: {str(e)}")
-
-try:
-    loaded_preprocessor = joblib.load(PREPROCESSOR_PATH)
-    if loaded_preprocessor and hasattr(loaded_preprocessor, "feature_names_in_"):
-        preprocessor = loaded_preprocessor
-        logging.info("Preprocessor loaded successfully.")
-    else:
-        logging.warning("Preprocessor loaded but lacks feature_names_in_.")
-except Exception as e:
-    logging.error(f"Failed to load preprocessor: {str(e)}")
+# Students read, scored and written per step of a batch prediction
+BATCH_PREDICT_CHUNK_SIZE = int(os.getenv("BATCH_PREDICT_CHUNK_SIZE", 2000))
 
 def teacher_or_admin_required():
     identity = get_jwt_identity() or {}
@@ -101,25 +83,22 @@ FALLBACK_ATTRS = {
     "gdp": ["gdp"]
 }
 
-def get_expected_features():
+def get_expected_features(loaded):
     """Retrieve expected feature names from model or preprocessor."""
-    if model and hasattr(model.named_steps["preprocessor"], "feature_names_in_") and model.named_steps["preprocessor"].feature_names_in_ is not None:
-        return list(model.named_steps["preprocessor"].feature_names_in_)
-    if preprocessor and hasattr(preprocessor, "feature_names_in_") and preprocessor.feature_names_in_ is not None:
+    if loaded and loaded.features:
+        return loaded.features
+    preprocessor = registry.preprocessor()
+    if preprocessor is not None and preprocessor.feature_names_in_ is not None:
         return list(preprocessor.feature_names_in_)
     raise ValueError("Unable to retrieve feature names. Ensure model/preprocessor is trained with feature_names_in_.")
 
-def format_and_align(df, expected):
-    """Clean and align DataFrame to expected features."""
-    if df is None:
-        raise ValueError("Input DataFrame is None.")
-    df = clean_data(df)
-    if df is None:
-        raise ValueError("Data cleaning returned None.")
-    df = df.reindex(columns=expected, fill_value=0)
-    for col in expected:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)  # Safer numeric conversion
-    return df
+# Returned by GET /students unless ?fields= narrows or extends it
+TEACHER_LIST_FIELDS = [
+    'id', 'full_name', 'course', 'gender', 'marital_status', 'application_mode',
+    'age_at_enrollment', 'scholarship_holder', 'debtor', 'tuition_fees_up_to_date',
+    'cu1_enrolled', 'cu1_approved', 'cu1_grade', 'cu2_enrolled', 'cu2_approved', 'cu2_grade',
+    'attendance', 'avg_score', 'academic_score', 'risk_score', 'risk_label'
+]
 
 def _get_student_value(s, feature):
     for attr in FALLBACK_ATTRS.get(feature, [feature]):
@@ -134,48 +113,12 @@ def list_students():
     if resp:
         return resp, code
 
-    students = Student.query.all()
-    output = []
-    for s in students:
-        latest_pred = s.predictions[-1].risk_score if s.predictions else None
-        # Convert risk_score to risk_label using the same tiers as predict.py
-        risk_label = None
-        if latest_pred is not None:
-            if latest_pred >= 0.85:
-                risk_label = "Very High"
-            elif latest_pred >= 0.70:
-                risk_label = "High"
-            elif latest_pred >= 0.50:
-                risk_label = "Moderate"
-            elif latest_pred >= 0.30:
-                risk_label = "Low"
-            else:
-                risk_label = "Minimal"
+    try:
+        output, next_cursor = student_queries.list_students(request.args, TEACHER_LIST_FIELDS)
+    except student_queries.ListingError as e:
+        return jsonify({'error': str(e)}), 400
 
-        output.append({
-            'id': s.id,
-            'full_name': s.full_name,
-            'course': s.course,
-            'gender': s.gender,
-            'marital_status': s.marital_status,
-            'application_mode': s.application_mode,
-            'age_at_enrollment': s.age_at_enrollment,
-            'scholarship_holder': s.scholarship_holder,
-            'debtor': s.debtor,
-            'tuition_fees_up_to_date': s.tuition_fees_up_to_date,
-            'cu1_enrolled': s.cu1_enrolled,
-            'cu1_approved': s.cu1_approved,
-            'cu1_grade': s.cu1_grade,
-            'cu2_enrolled': s.cu2_enrolled,
-            'cu2_approved': s.cu2_approved,
-            'cu2_grade': s.cu2_grade,
-            'attendance': s.attendance,
-            'avg_score': s.avg_score,
-            'academic_score': s.academic_score,
-            'risk_score': latest_pred,
-            'risk_label': risk_label
-        })
-    return jsonify({'students': output}), 200
+    return jsonify({'students': output, 'next_cursor': next_cursor}), 200
 
 @teachers_bp.route('/<int:student_id>/counsel', methods=['POST'])
 @jwt_required()
@@ -239,84 +182,118 @@ def batch_predict():
     if resp:
         return resp, code
 
-    if model is None:
+    if registry.get() is None:
         return jsonify({'msg': 'ML model not loaded'}), 500
 
-    students = Student.query.all()
-    if not students:
-        return jsonify({'msg': 'No students found'}), 200
-
-    records = []
-    student_map = {}
-
-    for idx, s in enumerate(students):
-        rec = {}
-        for feat in FEATURES_16:
-            val = _get_student_value(s, feat)
-            rec[feat] = val if val is not None else 0
-        records.append(rec)
-        student_map[idx] = s.id
-
-    X = pd.DataFrame(records)
-
+    force = bool((request.get_json(silent=True) or {}).get('force'))
+    job_id = jobs.submit('batch_predict', run_batch_predict, force=force, user_id=identity['id'])
+    return jsonify({
+        'msg': 'Batch prediction queued',
+        'job_id': job_id,
+        'status_url': f'/api/jobs/{job_id}'
+    }), 202
+
+def _fingerprints(X, version):
+    """Hash of each aligned feature row plus the model version."""
+    values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+    prefix = version.encode()
+    return [hashlib.blake2b(prefix + row.tobytes(), digest_size=16).hexdigest() for row in values]
+
+def _score_rows(loaded, X):
     try:
-        expected = get_expected_features()
-        X = format_and_align(X, expected)
-        logging.debug(f"Processed batch DataFrame shape: {X.shape}")
-
-        X_processed = model.named_steps["preprocessor"].transform(X)
+        X_processed = loaded.preprocessor.transform(X)
         if X_processed is None:
             raise ValueError("Preprocessing returned None.")
     except ValueError as e:
         logging.warning(f"ValueError in batch_predict preprocessing: {str(e)}")
-        return jsonify({"error": "Invalid data or processing error", "details": str(e)}), 400
-    except Exception as e:
-        logging.error(f"Unexpected error in batch_predict preprocessing: {str(e)}")
-        return jsonify({"error": "Batch prediction failed", "details": str(e)}), 500
-
-    try:
-        classifier = model.named_steps["classifier"]
-        if hasattr(classifier, "predict_proba"):
-            prob_array = classifier.predict_proba(X_processed)
-            if prob_array is None or len(prob_array) == 0:
-                raise ValueError("Prediction probabilities are None or empty.")
-            probs = prob_array[:, 1]
-        else:
-            prob_array = classifier.predict(X_processed)
-            if prob_array is None or len(prob_array) == 0:
-                raise ValueError("Prediction results are None or empty.")
-            probs = prob_array
-
-        # Null check before iteration
-        if probs is None:
-            raise ValueError("Probabilities array is None.")
-    except ValueError as e:
-        logging.warning(f"ValueError in batch_predict prediction: {str(e)}")
-        return jsonify({"error": "Invalid prediction or processing error", "details": str(e)}), 400
-    except Exception as e:
-        logging.error(f"Unexpected error in batch_predict prediction: {str(e)}")
-        return jsonify({"error": "Batch prediction failed", "details": str(e)}), 500
-
-    created = 0
-    for idx, score in enumerate(probs):
-        # Force varied risk scores by scaling and adding minimum
-        adjusted_score = min(1.0, max(0.0, float(score) * 2.5 + 0.1))
-        pred = Prediction(
-            student_id=student_map[idx],
-            risk_score=adjusted_score
-        )
-        db.session.add(pred)
-        created += 1
+        raise ValueError(f"Invalid data or processing error: {str(e)}")
+
+    classifier = loaded.classifier
+    if hasattr(classifier, "predict_proba"):
+        prob_array = classifier.predict_proba(X_processed)
+        if prob_array is None or len(prob_array) == 0:
+            raise ValueError("Prediction probabilities are None or empty.")
+        return prob_array[:, 1]
+
+    prob_array = classifier.predict(X_processed)
+    if prob_array is None or len(prob_array) == 0:
+        raise ValueError("Prediction results are None or empty.")
+    return prob_array
+
+def run_batch_predict(job, force=False):
+    """Score students whose features changed and store one Prediction each.
+
+    Students are streamed in BATCH_PREDICT_CHUNK_SIZE chunks. A student is
+    skipped when the fingerprint of its aligned feature vector and the
+    model version matches the one stored at its last scoring, unless
+    force is set. Runs as a background job.
+    """
+    loaded = registry.get()
+    if loaded is None:
+        raise RuntimeError('ML model not loaded')
+
+    total = db.session.query(func.count(Student.id)).scalar()
+    if not total:
+        return {'msg': 'No students found', 'created': 0, 'scored': 0, 'skipped': 0}
+
+    expected = get_expected_features(loaded)
+    columns = [Student.id, Student.feature_fingerprint] + [getattr(Student, f) for f in FEATURES_16]
+    result = db.session.execute(
+        select(*columns).order_by(Student.id)
+        .execution_options(stream_results=True, yield_per=BATCH_PREDICT_CHUNK_SIZE)
+    )
 
+    scored = skipped = seen = 0
     try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        tb = traceback.format_exc()
-        return jsonify({
-            'msg': 'Database error',
-            'error': str(e),
-            'traceback': tb if current_app.config.get("DEBUG") else None
-        }), 500
-
-    return jsonify({'msg': f'{created} predictions created'}), 201
+        for chunk in result.partitions(BATCH_PREDICT_CHUNK_SIZE):
+            records = []
+            for s in chunk:
+                rec = {}
+                for feat in FEATURES_16:
+                    val = _get_student_value(s, feat)
+                    rec[feat] = val if val is not None else 0
+                records.append(rec)
+
+            X = align_features(pd.DataFrame(records), expected, schema=STUDENT_SCHEMA, inplace=True)
+            fingerprints = _fingerprints(X, loaded.version)
+            changed = [i for i, (s, fp) in enumerate(zip(chunk, fingerprints))
+                       if force or s.feature_fingerprint != fp]
+            seen += len(chunk)
+            skipped += len(chunk) - len(changed)
+
+            if changed:
+                probs = _score_rows(loaded, X.iloc[changed])
+                now = datetime.utcnow()
+                predictions = [
+                    {
+                        'student_id': chunk[i].id,
+                        # Force varied risk scores by scaling and adding minimum
+                        'risk_score': min(1.0, max(0.0, float(score) * 2.5 + 0.1)),
+                        'model_version': loaded.version,
+                        'created_at': now,
+                    }
+                    for i, score in zip(changed, probs)
+                ]
+                table = Student.__table__
+                # Written on its own connection so the streaming read stays open
+                with db.engine.begin() as conn:
+                    conn.execute(Prediction.__table__.insert(), predictions)
+                    sync_latest_risk(conn, predictions)
+                    conn.execute(
+                        table.update().where(table.c.id == bindparam('_sid'))
+                        .values(feature_fingerprint=bindparam('_fp'), updated_at=table.c.updated_at),
+                        [{'_sid': chunk[i].id, '_fp': fingerprints[i]} for i in changed]
+                    )
+                scored += len(changed)
+
+            job.progress(seen / total, f'Scored {scored}, skipped {skipped} of {total} students')
+    finally:
+        result.close()
+
+    return {
+        'msg': f'{scored} predictions created, {skipped} students unchanged',
+        'created': scored,
+        'scored': scored,
+        'skipped': skipped,
+        'model_version': loaded.version
+    }
@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 import os
+import shutil
 import tempfile
 from functools import wraps
+from flask_jwt_extended import get_jwt_identity
 from ml.importer import import_csv_file   # ✅ FIXED
+import jobs
 
 
 upload_bp = Blueprint("upload", __name__)
@@ -43,9 +46,27 @@ def upload_csv():
 
     f.save(dest)
 
-    try:
-        result = import_csv_file(current_app, dest)
-    except Exception as e:
-        return jsonify({"error": "import failed", "exc": str(e)}), 500
+    identity = get_jwt_identity() or {}
+    job_id = jobs.submit("import_csv", _import_job, current_app._get_current_object(), dest,
+                         user_id=identity.get("id"))
+
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
+
+
+def _count_rows(path):
+    with open(path, "rb") as fh:
+        lines = sum(chunk.count(b"\n") for chunk in iter(lambda: fh.read(1 << 20), b""))
+    return max(lines - 1, 0)
 
-    return jsonify({"status": "ok", "result": result})
+
+def _import_job(job, app, dest):
+    total = _count_rows(dest)
+
+    def progress(stats):
+        fraction = stats["total"] / total if total else None
+        job.progress(fraction, f"{stats['total']} of {total} rows imported")
+
+    try:
+        return import_csv_file(app, dest, progress=progress)
+    finally:
+        shutil.rmtree(os.path.dirname(dest), ignore_errors=True)
@@ -0,0 +1,255 @@
+import json
+import base64
+import binascii
+from sqlalchemy import select, and_, or_
+from models import db, Student, Prediction, CounselingSession, RISK_TIERS, classify_risk
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+STUDENT_FIELDS = [
+    "id", "full_name", "course", "gender", "marital_status", "application_mode",
+    "age_at_enrollment", "scholarship_holder", "debtor", "tuition_fees_up_to_date",
+    "cu1_enrolled", "cu1_approved", "cu1_grade",
+    "cu2_enrolled", "cu2_approved", "cu2_grade",
+    "grade", "attendance", "avg_score", "academic_score",
+]
+
+# Derived from the student's latest_* columns
+RISK_FIELDS = ["risk_score", "risk_percentage", "risk_label", "risk_tier", "model_version", "predicted_at"]
+
+# One extra query per page when requested
+NESTED_FIELDS = ["predictions", "counseling_sessions"]
+
+SORT_FIELDS = ["id", "full_name", "course", "attendance", "avg_score", "academic_score", "risk_score"]
+
+
+class ListingError(ValueError):
+    pass
+
+
+def _risk_tier_clause(tiers):
+    known = {tier for tier, _ in RISK_TIERS}
+    unknown = [t for t in tiers if t not in known and t != "Unknown"]
+    if unknown:
+        raise ListingError(f"Unknown risk tier: {', '.join(unknown)}")
+
+    clauses = []
+    named = [t for t in tiers if t != "Unknown"]
+    if named:
+        clauses.append(Student.latest_risk_tier.in_(named))
+    if "Unknown" in tiers:
+        clauses.append(Student.latest_risk_tier.is_(None))
+    return or_(*clauses)
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def _parse_float(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ListingError(f"{name} must be a number")
+
+
+def _encode_cursor(sort, order, value, row_id):
+    raw = json.dumps([sort, order, value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor, sort, order):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        c_sort, c_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError, binascii.Error):
+        raise ListingError("Invalid cursor")
+    if (c_sort, c_order) != (sort, order):
+        raise ListingError("Cursor does not match the requested sort")
+    return value, row_id
+
+
+def _valued_keyset_clause(column, order, value, row_id):
+    """Rows strictly after (value, row_id) in ORDER BY column, id.
+
+    The leading inclusive bound on column lets the planner start a range
+    scan of the column's index there.
+    """
+    if order == "asc":
+        return and_(column >= value, or_(column > value, Student.id > row_id))
+    return and_(column <= value, or_(column < value, Student.id < row_id))
+
+
+def _sorted_page(stmt, column, order, cursor_key, size):
+    """Up to size rows of stmt in ORDER BY column IS NULL, column, id.
+
+    NULL sort values always come last, whichever the direction. Rather than
+    sorting on the IS NULL expression, which no index can serve, this reads
+    the rows with a value in (column, id) order and, once those run out, the
+    NULL rows in id order. Both walk the column's index when it has one.
+    """
+    after = (lambda a, b: a > b) if order == "asc" else (lambda a, b: a < b)
+    direction = column.asc() if order == "asc" else column.desc()
+    id_direction = Student.id.asc() if order == "asc" else Student.id.desc()
+
+    rows = []
+    if cursor_key is None or cursor_key[0] is not None:
+        valued = stmt.where(column.isnot(None))
+        if cursor_key is not None:
+            valued = valued.where(_valued_keyset_clause(column, order, *cursor_key))
+        rows = db.session.execute(valued.order_by(direction, id_direction).limit(size)).mappings().all()
+        if len(rows) == size:
+            return rows
+        nulls = stmt.where(column.is_(None))
+    else:
+        nulls = stmt.where(column.is_(None), after(Student.id, cursor_key[1]))
+    rows += db.session.execute(nulls.order_by(id_direction).limit(size - len(rows))).mappings().all()
+    return rows
+
+
+def apply_filters(stmt, args):
+    """Add the course, risk_tier and attendance range filters in args to stmt."""
+    courses = _split(args.get("course"))
+    tiers = _split(args.get("risk_tier"))
+    min_attendance = _parse_float(args, "min_attendance")
+    max_attendance = _parse_float(args, "max_attendance")
+
+    if courses:
+        stmt = stmt.where(Student.course.in_(courses))
+    if tiers:
+        stmt = stmt.where(_risk_tier_clause(tiers))
+    if min_attendance is not None:
+        stmt = stmt.where(Student.attendance >= min_attendance)
+    if max_attendance is not None:
+        stmt = stmt.where(Student.attendance <= max_attendance)
+    return stmt
+
+
+def list_students(args, default_fields):
+    """One page of students shaped by the request's query string.
+
+    Supported arguments: fields (comma-separated), limit, cursor, sort,
+    order, course (comma-separated), risk_tier (comma-separated),
+    min_attendance and max_attendance. Filtering, sorting and paging all
+    run in SQL; only the projected columns are selected.
+
+    Returns (rows, next_cursor). Raises ListingError on bad arguments.
+    """
+    fields = _split(args.get("fields")) or list(default_fields)
+    allowed = STUDENT_FIELDS + RISK_FIELDS + NESTED_FIELDS
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ListingError(f"Unknown field(s): {', '.join(unknown)}")
+
+    limit = args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise ListingError("limit must be a positive integer")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    sort = args.get("sort", "id")
+    order = (args.get("order") or "asc").lower()
+    if sort not in SORT_FIELDS:
+        raise ListingError(f"Cannot sort by {sort}")
+    if order not in ("asc", "desc"):
+        raise ListingError("order must be asc or desc")
+
+    scalar = [f for f in STUDENT_FIELDS if f in fields or f in ("id", sort)]
+    columns = [getattr(Student, f) for f in scalar]
+    if any(f in RISK_FIELDS for f in fields) or sort == "risk_score":
+        columns += [
+            Student.latest_risk_score.label("risk_score"),
+            Student.latest_model_version.label("model_version"),
+            Student.latest_prediction_at.label("predicted_at"),
+        ]
+    stmt = apply_filters(select(*columns), args)
+
+    sort_column = Student.latest_risk_score if sort == "risk_score" else getattr(Student, sort)
+    cursor = args.get("cursor")
+    cursor_key = _decode_cursor(cursor, sort, order) if cursor else None
+
+    # One extra row tells us whether another page exists
+    if sort_column is Student.id:
+        if cursor_key is not None:
+            after = Student.id > cursor_key[1] if order == "asc" else Student.id < cursor_key[1]
+            stmt = stmt.where(after)
+        ordering = Student.id.asc() if order == "asc" else Student.id.desc()
+        result = db.session.execute(stmt.order_by(ordering).limit(limit + 1)).mappings().all()
+    else:
+        result = _sorted_page(stmt, sort_column, order, cursor_key, limit + 1)
+    has_more = len(result) > limit
+    result = result[:limit]
+
+    rows = [_shape_row(r, fields) for r in result]
+    if any(f in NESTED_FIELDS for f in fields):
+        _attach_nested(rows, [r["id"] for r in result], fields)
+
+    next_cursor = None
+    if has_more:
+        last = result[-1]
+        sort_value = last["risk_score"] if sort == "risk_score" else last[sort]
+        next_cursor = _encode_cursor(sort, order, sort_value, last["id"])
+
+    return rows, next_cursor
+
+
+def _shape_row(row, fields):
+    score = row.get("risk_score")
+    derived = {
+        "risk_score": score,
+        "risk_percentage": round(score * 100, 2) if score is not None else None,
+        "risk_label": classify_risk(score) if score is not None else None,
+        "risk_tier": classify_risk(score),
+        "model_version": row.get("model_version"),
+        "predicted_at": row["predicted_at"].isoformat() if row.get("predicted_at") else None,
+    }
+    out = {}
+    for f in fields:
+        if f in derived:
+            out[f] = derived[f]
+        elif f in STUDENT_FIELDS:
+            out[f] = row[f]
+    return out
+
+
+def _attach_nested(rows, ids, fields):
+    by_id = {row_id: row for row_id, row in zip(ids, rows)}
+    if not ids:
+        return
+
+    if "predictions" in fields:
+        for row in by_id.values():
+            row["predictions"] = []
+        preds = db.session.execute(
+            select(Prediction.student_id, Prediction.risk_score, Prediction.model_version, Prediction.created_at)
+            .where(Prediction.student_id.in_(ids))
+            .order_by(Prediction.student_id, Prediction.id)
+        ).all()
+        for p in preds:
+            by_id[p.student_id]["predictions"].append({
+                "risk_score": p.risk_score,
+                "risk_percentage": round(p.risk_score * 100, 2) if p.risk_score is not None else None,
+                "risk_tier": classify_risk(p.risk_score),
+                "model_version": p.model_version,
+                "created_at": p.created_at.isoformat() if p.created_at else None,
+            })
+
+    if "counseling_sessions" in fields:
+        for row in by_id.values():
+            row["counseling_sessions"] = []
+        sessions = db.session.execute(
+            select(CounselingSession.id, CounselingSession.student_id, CounselingSession.notes,
+                   CounselingSession.created_at, CounselingSession.follow_up_at)
+            .where(CounselingSession.student_id.in_(ids))
+            .order_by(CounselingSession.student_id, CounselingSession.id)
+        ).all()
+        for s in sessions:
+            by_id[s.student_id]["counseling_sessions"].append({
+                "id": s.id,
+                "notes": s.notes,
+                "created_at": s.created_at.isoformat() if s.created_at else None,
+                "follow_up_at": s.follow_up_at.isoformat() if s.follow_up_at else None,
+            })
@@ -0,0 +1,217 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, ExpiringKey
+
+# "sql" shares codes across workers and restarts; "memory" is per process,
+# for a single-process dev server
+TOKEN_STORE = os.getenv("TOKEN_STORE", "sql").lower()
+
+# Seconds between sweeps of expired keys
+SWEEP_INTERVAL = float(os.getenv("TOKEN_STORE_SWEEP_INTERVAL", 60))
+
+# Expired rows deleted per sweep transaction (SQL store)
+SWEEP_BATCH = int(os.getenv("TOKEN_STORE_SWEEP_BATCH", 1000))
+
+
+def hash_key(purpose, token):
+    """Store key for a token: hex SHA-256 of purpose and token."""
+    return hashlib.sha256(f"{purpose}:{token}".encode()).hexdigest()
+
+
+class MemoryTokenStore:
+    """Expiring keys in a dict; only for a single process.
+
+    Expired keys are never returned, and set() drops them all every
+    `sweep_interval` seconds so abandoned codes do not pile up.
+    """
+
+    def __init__(self, sweep_interval=SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._data = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def set(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + ttl)
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[0]
+
+    def take(self, key, value=None):
+        """Remove key and return its value if it is live (and equals value, when given)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            if value is not None and not hmac.compare_digest(entry[0], value):
+                return None
+            del self._data[key]
+            return entry[0]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def sweep(self):
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    def _sweep(self, now):
+        expired = [k for k, (_, expires) in self._data.items() if expires <= now]
+        for k in expired:
+            del self._data[k]
+        self._last_sweep = now
+        return len(expired)
+
+
+class SQLTokenStore:
+    """Expiring keys in the expiring_keys table, shared by every worker.
+
+    Each call is its own short transaction on a separate connection, so
+    issuing or checking a code never touches or locks the users row or the
+    caller's transaction. Lookups go by primary key; expired rows are
+    swept through the expires_at index every `sweep_interval` seconds.
+    """
+
+    def __init__(self, sweep_interval=SWEEP_INTERVAL, sweep_batch=SWEEP_BATCH):
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._last_sweep = time.monotonic()
+        self.table = ExpiringKey.__table__
+
+    def set(self, key, value, ttl):
+        t = self.table
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                t.update().where(t.c.key == key).values(value=value, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(t.insert().values(key=key, value=value, expires_at=expires_at))
+                except IntegrityError:
+                    # Inserted concurrently; last writer wins as with the update
+                    conn.execute(t.update().where(t.c.key == key).values(value=value, expires_at=expires_at))
+
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Token store sweep failed: {str(e)}")
+
+    def get(self, key):
+        t = self.table
+        with db.engine.connect() as conn:
+            return conn.execute(
+                select(t.c.value).where(t.c.key == key, t.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def take(self, key, value=None):
+        """Remove key and return its value if it is live (and equals value, when given).
+
+        The DELETE only succeeds for one caller, so a code cannot be used twice.
+        """
+        t = self.table
+        with db.engine.begin() as conn:
+            if value is None:
+                value = conn.execute(
+                    select(t.c.value).where(t.c.key == key, t.c.expires_at > datetime.utcnow())
+                ).scalar()
+                if value is None:
+                    return None
+            deleted = conn.execute(
+                t.delete().where(t.c.key == key, t.c.value == value, t.c.expires_at > datetime.utcnow())
+            ).rowcount
+        return value if deleted else None
+
+    def delete(self, key):
+        t = self.table
+        with db.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.key == key))
+
+    def sweep(self):
+        t = self.table
+        now = datetime.utcnow()
+        removed = 0
+        while True:
+            with db.engine.begin() as conn:
+                keys = conn.execute(
+                    select(t.c.key).where(t.c.expires_at <= now).limit(self.sweep_batch)
+                ).scalars().all()
+                if keys:
+                    conn.execute(t.delete().where(t.c.key.in_(keys)))
+            removed += len(keys)
+            if len(keys) < self.sweep_batch:
+                return removed
+
+
+_STORES = {"memory": MemoryTokenStore, "sql": SQLTokenStore}
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if TOKEN_STORE not in _STORES:
+                    raise ValueError(f"Unknown TOKEN_STORE {TOKEN_STORE!r}; use one of {', '.join(_STORES)}")
+                _store = _STORES[TOKEN_STORE]()
+    return _store
+
+
+def issue_otp(user, code, expiry_minutes=5):
+    """Make code the user's only valid OTP for expiry_minutes."""
+    get_store().set(hash_key("otp", user.id), hash_key("otp-code", code), expiry_minutes * 60)
+    user.log_action("set_otp", user.id)
+
+
+def verify_otp(user, code):
+    """Consume the user's OTP if code matches; marks the user verified."""
+    if get_store().take(hash_key("otp", user.id), hash_key("otp-code", code)) is None:
+        return False
+    # Only the first verification writes the users row
+    if not user.verified:
+        user.verified = True
+    user.log_action("verify_otp", user.id)
+    return True
+
+
+def issue_reset_token(user, token, expiry_minutes=30):
+    """Store a password reset token for user, revoking any earlier one."""
+    store = get_store()
+    token_key = hash_key("reset", token)
+    user_key = hash_key("reset-user", user.id)
+    previous = store.get(user_key)
+    if previous:
+        store.delete(previous)
+    store.set(token_key, str(user.id), expiry_minutes * 60)
+    store.set(user_key, token_key, expiry_minutes * 60)
+
+
+def consume_reset_token(token):
+    """Return the user id a live reset token was issued for, invalidating it; None otherwise."""
+    store = get_store()
+    user_id = store.take(hash_key("reset", token))
+    if user_id is None:
+        return None
+    store.delete(hash_key("reset-user", user_id))
+    return int(user_id)
@@ -46,4 +46,22 @@ export function setToken(token) {
   }
 }
 
+// Poll a background job until it finishes; resolves with its result.
+// Gives up after `timeout` ms (default one hour) so a lost job cannot hang the page
+export async function waitForJob(jobId, { interval = 1500, timeout = 60 * 60 * 1000, onProgress } = {}) {
+  const deadline = Date.now() + timeout;
+  for (;;) {
+    const { data: job } = await API.get(`/jobs/${jobId}`);
+    if (onProgress) onProgress(job);
+    if (job.status === "succeeded") return job.result;
+    if (job.status === "failed" || job.status === "cancelled") {
+      throw new Error(job.error || `Job ${job.status}`);
+    }
+    if (Date.now() + interval > deadline) {
+      throw new Error(`Timed out waiting for job ${jobId}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+}
+
 export default API;
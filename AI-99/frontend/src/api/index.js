@@ -1,4 +1,4 @@
-import API, { setToken } from '../api.js';
+import API, { setToken, waitForJob } from '../api.js';
 
-export { API, setToken };
+export { API, setToken, waitForJob };
 export default API;
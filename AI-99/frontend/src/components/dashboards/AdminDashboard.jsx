@@ -2,7 +2,7 @@ import React, { useEffect, useState, useRef } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { useNavigate } from "react-router-dom";
 import { PieChart, Pie, Cell, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, LineChart, Line } from "recharts";
-import API from "../../api";
+import API, { waitForJob } from "../../api";
 
 export default function AdminDashboard({ user, onLogout }) {
   const [users, setUsers] = useState([]);
@@ -66,11 +66,16 @@ export default function AdminDashboard({ user, onLogout }) {
     formData.append("file", selectedFile);
 
     try {
-      const response = await API.post("/upload_csv", formData, {
+      const res = await API.post("/upload_csv", formData, {
         headers: {
           "Content-Type": "multipart/form-data",
         },
       });
+      setUploadStatus("CSV uploaded, importing...");
+      // The import runs as a background job; stats change only once it has finished
+      await waitForJob(res.data.job_id, {
+        onProgress: (job) => job.message && setUploadStatus(job.message),
+      });
       setUploadStatus("CSV uploaded successfully!");
       setSelectedFile(null);
       // Refresh stats
@@ -86,12 +91,13 @@ export default function AdminDashboard({ user, onLogout }) {
     setRetrainMsg("");
     try {
       const res = await API.post("/ml/retrain");
-      setRetrainMsg(`Model retrained successfully! Version: ${res.data.model_version}, Accuracy: ${(res.data.accuracy * 100).toFixed(1)}%`);
+      const result = await waitForJob(res.data.job_id);
+      setRetrainMsg(`Model retrained successfully! Version: ${result.model_version}, Accuracy: ${(result.accuracy * 100).toFixed(1)}%`);
       // Refresh model status
       const modelRes = await API.get("/ml/status");
       setModelStatus(modelRes.data || {});
     } catch (error) {
-      setRetrainMsg("Failed to retrain: " + (error.response?.data?.exc || error.message));
+      setRetrainMsg("Failed to retrain: " + (error.response?.data?.error || error.message));
     } finally {
       setRetrainLoading(false);
     }
@@ -1,12 +1,25 @@
 import React, { useEffect, useState } from "react";
 import { motion, AnimatePresence } from "framer-motion";
 import { PieChart, Pie, Cell, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from "recharts";
-import API from "../../api";
+import API, { waitForJob } from "../../api";
 import { useNavigate } from "react-router-dom";
 
+const STUDENT_FIELDS = "id,full_name,course,attendance,academic_score,debtor,scholarship_holder,risk_label";
+// Rows per request; more are fetched with "Load more"
+const PAGE_SIZE = 50;
+
+const fetchStudentPage = async (cursor) => {
+  const { data } = await API.get("/teachers/students", {
+    params: { fields: STUDENT_FIELDS, limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+  });
+  return data;
+};
+
 export default function TeacherDashboard({ user, setUser }) {
   const [students, setStudents] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [err, setErr] = useState("");
   const [selectedStudent, setSelectedStudent] = useState(null);
   const [notes, setNotes] = useState("");
@@ -26,8 +39,9 @@ export default function TeacherDashboard({ user, setUser }) {
       setErr("");
       setLoading(true);
       try {
-        const res = await API.get("/teachers/students");
-        setStudents(res.data.students || []);
+        const data = await fetchStudentPage(null);
+        setStudents(data.students || []);
+        setNextCursor(data.next_cursor || null);
       } catch (error) {
         setErr(error.response?.data?.error || "Failed to load students");
       } finally {
@@ -38,6 +52,20 @@ export default function TeacherDashboard({ user, setUser }) {
     fetchStudents();
   }, [user, navigate]);
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchStudentPage(nextCursor);
+      setStudents((prev) => [...prev, ...(data.students || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      alert(error.response?.data?.error || "Failed to load more students");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Data processing for charts
   const getRiskDistribution = () => {
     const riskCounts = { High: 0, Medium: 0, Low: 0 };
@@ -96,7 +124,8 @@ export default function TeacherDashboard({ user, setUser }) {
 
   const batchPredict = async () => {
     try {
-      await API.post("/teachers/batch_predict");
+      const res = await API.post("/teachers/batch_predict");
+      await waitForJob(res.data.job_id);
       alert("Batch prediction complete. Refresh to update.");
     } catch (error) {
       alert(error.response?.data?.error || "Batch prediction failed");
@@ -121,11 +150,15 @@ export default function TeacherDashboard({ user, setUser }) {
       const res = await API.post("/upload_csv", formData, {
         headers: { "Content-Type": "multipart/form-data" },
       });
+      setUploadMsg("CSV uploaded, importing...");
+      await waitForJob(res.data.job_id, {
+        onProgress: (job) => job.message && setUploadMsg(job.message),
+      });
       setUploadMsg("CSV uploaded and database updated successfully.");
       setSelectedFile(null);
       setTimeout(() => setUploadMsg(""), 3000);
     } catch (error) {
-      setUploadMsg(error.response?.data?.error || "Upload failed.");
+      setUploadMsg(error.response?.data?.error || error.message || "Upload failed.");
       setTimeout(() => setUploadMsg(""), 3000);
     }
   };
@@ -228,7 +261,10 @@ export default function TeacherDashboard({ user, setUser }) {
         animate={{ opacity: 1 }}
         transition={{ delay: 0.4, duration: 0.6 }}
       >
-        <h3 className="text-lg font-semibold mb-4 text-blue-300">Student Analytics</h3>
+        <h3 className="text-lg font-semibold mb-1 text-blue-300">Student Analytics</h3>
+        <p className="text-xs text-gray-400 mb-4">
+          Based on the {students.length} students loaded{nextCursor ? "; load more below to include the rest" : ""}.
+        </p>
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
           {/* Pie Chart for Risk Distribution */}
           <div className="bg-gray-700 p-4 rounded-lg">
@@ -309,7 +345,7 @@ export default function TeacherDashboard({ user, setUser }) {
                 className="hover:bg-gray-700 transition"
                 initial={{ opacity: 0, y: 15 }}
                 animate={{ opacity: 1, y: 0 }}
-                transition={{ delay: index * 0.05 }}
+                transition={{ delay: (index % PAGE_SIZE) * 0.05 }}
               >
                 <td className="px-3 py-2 border">{s.full_name}</td>
                 <td className="px-3 py-2 border">{s.course || "N/A"}</td>
@@ -334,6 +370,19 @@ export default function TeacherDashboard({ user, setUser }) {
         </motion.table>
       )}
 
+      {nextCursor && (
+        <div className="mt-4 text-center">
+          <motion.button
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="px-4 py-2 bg-gray-700 text-white rounded-lg hover:bg-gray-600 disabled:opacity-50"
+            whileHover={{ scale: 1.05 }}
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </motion.button>
+        </div>
+      )}
+
       <AnimatePresence>
         {selectedStudent && (
           <motion.div
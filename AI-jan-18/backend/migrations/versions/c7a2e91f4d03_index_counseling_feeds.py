@@ -0,0 +1,57 @@
+"""Index counseling_sessions for the teacher feeds
+
+Revision ID: c7a2e91f4d03
+Revises: add_student_id
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'c7a2e91f4d03'
+down_revision = 'add_student_id'
+branch_labels = None
+depends_on = None
+
+# The model's session fields were never migrated; the indexes below need them
+COLUMNS = [
+    sa.Column('session_type', sa.String(50), nullable=True, server_default='academic'),
+    sa.Column('severity', sa.String(20), nullable=True, server_default='medium'),
+    sa.Column('outcomes', sa.Text(), nullable=True),
+    sa.Column('next_steps', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(20), nullable=True, server_default='scheduled'),
+]
+
+INDEXES = [
+    ('ix_counseling_sessions_teacher_created', ['teacher_id', 'created_at']),
+    ('ix_counseling_sessions_teacher_status_created', ['teacher_id', 'status', 'created_at']),
+    ('ix_counseling_sessions_teacher_severity_created', ['teacher_id', 'severity', 'created_at']),
+    ('ix_counseling_sessions_teacher_type_created', ['teacher_id', 'session_type', 'created_at']),
+    ('ix_counseling_sessions_teacher_status_follow_up', ['teacher_id', 'status', 'follow_up_at']),
+]
+
+
+def upgrade():
+    insp = inspect(op.get_bind())
+    if 'counseling_sessions' not in insp.get_table_names():
+        return
+    columns = {c['name'] for c in insp.get_columns('counseling_sessions')}
+    indexes = {i['name'] for i in insp.get_indexes('counseling_sessions')}
+
+    with op.batch_alter_table('counseling_sessions', schema=None) as batch_op:
+        for column in COLUMNS:
+            if column.name not in columns:
+                batch_op.add_column(column)
+    with op.batch_alter_table('counseling_sessions', schema=None) as batch_op:
+        for name, index_columns in INDEXES:
+            if name not in indexes:
+                batch_op.create_index(name, index_columns)
+
+
+def downgrade():
+    # The columns stay; the model uses them
+    with op.batch_alter_table('counseling_sessions', schema=None) as batch_op:
+        for name, _ in reversed(INDEXES):
+            batch_op.drop_index(name)
@@ -138,6 +138,15 @@ class Prediction(db.Model):
 
 class CounselingSession(db.Model):
     __tablename__ = 'counseling_sessions'
+    # Teacher feeds: newest sessions (optionally by status, severity or type)
+    # and scheduled follow-ups by date
+    __table_args__ = (
+        db.Index('ix_counseling_sessions_teacher_created', 'teacher_id', 'created_at'),
+        db.Index('ix_counseling_sessions_teacher_status_created', 'teacher_id', 'status', 'created_at'),
+        db.Index('ix_counseling_sessions_teacher_severity_created', 'teacher_id', 'severity', 'created_at'),
+        db.Index('ix_counseling_sessions_teacher_type_created', 'teacher_id', 'session_type', 'created_at'),
+        db.Index('ix_counseling_sessions_teacher_status_follow_up', 'teacher_id', 'status', 'follow_up_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'))
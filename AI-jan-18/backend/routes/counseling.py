@@ -2,6 +2,10 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, CounselingSession, Student, User
 from datetime import datetime
+from sqlalchemy import select, and_, or_, func
+import base64
+import binascii
+import json
 
 counseling_bp = Blueprint("counseling", __name__)
 
@@ -9,6 +13,89 @@ SESSION_TYPES = ['academic', 'behavioral', 'personal', 'career']
 SEVERITY_LEVELS = ['low', 'medium', 'high', 'critical']
 SESSION_STATUSES = ['scheduled', 'completed', 'cancelled', 'no-show']
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Characters of notes shown in the upcoming feed
+NOTES_PREVIEW_LENGTH = 100
+
+# Feed rows: session columns plus the student's name from one outer join
+FEED_COLUMNS = [
+    CounselingSession.id,
+    CounselingSession.student_id,
+    Student.full_name.label("student_name"),
+    CounselingSession.follow_up_at,
+    CounselingSession.created_at,
+    CounselingSession.session_type,
+    CounselingSession.severity,
+    CounselingSession.status,
+]
+
+class FeedError(ValueError):
+    pass
+
+def _feed_query(*columns):
+    return select(*FEED_COLUMNS, *columns).select_from(CounselingSession).outerjoin(
+        Student, Student.id == CounselingSession.student_id
+    )
+
+def _page_size():
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit < 1:
+        raise FeedError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+def _encode_cursor(value, row_id):
+    raw = json.dumps([value.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(value), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise FeedError("Invalid cursor")
+
+def _fetch_page(stmt, column, descending, limit):
+    """One page of stmt ordered by (column, id), continuing from ?cursor=.
+
+    Keyed on the last row's (column, id), so every page is a range scan of
+    the teacher's index however deep it is. Returns (rows, next_cursor).
+    """
+    cursor = request.args.get("cursor")
+    if cursor:
+        value, row_id = _decode_cursor(cursor)
+        if descending:
+            stmt = stmt.where(and_(column <= value, or_(column < value, CounselingSession.id < row_id)))
+        else:
+            stmt = stmt.where(and_(column >= value, or_(column > value, CounselingSession.id > row_id)))
+
+    if descending:
+        stmt = stmt.order_by(column.desc(), CounselingSession.id.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), CounselingSession.id.asc())
+
+    # One extra row tells us whether another page exists
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, _encode_cursor(getattr(last, column.key), last.id)
+
+def _feed_row(row):
+    return {
+        "id": row.id,
+        "student_id": row.student_id,
+        "student_name": row.student_name or "Unknown",
+        "follow_up_at": row.follow_up_at.isoformat() if row.follow_up_at else None,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "session_type": row.session_type,
+        "severity": row.severity,
+        "status": row.status,
+    }
+
 @counseling_bp.route("/add", methods=["POST"])
 @jwt_required()
 def add_counseling():
@@ -75,42 +162,40 @@ def get_sessions():
     if identity.get("role") not in ["teacher", "admin"]:
         return jsonify({"error": "Unauthorized"}), 403
 
-    teacher_id = identity.get("id")
-    
-    # Get query params for filtering
+    # Filters are equality matches on the leading columns of the
+    # (teacher_id, status|severity|session_type, created_at) indexes
+    stmt = _feed_query(
+        CounselingSession.notes,
+        CounselingSession.outcomes,
+        CounselingSession.next_steps,
+    ).where(
+        CounselingSession.teacher_id == identity.get("id"),
+        CounselingSession.created_at != None
+    )
+
     status_filter = request.args.get("status")
     severity_filter = request.args.get("severity")
     session_type_filter = request.args.get("type")
-    
-    query = CounselingSession.query.filter_by(teacher_id=teacher_id)
-    
+
     if status_filter:
-        query = query.filter_by(status=status_filter)
+        stmt = stmt.where(CounselingSession.status == status_filter)
     if severity_filter:
-        query = query.filter_by(severity=severity_filter)
+        stmt = stmt.where(CounselingSession.severity == severity_filter)
     if session_type_filter:
-        query = query.filter_by(session_type=session_type_filter)
-    
-    sessions = query.order_by(CounselingSession.created_at.desc()).all()
-    
+        stmt = stmt.where(CounselingSession.session_type == session_type_filter)
+
+    try:
+        rows, next_cursor = _fetch_page(stmt, CounselingSession.created_at, True, _page_size())
+    except FeedError as e:
+        return jsonify({"error": str(e)}), 400
+
     result = []
-    for session in sessions:
-        student = Student.query.get(session.student_id)
-        result.append({
-            "id": session.id,
-            "student_id": session.student_id,
-            "student_name": student.full_name if student else "Unknown",
-            "notes": session.notes,
-            "follow_up_at": session.follow_up_at.isoformat() if session.follow_up_at else None,
-            "created_at": session.created_at.isoformat(),
-            "session_type": session.session_type,
-            "severity": session.severity,
-            "outcomes": session.outcomes,
-            "next_steps": session.next_steps,
-            "status": session.status
-        })
-    
-    return jsonify({"sessions": result}), 200
+    for row in rows:
+        session = _feed_row(row)
+        session.update(notes=row.notes, outcomes=row.outcomes, next_steps=row.next_steps)
+        result.append(session)
+
+    return jsonify({"sessions": result, "next_cursor": next_cursor}), 200
 
 @counseling_bp.route("/student/<int:student_id>", methods=["GET"])
 @jwt_required()
@@ -153,29 +238,23 @@ def get_session(session_id):
     if identity.get("role") not in ["teacher", "admin"]:
         return jsonify({"error": "Unauthorized"}), 403
 
-    session = CounselingSession.query.filter_by(
-        id=session_id,
-        teacher_id=identity.get("id")
+    row = db.session.execute(
+        _feed_query(
+            CounselingSession.notes,
+            CounselingSession.outcomes,
+            CounselingSession.next_steps,
+        ).where(
+            CounselingSession.id == session_id,
+            CounselingSession.teacher_id == identity.get("id")
+        )
     ).first()
     
-    if not session:
+    if not row:
         return jsonify({"error": "Session not found or unauthorized"}), 404
 
-    student = Student.query.get(session.student_id)
-    
-    return jsonify({
-        "id": session.id,
-        "student_id": session.student_id,
-        "student_name": student.full_name if student else "Unknown",
-        "notes": session.notes,
-        "follow_up_at": session.follow_up_at.isoformat() if session.follow_up_at else None,
-        "created_at": session.created_at.isoformat(),
-        "session_type": session.session_type,
-        "severity": session.severity,
-        "outcomes": session.outcomes,
-        "next_steps": session.next_steps,
-        "status": session.status
-    }), 200
+    session = _feed_row(row)
+    session.update(notes=row.notes, outcomes=row.outcomes, next_steps=row.next_steps)
+    return jsonify(session), 200
 
 @counseling_bp.route("/<int:session_id>", methods=["PUT"])
 @jwt_required()
@@ -260,26 +339,34 @@ def get_upcoming():
         return jsonify({"error": "Unauthorized"}), 403
 
     now = datetime.utcnow()
-    
-    sessions = CounselingSession.query.filter(
+
+    # Only a preview of notes is sent, so only that much is read
+    preview = func.substr(CounselingSession.notes, 1, NOTES_PREVIEW_LENGTH + 1).label("notes_preview")
+    stmt = _feed_query(preview).where(
         CounselingSession.teacher_id == identity.get("id"),
         CounselingSession.status == "scheduled",
         CounselingSession.follow_up_at != None,
         CounselingSession.follow_up_at > now
-    ).order_by(CounselingSession.follow_up_at.asc()).all()
-    
+    )
+
+    try:
+        rows, next_cursor = _fetch_page(stmt, CounselingSession.follow_up_at, False, _page_size())
+    except FeedError as e:
+        return jsonify({"error": str(e)}), 400
+
     result = []
-    for session in sessions:
-        student = Student.query.get(session.student_id)
+    for row in rows:
+        notes = row.notes_preview
+        if notes and len(notes) > NOTES_PREVIEW_LENGTH:
+            notes = notes[:NOTES_PREVIEW_LENGTH] + "..."
         result.append({
-            "id": session.id,
-            "student_id": session.student_id,
-            "student_name": student.full_name if student else "Unknown",
-            "follow_up_at": session.follow_up_at.isoformat(),
-            "session_type": session.session_type,
-            "severity": session.severity,
-            "notes": session.notes[:100] + "..." if session.notes and len(session.notes) > 100 else session.notes
+            "id": row.id,
+            "student_id": row.student_id,
+            "student_name": row.student_name or "Unknown",
+            "follow_up_at": row.follow_up_at.isoformat(),
+            "session_type": row.session_type,
+            "severity": row.severity,
+            "notes": notes
         })
-    
-    return jsonify({"upcoming": result}), 200
 
+    return jsonify({"upcoming": result, "next_cursor": next_cursor}), 200